@@ -0,0 +1,71 @@
+"""
+Compares the header-only EXIF reader with the PIL path on the same files.
+
+    python -m benchmarks.exif_reader --source ~/Pictures [--repeat 3]
+
+Run it twice, the first run measures the cold cache.
+"""
+import argparse
+import os
+import time
+from typing import Callable, List, Tuple
+
+from PIL import Image, UnidentifiedImageError
+
+from src.constants import DEFAULT_EXTENSION
+from src.exif import DATE_TIME_ORIGINAL, EXIF_IFD, MAKE, MODEL, SUB_SEC_TIME_ORIGINAL
+from src.extractors import registry
+from src.scanner import Scanner
+
+
+def pil_exif(path: str) -> dict:
+    try:
+        with Image.open(path) as image:
+            exif = image.getexif()
+            values = {tag: exif[tag] for tag in (MAKE, MODEL) if tag in exif}
+            sub_ifd = exif.get_ifd(EXIF_IFD)
+            values.update({tag: sub_ifd[tag] for tag in (DATE_TIME_ORIGINAL, SUB_SEC_TIME_ORIGINAL) if tag in sub_ifd})
+            return values
+    except UnidentifiedImageError:
+        return {}
+
+
+def measure(reader: Callable[[str], dict], files: List[str], repeat: int) -> Tuple[float, List[dict]]:
+    best = None
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [reader(path) for path in files]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', required=True, help='directory with the files to read')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each reader, the best one is kept')
+    args = parser.parse_args()
+
+    files = [record.path for record in Scanner().scan(args.source) if record.extension in DEFAULT_EXTENSION]
+    if not files:
+        print('No files found')
+        return
+
+    pil_seconds, pil_results = measure(pil_exif, files, args.repeat)
+    header_seconds, header_results = measure(
+        lambda path: registry.extract(path, (MAKE, MODEL, DATE_TIME_ORIGINAL, SUB_SEC_TIME_ORIGINAL)), files, args.repeat
+    )
+    different = [path for path, a, b in zip(files, pil_results, header_results) if a != b]
+
+    print('Files            : %s' % len(files))
+    print('PIL              : %.0f files/s' % (len(files) / pil_seconds))
+    print('Header reader    : %.0f files/s' % (len(files) / header_seconds))
+    print('Speedup          : %.1fx' % (pil_seconds / header_seconds))
+    print('Different values : %s' % len(different))
+    for path in different[:10]:
+        print('  %s' % os.path.relpath(path, args.source))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares the buffered header reads with the memory mapped ones on the same files.
+
+    python -m benchmarks.mapped_reader --source ~/Pictures [--repeat 5]
+
+Both readers parse the same headers, the difference is the CPU time and the memory allocated
+per file. Run it on a warm cache (twice) to leave the disk out of the measure.
+"""
+import argparse
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from src.constants import DEFAULT_EXTENSION
+from src.extractors import registry
+from src.scanner import Scanner
+
+
+def measure(files: List[str], mapped: bool, repeat: int) -> Tuple[float, float, float, List[dict]]:
+    # Best wall and CPU time of the runs, then the peak memory allocated per file (traced apart, it slows it down)
+    best_wall = best_cpu = None
+    results = []
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        results = [registry.extract(path, mapped=mapped) for path in files]
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    allocated = 0
+    tracemalloc.start()
+    for path in files:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        registry.extract(path, mapped=mapped)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return best_wall, best_cpu, allocated / len(files), results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', required=True, help='directory with the files to read')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each reader, the best one is kept')
+    args = parser.parse_args()
+
+    files = [record.path for record in Scanner().scan(args.source) if record.extension in DEFAULT_EXTENSION]
+    if not files:
+        print('No files found')
+        return
+
+    print('Files            : %s' % len(files))
+    values = []
+    for name, mapped in (('Buffered', False), ('Mapped', True)):
+        wall, cpu, allocated, results = measure(files, mapped, args.repeat)
+        values.append(results)
+        print('%-16s : %.0f files/s, %.1f us CPU/file, %.0f bytes allocated/file'
+              % (name, len(files) / wall, cpu * 10 ** 6 / len(files), allocated))
+    different = sum(1 for a, b in zip(*values) if a != b)
+    print('Different values : %s' % different)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,28 @@
 import argparse
+import json
 import logging
 import platform
 import os
+import re
 import sys
 import textwrap
-from typing import Tuple, Union, Any
+from typing import Tuple, Union, Any, Dict, List
 
+from src.constants import DEFAULT_SCAN_WORKERS, DEFAULT_EXCLUDES, DEFAULT_EXTENSION
+from src.deadline import DEFAULT_FILE_TIMEOUT
+from src.dedup import POLICIES
+from src.filenames import compile_pattern
+from src.index import MetadataIndex
+from src.watcher import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_TIME
 from src.organizer import FileOrganizer, FileOrganizerWin32
+from src.placement import COPY, MODES, parse_modes
+from src.process import ProcessingOptions
+from src.scanner import Scanner
+from src.survey import survey, DEFAULT_FILES_PER_SECOND, DEFAULT_THROUGHPUT
 from src.utils import do_you_want_to_continue
 
 
-def get_arguments() -> Tuple[bool, str, str, Tuple[Union[str, Any], ...], bool]:
+def get_arguments() -> Tuple[bool, Union[str, List[str]], str, Tuple[Union[str, Any], ...], bool, Dict[str, Any]]:
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                      description=textwrap.dedent('''\
     [ Multimedia Organizer Tool ]
@@ -31,12 +43,74 @@ def get_arguments() -> Tuple[bool, str, str, Tuple[Union[str, Any], ...], bool]:
 
 
     '''))
-    parser.add_argument('--source', metavar='source', type=str,
-                        help='the path where the images are located', required=True)
+    parser.add_argument('--source', metavar='source', type=str, nargs='+',
+                        help='the paths where the images are located. Several sources are processed at the same '
+                             'time, with one group of workers per device')
     parser.add_argument('--destination', metavar='destination', type=str,
                         help='the destination path where the images will be ordered',  required=True)
     parser.add_argument('--extensions', metavar='extensions', type=str,
                         help='the filter extensions coma separated. Default extensions: gif, png, jpg, jpeg, mov, mp4')
+    add_scanner_arguments(parser)
+    parser.add_argument('--files-from', metavar='file', type=str,
+                        help='process the newline or NUL delimited list of paths in this file ("-" for stdin) '
+                             'instead of scanning the source. No confirmation is asked')
+    parser.add_argument('--estimate', action='store_true',
+                        help='ask for confirmation after a sampled estimate of the source instead of a full scan, '
+                             'then process the files while they are found')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and organize every new file as soon as it is completely written')
+    parser.add_argument('--poll', action='store_true', dest='force_poll',
+                        help='watch by polling directory mtimes instead of inotify (network mounts are always polled)')
+    parser.add_argument('--poll-interval', metavar='seconds', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='seconds between two polls of the source when watching. Default: %(default)s')
+    parser.add_argument('--settle-time', metavar='seconds', type=float, default=DEFAULT_SETTLE_TIME,
+                        help='seconds the size of a new file must stay unchanged before organizing it. '
+                             'Default: %(default)s')
+    parser.add_argument('--index', metavar='index', type=str,
+                        help='SQLite file caching the metadata of the source files between runs')
+    parser.add_argument('--read-workers', metavar='count', type=int, default=0,
+                        help='processes extracting the metadata, a crashing or hanging file only costs a worker. '
+                             'Default: %(default)s (read in the main process)')
+    parser.add_argument('--mmap', action='store_true', dest='mapped_reads',
+                        help='map the files in memory to read their metadata, cheaper on local SSDs. Not for network '
+                             'mounts or files being written: a file truncated while mapped crashes the reader')
+    parser.add_argument('--mode', metavar='modes', type=str, default=COPY,
+                        help='how the files are placed, or a comma separated preference chain tried in order '
+                             '(hardlink,symlink,copy): %s. move renames on the same device and deletes the file after '
+                             'a checked copy otherwise, hardlink needs the same device, reflink a btrfs or XFS '
+                             'destination. Default: %%(default)s' % ', '.join(MODES))
+    parser.add_argument('--relative-symlinks', action='store_true',
+                        help='the symlinks point at the files with a path relative to their directory')
+    parser.add_argument('--compare-content', action='store_true',
+                        help='a file already at its destination (from an earlier run) is always recognized by its '
+                             'size and content. By default, its size and modification time are enough, the content is '
+                             'only compared when the times differ. Files of another content there are never '
+                             'overwritten, the new file gets a suffixed name')
+    parser.add_argument('--duplicates', choices=POLICIES,
+                        help='organize the files of the same content once: skip the duplicates, or link them (hard '
+                             'link, symlink across devices) to the organized file. Files are compared by size, then '
+                             'by a hash of their first and last 64 KB, then by a hash of their whole content')
+    parser.add_argument('--file-timeout', metavar='seconds', type=float, default=DEFAULT_FILE_TIMEOUT,
+                        help='seconds a metadata read or a copy can take (plus one second per MB copied) before the '
+                             'file is abandoned and listed in the retry list. 0 to wait forever. Default: %(default)s')
+    parser.add_argument('--retry-list', metavar='file', type=str,
+                        help='where the abandoned files are listed, for --files-from. '
+                             'Default: retry.txt in the destination')
+    parser.add_argument('--validate', action='store_true',
+                        help='check the structure of the files (JPEG markers and segments, MP4/MOV/HEIC boxes) before '
+                             'organizing them. Corrupted files are copied to the quarantine with a report')
+    parser.add_argument('--deep-verify', action='store_true',
+                        help='also decode every image in a pool of processes (implies --validate, slow)')
+    parser.add_argument('--quarantine', metavar='quarantine', type=str,
+                        help='where the corrupted files go. Default: the quarantine directory of the destination')
+    parser.add_argument('--without-model', action='store_false', dest='with_model',
+                        help='do not sort the files of a day by camera model. Files whose name holds their capture '
+                             'time (IMG_20230114_153012.jpg) are then organized without being opened')
+    parser.add_argument('--filename-pattern', metavar='regex', type=str, action='append', dest='filename_patterns',
+                        default=[],
+                        help='regular expression with year, month, day and optionally hour, minute and second named '
+                             'groups reading the capture time from the file name, can be repeated. Tried before the '
+                             'default ones')
     parser.add_argument('--debug', help='enables debug log',
                         action="store_const", dest="loglevel", const=logging.DEBUG, default=logging.INFO)
 
@@ -47,13 +121,19 @@ def get_arguments() -> Tuple[bool, str, str, Tuple[Union[str, Any], ...], bool]:
     is_mtp: bool = False
     app_source = args.source
     if app_source:
-        if not os.path.isdir(app_source):
-            logging.warning('[-] The source path specified does not exist')
-            sys.exit()
-    else:
+        for path in app_source:
+            if not os.path.isdir(path):
+                logging.warning('[-] The source path specified does not exist: %s', path)
+                sys.exit()
+    elif not args.files_from:
         if any(platform.win32_ver()):
             import src.mtp_windows
 
+            if args.estimate or args.watch:
+                logging.warning('[-] --estimate and --watch need a "source" path, MTP devices are only organized in '
+                                'full')
+                sys.exit()
+
             logging.info(' |- Running under windows ')
             logging.info(" |- Select MTP device...")
             devices = []
@@ -83,21 +163,83 @@ def get_arguments() -> Tuple[bool, str, str, Tuple[Union[str, Any], ...], bool]:
     if app_destination:
         if os.path.isdir(app_destination):
             logging.warning("[-] The destination path specified already exist")
-            do_you_want_to_continue()
+            if not args.files_from and not args.watch:
+                do_you_want_to_continue()
     else:
         logging.warning('[-] The "destination" parameter is mandatory')
         sys.exit()
 
     if args.extensions:
-        ext = args.extensions.replace(" ", "")
-        ext_list = ext.split(",")
-        extensions = tuple(["." + t for t in ext_list])
+        extensions = parse_extensions(args.extensions)
+
+    try:
+        modes = parse_modes(args.mode)
+    except ValueError as err:
+        logging.warning('[-] %s', err)
+        sys.exit()
+
+    for pattern in args.filename_patterns:
+        try:
+            compile_pattern(pattern)
+        except (re.error, ValueError) as err:
+            logging.warning('[-] Invalid filename pattern: %s', err)
+            sys.exit()
 
     app_debug = False
     if args.loglevel:
         app_debug = True
 
-    return is_mtp, app_source, app_destination, extensions, app_debug
+    options = {
+        "scan_workers": args.scan_workers,
+        "index": args.index,
+        "excludes": args.excludes,
+        "includes": args.includes,
+        "max_depth": args.max_depth,
+        "skip_hidden": args.skip_hidden,
+        "files_from": args.files_from,
+        "watch": args.watch,
+        "poll_interval": args.poll_interval,
+        "force_poll": args.force_poll,
+        "settle_time": args.settle_time,
+        "estimate": args.estimate,
+        "validate": args.validate,
+        "deep_verify": args.deep_verify,
+        "quarantine": args.quarantine,
+        "processing": ProcessingOptions(
+            read_workers=args.read_workers,
+            with_model=args.with_model,
+            filename_patterns=args.filename_patterns,
+            mapped_reads=args.mapped_reads,
+            file_timeout=args.file_timeout or None,
+            retry_list=args.retry_list,
+            modes=modes,
+            relative_symlinks=args.relative_symlinks,
+            duplicates=args.duplicates,
+            compare_content=args.compare_content,
+        ),
+    }
+
+    return is_mtp, app_source, app_destination, extensions, app_debug, options
+
+
+def add_scanner_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--scan-workers', metavar='workers', type=int, default=DEFAULT_SCAN_WORKERS,
+                        help='number of threads listing directories in parallel. Default: %(default)s')
+    parser.add_argument('--exclude', metavar='pattern', type=str, action='append', dest='excludes',
+                        help='gitignore style pattern of files or directories to skip, can be repeated. '
+                             'Default: @eaDir/, .thumbnails/, .Trash-*/, $RECYCLE.BIN/, System Volume Information/')
+    parser.add_argument('--include', metavar='pattern', type=str, action='append', dest='includes', default=[],
+                        help='gitignore style pattern re-including what an exclude pattern skipped, can be repeated')
+    parser.add_argument('--max-depth', metavar='depth', type=int,
+                        help='maximum number of directory levels to descend below the source')
+    parser.add_argument('--skip-hidden', action='store_true',
+                        help='do not descend into hidden directories')
+
+
+def parse_extensions(value: str) -> Tuple[str, ...]:
+    ext = value.replace(" ", "")
+    ext_list = ext.split(",")
+    return tuple(["." + t for t in ext_list])
 
 
 def init_logger(level):
@@ -109,21 +251,87 @@ def init_logger(level):
     logging.getLogger("PIL").setLevel(logging.WARNING)
 
 
-def get_file_organizer(is_w32: bool, src: str, dest: str, ext: Tuple[Union[str, Any], ...]) -> FileOrganizer:
+def compact_index(arguments) -> None:
+    parser = argparse.ArgumentParser(prog='reorganize.py compact-index',
+                                     description='Removes the entries of deleted or modified files from an index')
+    parser.add_argument('index', metavar='index', type=str, help='the SQLite index file')
+    args = parser.parse_args(arguments)
+    init_logger(logging.INFO)
+
+    if not os.path.isfile(args.index):
+        logging.warning('[-] The index specified does not exist')
+        sys.exit()
+    index = MetadataIndex(args.index)
+    removed = index.compact()
+    logging.info("[+] Removed %s stale entries, %s entries left", removed, len(index))
+    index.close()
+
+
+def survey_source(arguments) -> None:
+    parser = argparse.ArgumentParser(prog='reorganize.py survey',
+                                     description='Profiles a source tree from stat data only and prints it as JSON')
+    parser.add_argument('--source', metavar='source', type=str, required=True,
+                        help='the path to profile')
+    parser.add_argument('--extensions', metavar='extensions', type=str,
+                        help='the filter extensions coma separated. Default extensions: gif, png, jpg, jpeg, mov, mp4')
+    add_scanner_arguments(parser)
+    parser.add_argument('--top', metavar='count', type=int, default=10,
+                        help='number of largest directories to list. Default: %(default)s')
+    parser.add_argument('--files-per-second', metavar='rate', type=float, default=DEFAULT_FILES_PER_SECOND,
+                        help='metadata reading rate used for the runtime estimate. Default: %(default)s')
+    parser.add_argument('--throughput', metavar='MB/s', type=float, default=DEFAULT_THROUGHPUT / 1024 ** 2,
+                        help='copy throughput used for the runtime estimate. Default: %(default)s')
+    parser.add_argument('--output', metavar='file', type=str,
+                        help='write the JSON to this file instead of the standard output')
+    args = parser.parse_args(arguments)
+    init_logger(logging.INFO)
+
+    if not os.path.isdir(args.source):
+        logging.warning('[-] The source path specified does not exist')
+        sys.exit()
+    scanner = Scanner(
+        workers=args.scan_workers,
+        excludes=args.excludes if args.excludes else DEFAULT_EXCLUDES,
+        includes=args.includes,
+        max_depth=args.max_depth,
+        skip_hidden=args.skip_hidden,
+    )
+    extensions = parse_extensions(args.extensions) if args.extensions else DEFAULT_EXTENSION
+    result = survey(scanner, args.source, extensions, args.top, args.files_per_second, args.throughput * 1024 ** 2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+COMMANDS = {
+    "compact-index": compact_index,
+    "survey": survey_source,
+}
+
+
+def get_file_organizer(is_w32: bool, src: Union[str, List[str]], dest: str, ext: Tuple[Union[str, Any], ...],
+                       **options) -> FileOrganizer:
     if is_w32:
-        return FileOrganizerWin32(src, dest, ext)
+        return FileOrganizerWin32(src, dest, ext, **options)
     else:
-        return FileOrganizer(src, dest, ext)
+        return FileOrganizer(src, dest, ext, **options)
 
 
 if __name__ == '__main__':
-    is_mtp, source, destination, extensions, debug = get_arguments()
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        sys.exit()
+
+    is_mtp, source, destination, extensions, debug, options = get_arguments()
 
     try:
         init_logger(debug)
         logging.debug("[+] Parameters: source= %s, destination= %s, extensions= %s, debug= %s", source, destination,
                       extensions, debug)
-        image_organizer = get_file_organizer(is_mtp, source, destination, extensions)
+        image_organizer = get_file_organizer(is_mtp, source, destination, extensions, **options)
         logging.debug("[+] Starting")
         image_organizer.start()
     except Exception as err:
@@ -1 +1,3 @@
 DEFAULT_EXTENSION = ('.gif', '.png', '.jpg', '.jpeg', '.mov', '.mp4', '.opus')
+DEFAULT_SCAN_WORKERS = 8
+DEFAULT_EXCLUDES = ('@eaDir/', '.thumbnails/', '.Trash-*/', '$RECYCLE.BIN/', 'System Volume Information/')
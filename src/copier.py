@@ -0,0 +1,258 @@
+import collections
+import errno
+import os
+import sys
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+# Strategies, fastest first. A reflink shares the blocks of the source (btrfs, XFS), copy_file_range
+# and sendfile copy in the kernel, readinto copies through a buffer
+REFLINK = "reflink"
+COPY_FILE_RANGE = "copy_file_range"
+SENDFILE = "sendfile"
+READINTO = "readinto"
+STRATEGIES = (REFLINK, COPY_FILE_RANGE, SENDFILE, READINTO)
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+BUFFER_SIZE = 1024 ** 2
+CHUNK_SIZE = 64 * 1024 ** 2
+# What the kernel answers when a strategy is not supported between two filesystems
+UNSUPPORTED = frozenset(
+    getattr(errno, name) for name in ("EXDEV", "EOPNOTSUPP", "ENOTSUP", "ENOSYS", "EINVAL", "ENOTTY", "EBADF")
+    if hasattr(errno, name)
+)
+# Copies are written as .<name>.<random>.part next to their target, and only get its name once complete
+PARTIAL_SUFFIX = ".part"
+
+
+class Unsupported(Exception):
+    pass
+
+
+def available_strategies() -> List[str]:
+    if not sys.platform.startswith("linux"):
+        # sendfile only writes to sockets on macOS, there is no copy_file_range nor FICLONE
+        return [READINTO]
+    strategies = [REFLINK]
+    if hasattr(os, "copy_file_range"):
+        strategies.append(COPY_FILE_RANGE)
+    if hasattr(os, "sendfile"):
+        strategies.append(SENDFILE)
+    return strategies + [READINTO]
+
+
+def data_segments(fd: int, size: int, sparse: bool) -> Iterator[Tuple[int, int]]:
+    # (start, end) of the regions of the file holding data, the holes of a sparse file are skipped
+    if not sparse or not hasattr(os, "SEEK_DATA"):
+        yield 0, size
+        return
+    position = 0
+    while position < size:
+        try:
+            start = os.lseek(fd, position, os.SEEK_DATA)
+        except OSError as err:
+            if err.errno == errno.ENXIO:
+                # Only a hole up to the end
+                return
+            if err.errno in UNSUPPORTED:
+                yield position, size
+                return
+            raise
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        yield start, min(end, size)
+        position = end
+
+
+class CopyEngine:
+    """
+    Copies file contents with the fastest strategy the two filesystems support.
+
+    The strategy of a pair of source and destination devices is probed on their first file:
+    each strategy the kernel refuses is dropped for the pair, and the file copied again with
+    the next one. Files are preallocated, except the sparse ones, whose holes are kept. Copies
+    keep the modification time of their source, a rerun recognizes them with a stat.
+
+    A copy is written under a temporary name in the directory of its target, and linked to the
+    target once complete: an interrupted or failed copy leaves nothing at the target, and an
+    existing target is never replaced (FileExistsError).
+    """
+
+    def __init__(self, strategies: Tuple[str, ...] = ()):
+        self.strategies = list(strategies) or available_strategies()
+        self.files: Dict[str, int] = collections.Counter()
+        self.bytes: Dict[str, int] = collections.Counter()
+        self._pairs: Dict[Tuple[int, int], List[str]] = {}
+        self._lock = threading.Lock()
+
+    def copy(self, source: str, target: str, sync: bool = False) -> str:
+        # Strategy used for the copy. With sync, the copy is on the disk when it returns
+        dst, partial = self._create_partial(target)
+        try:
+            with dst, open(source, "rb") as src:
+                stat = os.fstat(src.fileno())
+                pair = (stat.st_dev, os.fstat(dst.fileno()).st_dev)
+                with self._lock:
+                    strategies = self._pairs.setdefault(pair, list(self.strategies))
+                for strategy in list(strategies):
+                    try:
+                        self._copy(strategy, src, dst, stat)
+                    except Unsupported:
+                        with self._lock:
+                            if strategy in strategies and len(strategies) > 1:
+                                strategies.remove(strategy)
+                        dst.seek(0)
+                        dst.truncate()
+                        continue
+                    break
+                else:
+                    raise OSError("No copy strategy for %s" % source)
+                dst.flush()
+                self._keep_times(dst, partial, stat)
+                if sync:
+                    os.fsync(dst.fileno())
+            self._publish(partial, target)
+        except BaseException:
+            self._discard(partial)
+            raise
+        with self._lock:
+            self.files[strategy] += 1
+            self.bytes[strategy] += stat.st_size
+        return strategy
+
+    def clone(self, source: str, target: str) -> None:
+        # Reflink only, raises Unsupported (and leaves no target) when the filesystems can not share blocks
+        if REFLINK not in available_strategies():
+            raise Unsupported(REFLINK)
+        dst, partial = self._create_partial(target)
+        try:
+            with dst, open(source, "rb") as src:
+                self._reflink(src, dst)
+                stat = os.fstat(src.fileno())
+                self._keep_times(dst, partial, stat)
+            self._publish(partial, target)
+        except BaseException:
+            self._discard(partial)
+            raise
+        with self._lock:
+            self.files[REFLINK] += 1
+            self.bytes[REFLINK] += stat.st_size
+
+    @staticmethod
+    def _create_partial(target: str):
+        directory, name = os.path.split(target)
+        while True:
+            partial = os.path.join(directory, ".%s.%s%s" % (name, os.urandom(4).hex(), PARTIAL_SUFFIX))
+            try:
+                return open(partial, "xb"), partial
+            except FileExistsError:
+                continue
+
+    @staticmethod
+    def _publish(partial: str, target: str) -> None:
+        # A link never replaces the target, a rename would
+        try:
+            os.link(partial, target)
+        except FileExistsError:
+            raise
+        except OSError as err:
+            # FAT and exFAT have no hard links
+            if err.errno not in UNSUPPORTED | {errno.EPERM}:
+                raise
+            if os.path.lexists(target):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+            os.rename(partial, target)
+            return
+        os.unlink(partial)
+
+    @staticmethod
+    def _discard(partial: str) -> None:
+        try:
+            os.unlink(partial)
+        except OSError:
+            pass
+
+    def _copy(self, strategy: str, src, dst, stat: os.stat_result) -> None:
+        size = stat.st_size
+        if strategy == REFLINK:
+            self._reflink(src, dst)
+            return
+        # Fewer blocks than the size needs: there are holes to keep
+        sparse = hasattr(stat, "st_blocks") and stat.st_blocks * 512 < size
+        if not sparse and size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(dst.fileno(), 0, size)
+            except OSError as err:
+                if err.errno not in UNSUPPORTED:
+                    raise
+        copy = {COPY_FILE_RANGE: self._copy_file_range, SENDFILE: self._sendfile, READINTO: self._readinto}[strategy]
+        for start, end in data_segments(src.fileno(), size, sparse):
+            copy(src, dst, start, end)
+        # Keeps a hole at the end, and the size of a preallocated file the source shrank meanwhile
+        dst.truncate(size)
+
+    @staticmethod
+    def _keep_times(dst, path: str, stat: os.stat_result) -> None:
+        # Windows only sets the times of a file by its path
+        os.utime(dst.fileno() if os.utime in os.supports_fd else path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    @staticmethod
+    def _reflink(src, dst) -> None:
+        import fcntl
+
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError as err:
+            if err.errno in UNSUPPORTED:
+                raise Unsupported(REFLINK)
+            raise
+
+    @staticmethod
+    def _copy_file_range(src, dst, start: int, end: int) -> None:
+        position = start
+        while position < end:
+            try:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), min(CHUNK_SIZE, end - position),
+                                            position, position)
+            except OSError as err:
+                if err.errno in UNSUPPORTED:
+                    raise Unsupported(COPY_FILE_RANGE)
+                raise
+            if copied == 0:
+                if os.fstat(src.fileno()).st_size <= position:
+                    # The source shrank while copying
+                    return
+                # Some filesystems (procfs, old FUSE) answer 0 instead of an error
+                raise Unsupported(COPY_FILE_RANGE)
+            position += copied
+
+    @staticmethod
+    def _sendfile(src, dst, start: int, end: int) -> None:
+        position = start
+        os.lseek(dst.fileno(), start, os.SEEK_SET)
+        while position < end:
+            try:
+                sent = os.sendfile(dst.fileno(), src.fileno(), position, min(CHUNK_SIZE, end - position))
+            except OSError as err:
+                if err.errno in UNSUPPORTED:
+                    raise Unsupported(SENDFILE)
+                raise
+            if sent == 0:
+                if os.fstat(src.fileno()).st_size <= position:
+                    return
+                raise Unsupported(SENDFILE)
+            position += sent
+
+    @staticmethod
+    def _readinto(src, dst, start: int, end: int) -> None:
+        buffer = bytearray(min(BUFFER_SIZE, max(end - start, 1)))
+        view = memoryview(buffer)
+        src.seek(start)
+        dst.seek(start)
+        position = start
+        while position < end:
+            read = src.readinto(view[:min(len(buffer), end - position)])
+            if not read:
+                # The source shrank while copying
+                return
+            dst.write(view[:read])
+            position += read
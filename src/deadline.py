@@ -0,0 +1,129 @@
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError, wait
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+# Time allowed to a file operation, plus the time its size takes at the minimum throughput
+DEFAULT_FILE_TIMEOUT = 60.0
+MIN_THROUGHPUT = 1024 ** 2
+_DONE = object()
+
+
+class _Task:
+    __slots__ = ("item", "future", "timeout", "started", "abandoned")
+
+    def __init__(self, item: Any, timeout: float):
+        self.item = item
+        self.future = Future()
+        self.timeout = timeout
+        self.started: Optional[float] = None
+        self.abandoned = False
+
+
+class DeadlinePool:
+    """
+    Runs a function over items in daemon threads, each call with its own deadline.
+
+    A call past its deadline is abandoned: its thread is left behind (a thread blocked in a
+    read of a stalled network share can not be stopped) and replaced by a new one, so a bad
+    file costs a thread instead of the run. Being daemons, the abandoned threads do not keep
+    the process alive at exit.
+    """
+
+    def __init__(self, function: Callable[[Any], Any], workers: int, name: str = "worker"):
+        self.function = function
+        self.workers = max(1, workers)
+        self.name = name
+        self.abandoned = 0
+        self._tasks: Deque[_Task] = collections.deque()
+        self._condition = threading.Condition()
+        self._counter = itertools.count()
+        self._closed = False
+        for _ in range(self.workers):
+            self._start_worker()
+
+    def _start_worker(self) -> None:
+        thread = threading.Thread(target=self._work, name="%s_%s" % (self.name, next(self._counter)), daemon=True)
+        thread.start()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._tasks and not self._closed:
+                    self._condition.wait()
+                if not self._tasks:
+                    return
+                task = self._tasks.popleft()
+                task.started = time.monotonic()
+            try:
+                result, error = self.function(task.item), None
+            except BaseException as err:
+                result, error = None, err
+            with self._condition:
+                if task.abandoned:
+                    # Replaced while stuck, the new thread does the work now
+                    return
+                if error is None:
+                    task.future.set_result(result)
+                else:
+                    task.future.set_exception(error)
+
+    def run(self, items: Iterable[Any],
+            timeout: Callable[[Any], Optional[float]]) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+        # (item, result, error) of every item as they complete, the error is a TimeoutError for abandoned calls.
+        # Only a few items per thread are queued, items can be a stream
+        running: List[_Task] = []
+        items = iter(items)
+        exhausted = False
+        while running or not exhausted:
+            while not exhausted and len(running) < 2 * self.workers:
+                item = next(items, _DONE)
+                if item is _DONE:
+                    exhausted = True
+                    break
+                task = _Task(item, timeout(item))
+                with self._condition:
+                    self._tasks.append(task)
+                    self._condition.notify()
+                running.append(task)
+            if not running:
+                break
+            wait([task.future for task in running], self._next_deadline(running), FIRST_COMPLETED)
+            for task in self._expired(running):
+                yield task.item, None, TimeoutError("No answer after %.0f seconds" % task.timeout)
+            for task in [task for task in running if task.future.done()]:
+                running.remove(task)
+                error = task.future.exception()
+                yield task.item, None if error else task.future.result(), error
+
+    def _next_deadline(self, running: List[_Task]) -> Optional[float]:
+        # Seconds before the first running call can expire, None when no call has a deadline. A call
+        # not started yet expires at the soonest its timeout from now
+        now = time.monotonic()
+        with self._condition:
+            deadlines = [(now if task.started is None else task.started) + task.timeout for task in running
+                         if task.timeout is not None]
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def _expired(self, running: List[_Task]) -> List[_Task]:
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            for task in list(running):
+                if (task.started is not None and task.timeout is not None and not task.future.done()
+                        and now >= task.started + task.timeout):
+                    task.abandoned = True
+                    running.remove(task)
+                    expired.append(task)
+            self.abandoned += len(expired)
+        for _ in expired:
+            self._start_worker()
+        return expired
+
+    def close(self) -> None:
+        # The threads still running a call finish it (or stay stuck) on their own
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
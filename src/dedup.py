@@ -0,0 +1,155 @@
+import collections
+import hashlib
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.deadline import MIN_THROUGHPUT, DeadlinePool
+from src.record import FileRecord
+
+# What becomes of the duplicates of a file: not organized at all, or hard linked (symlinked across devices)
+# to the organized file at their own destination
+SKIP = "skip"
+LINK = "link"
+POLICIES = (SKIP, LINK)
+# Bytes hashed at the start and at the end of a file before reading it all
+PARTIAL_SIZE = 64 * 1024
+BUFFER_SIZE = 1024 ** 2
+HASH_WORKERS = 4
+
+
+def partial_hash(path: str, size: int) -> bytes:
+    # The first and last PARTIAL_SIZE bytes, the whole file when it is not larger than both
+    with open(path, "rb") as file:
+        digest = hashlib.blake2b(file.read(PARTIAL_SIZE))
+        if size > PARTIAL_SIZE:
+            file.seek(max(PARTIAL_SIZE, size - PARTIAL_SIZE))
+            digest.update(file.read(PARTIAL_SIZE))
+    return digest.digest()
+
+
+def full_hash(path: str) -> bytes:
+    digest = hashlib.blake2b()
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb") as file:
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                return digest.digest()
+            digest.update(view[:read])
+
+
+class Deduplicator:
+    """
+    Finds the files with the same content, reading as little of them as possible.
+
+    Files are grouped by size first, only the sizes shared by several files are read. Those
+    are grouped by a hash of their first and last 64 KB, and only the files still sharing it
+    are hashed in full: a file is read entirely only when it has a likely duplicate. Hard links
+    of the same inode are duplicates without any read.
+
+    The first path of a group (in sorted order, the same from one run to the next) is the
+    original, the other files its duplicates.
+    """
+
+    def __init__(self, policy: str = SKIP, workers: int = HASH_WORKERS, file_timeout: Optional[float] = None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown duplicates policy %s, the policies are %s" % (policy, ", ".join(POLICIES)))
+        self.policy = policy
+        self.workers = workers
+        self.file_timeout = file_timeout
+        self.duplicates = 0
+        self.saved = 0
+        self.hashed: Dict[str, int] = collections.Counter()
+        self.read = 0
+
+    def find(self, images: Iterable[FileRecord],
+             progress: Optional[Callable[[], None]] = None) -> Dict[FileRecord, FileRecord]:
+        # Duplicate -> original
+        by_size: Dict[int, List[FileRecord]] = collections.defaultdict(list)
+        for image in images:
+            if image.mtime_ns is None:
+                try:
+                    image.load_stat()
+                except OSError:
+                    continue
+            # Empty files are left alone, there is nothing to save
+            if image.size:
+                by_size[image.size].append(image)
+
+        duplicates: Dict[FileRecord, FileRecord] = {}
+        candidates = []
+        for group in by_size.values():
+            if len(group) > 1:
+                group = self._same_inodes(group, duplicates)
+            if len(group) > 1:
+                candidates.extend(group)
+
+        partial = self._group(candidates, "partial", lambda image: partial_hash(image.path, image.size), progress)
+        complete = []
+        for (size, _), group in partial.items():
+            if len(group) < 2:
+                continue
+            if size <= 2 * PARTIAL_SIZE:
+                # The partial hash covered the whole files
+                self._mark(group, duplicates)
+            else:
+                complete.extend(group)
+
+        full = self._group(complete, "full", lambda image: full_hash(image.path), progress)
+        for group in full.values():
+            if len(group) > 1:
+                self._mark(group, duplicates)
+        # The hard links of a file that turned out to be a duplicate itself
+        for image, original in duplicates.items():
+            while original in duplicates:
+                original = duplicates[original]
+            duplicates[image] = original
+        return duplicates
+
+    def _same_inodes(self, group: List[FileRecord], duplicates: Dict[FileRecord, FileRecord]) -> List[FileRecord]:
+        # The hard links of a file, one of them left to hash
+        inodes: Dict[Tuple[int, int], List[FileRecord]] = collections.defaultdict(list)
+        unknown = []
+        for image in group:
+            if image.device and image.inode:
+                inodes[(image.device, image.inode)].append(image)
+            else:
+                unknown.append(image)
+        for links in inodes.values():
+            if len(links) > 1:
+                self._mark(links, duplicates)
+        return unknown + [min(links, key=lambda image: image.path) for links in inodes.values()]
+
+    def _group(self, images: List[FileRecord], kind: str, digest: Callable[[FileRecord], bytes],
+               progress: Optional[Callable[[], None]]) -> Dict[Tuple[int, bytes], List[FileRecord]]:
+        groups: Dict[Tuple[int, bytes], List[FileRecord]] = collections.defaultdict(list)
+        if not images:
+            return groups
+        hashers = DeadlinePool(digest, self.workers, "hasher")
+        try:
+            for image, value, error in hashers.run(images, self._timeout):
+                if error is not None:
+                    # Left unique, the copy reports the file when it can not read it either
+                    logging.debug("[-] Unable to hash %s: %s", image.path, error)
+                else:
+                    self.hashed[kind] += 1
+                    self.read += min(image.size, 2 * PARTIAL_SIZE) if kind == "partial" else image.size
+                    groups[(image.size, value)].append(image)
+                if progress is not None:
+                    progress()
+        finally:
+            hashers.close()
+        return groups
+
+    def _timeout(self, image: FileRecord) -> Optional[float]:
+        if self.file_timeout is None:
+            return None
+        return self.file_timeout + image.size / MIN_THROUGHPUT
+
+    def _mark(self, group: List[FileRecord], duplicates: Dict[FileRecord, FileRecord]) -> None:
+        group = sorted(group, key=lambda image: image.path)
+        for image in group[1:]:
+            duplicates[image] = group[0]
+            self.duplicates += 1
+            self.saved += image.size
@@ -0,0 +1,106 @@
+import math
+import random
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.scanner import Scanner
+from src.survey import DEFAULT_FILES_PER_SECOND, DEFAULT_THROUGHPUT
+
+DEFAULT_PROBES = 200
+DEFAULT_TIME_BUDGET = 5.0
+Z_95 = 1.96
+
+
+class Bounds(NamedTuple):
+    value: float
+    low: float
+    high: float
+
+
+class Estimate(NamedTuple):
+    files: Bounds
+    size: Bounds
+    matched_files: Bounds
+    matched_size: Bounds
+    probes: int
+    directories_sampled: int
+    seconds: Bounds
+
+    @property
+    def matching_ratio(self) -> float:
+        return self.matched_files.value / self.files.value if self.files.value else 0.0
+
+
+class PreflightEstimator:
+    """
+    Estimates the size of a tree without walking it (Knuth's random probe estimator).
+
+    Every probe follows one random path from the root to a leaf directory, weighting what it
+    sees at each level by the product of the branching factors above it. Probes are unbiased,
+    so their mean and standard error give the estimate and its confidence bounds.
+    """
+
+    def __init__(self, scanner: Scanner, extensions: Tuple[str, ...], probes: int = DEFAULT_PROBES,
+                 time_budget: float = DEFAULT_TIME_BUDGET, seed: Optional[int] = None):
+        self.scanner = scanner
+        self.extensions = extensions
+        self.probes = probes
+        self.time_budget = time_budget
+        self.random = random.Random(seed)
+        self.listings: Dict[str, Tuple[Tuple[int, int, int, int], List[Tuple[str, str, int]]]] = {}
+
+    def _list(self, path: str, relative_path: str, depth: int):
+        listing = self.listings.get(path)
+        if listing is None:
+            files, directories, _ = self.scanner.list_directory(path, relative_path, depth)
+            size = matched = matched_size = 0
+            for record in files:
+                size += record.size
+                if record.extension in self.extensions:
+                    matched += 1
+                    matched_size += record.size
+            listing = self.listings[path] = ((len(files), size, matched, matched_size), directories)
+        return listing
+
+    def _probe(self, root: str) -> List[float]:
+        totals = [0.0, 0.0, 0.0, 0.0]
+        weight = 1
+        path, relative_path, depth = root, "", 0
+        while True:
+            stats, directories = self._list(path, relative_path, depth)
+            for i, value in enumerate(stats):
+                totals[i] += weight * value
+            if not directories:
+                return totals
+            weight *= len(directories)
+            path, relative_path, depth = self.random.choice(directories)
+
+    def estimate(self, roots: List[str], files_per_second: float = DEFAULT_FILES_PER_SECOND,
+                 throughput: float = DEFAULT_THROUGHPUT) -> Estimate:
+        deadline = time.monotonic() + self.time_budget
+        means = [0.0] * 4
+        variances = [0.0] * 4
+        probes = 0
+        for root in roots:
+            samples = []
+            while len(samples) < self.probes and (len(samples) < 2 or time.monotonic() < deadline):
+                samples.append(self._probe(root))
+            probes += len(samples)
+            # Roots are independent, their means and variances add up
+            for i in range(4):
+                values = [sample[i] for sample in samples]
+                mean = sum(values) / len(values)
+                means[i] += mean
+                if len(values) > 1:
+                    variances[i] += sum((value - mean) ** 2 for value in values) / (len(values) - 1) / len(values)
+
+        bounds = [
+            Bounds(mean, max(0.0, mean - Z_95 * math.sqrt(variance)), mean + Z_95 * math.sqrt(variance))
+            for mean, variance in zip(means, variances)
+        ]
+        matched_files, matched_size = bounds[2], bounds[3]
+        seconds = Bounds(*(
+            files / files_per_second + size / throughput
+            for files, size in zip(matched_files, matched_size)
+        ))
+        return Estimate(bounds[0], bounds[1], matched_files, matched_size, probes, len(self.listings), seconds)
@@ -0,0 +1,180 @@
+import struct
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from src.source import Source
+
+# Tags the organizer needs, see the TIFF 6.0 and Exif 2.32 specifications
+MAKE = 0x010F
+MODEL = 0x0110
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+SUB_SEC_TIME_ORIGINAL = 0x9291
+LENS_MODEL = 0xA434
+# Tags stored in the Exif sub-IFD instead of IFD0
+EXIF_IFD_TAGS = frozenset((DATE_TIME_ORIGINAL, SUB_SEC_TIME_ORIGINAL, LENS_MODEL))
+DEFAULT_TAGS = (MAKE, MODEL, LENS_MODEL, DATE_TIME_ORIGINAL, SUB_SEC_TIME_ORIGINAL)
+DATE_TIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+MAX_ENTRIES = 1000
+# Largest value read, the tags wanted are a few short strings and numbers: a larger count is a corrupted entry
+MAX_VALUE_SIZE = 64 * 1024
+MAX_ASCII_SIZE = 256
+
+ASCII = 2
+SHORT = 3
+LONG = 4
+IFD = 13
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+EXIF_HEADER = b"Exif\x00\x00"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Classic TIFF, Olympus ORF and Panasonic RW2 headers. CR2, NEF, ARW and DNG are plain TIFF
+TIFF_HEADERS = (b"II*\x00", b"MM\x00*", b"IIRO", b"IIU\x00")
+
+
+def is_jpeg(header: bytes) -> bool:
+    return header.startswith(JPEG_SOI)
+
+
+def is_tiff(header: bytes) -> bool:
+    return header[:4] in TIFF_HEADERS
+
+
+def is_png(header: bytes) -> bool:
+    return header.startswith(PNG_SIGNATURE)
+
+
+def is_webp(header: bytes) -> bool:
+    return header[:4] == b"RIFF" and header[8:12] == b"WEBP"
+
+
+def jpeg_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    return read_tiff(source, _find_jpeg_exif(source), tags)
+
+
+def tiff_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    # TIFF based RAW files are a TIFF file with the sensor data in a sub-IFD
+    return read_tiff(source, 0, tags)
+
+
+def png_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    return read_tiff(source, _find_png_exif(source), tags)
+
+
+def webp_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    return read_tiff(source, _find_webp_exif(source), tags)
+
+
+def _find_jpeg_exif(source: Source) -> Optional[int]:
+    offset = 2
+    while True:
+        marker = source.read_at(offset, 4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        if marker[1] == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker[1] in (JPEG_SOS, JPEG_EOI):
+            return None
+        length = struct.unpack(">H", marker[2:])[0]
+        if marker[1] == 0xE1 and source.read_at(offset + 4, 6) == EXIF_HEADER:
+            return offset + 10
+        offset += 2 + length
+
+
+def _find_png_exif(source: Source) -> Optional[int]:
+    offset = 8
+    while True:
+        chunk = source.read_at(offset, 8)
+        if len(chunk) < 8:
+            return None
+        length, kind = struct.unpack(">I4s", chunk)
+        if kind == b"eXIf":
+            return offset + 8
+        if kind in (b"IDAT", b"IEND"):
+            return None
+        offset += 12 + length
+
+
+def _find_webp_exif(source: Source) -> Optional[int]:
+    offset = 12
+    while True:
+        chunk = source.read_at(offset, 8)
+        if len(chunk) < 8:
+            return None
+        kind, length = struct.unpack("<4sI", chunk)
+        if kind == b"EXIF":
+            # Some writers keep the JPEG APP1 header
+            return offset + 14 if source.read_at(offset + 8, 6) == EXIF_HEADER else offset + 8
+        offset += 8 + length + (length & 1)
+
+
+def capture_time(values: Dict[int, Any]) -> Optional[datetime]:
+    # DateTimeOriginal with its sub seconds, None when missing or blank ("0000:00:00 00:00:00")
+    value = values.get(DATE_TIME_ORIGINAL) if isinstance(values, dict) else None
+    if not isinstance(value, str):
+        return None
+    try:
+        date = datetime.strptime(value.strip(), DATE_TIME_FORMAT)
+    except ValueError:
+        return None
+    sub_seconds = values.get(SUB_SEC_TIME_ORIGINAL)
+    if isinstance(sub_seconds, str) and sub_seconds.strip().isdigit():
+        date = date.replace(microsecond=int(sub_seconds.strip()[:6].ljust(6, "0")))
+    return date
+
+
+def read_tiff(source: Source, tiff: Optional[int], tags: Set[int]) -> Dict[int, Any]:
+    # Values of the tags found in IFD0 and the Exif sub-IFD of the TIFF block at offset tiff
+    if tiff is None:
+        return {}
+    byte_order = "<" if source.read_at(tiff, 2) == b"II" else ">"
+    ifd = struct.unpack(byte_order + "I", source.read_at(tiff + 4, 4))[0]
+    exif_tags = tags & EXIF_IFD_TAGS
+    values = _read_ifd(source, tiff, ifd, byte_order, (tags - exif_tags) | ({EXIF_IFD} if exif_tags else set()))
+    exif_ifd = values.pop(EXIF_IFD, None)
+    if isinstance(exif_ifd, int) and exif_ifd != ifd:
+        values.update(_read_ifd(source, tiff, exif_ifd, byte_order, exif_tags))
+    return values
+
+
+def _read_ifd(source: Source, tiff: int, offset: int, byte_order: str, tags: set) -> Dict[int, Any]:
+    # Offsets are relative to the TIFF header
+    ifd = tiff + offset
+    count = struct.unpack(byte_order + "H", source.read_at(ifd, 2))[0]
+    if count > MAX_ENTRIES:
+        raise ValueError("Too many IFD entries")
+    entries = source.read_at(ifd + 2, 12 * count)
+    values = {}
+    for i in range(count):
+        tag, kind, number, value = struct.unpack_from(byte_order + "HHI4s", entries, 12 * i)
+        if tag not in tags:
+            continue
+        size = TYPE_SIZES.get(kind, 1) * number
+        if size > (MAX_ASCII_SIZE if kind == ASCII else MAX_VALUE_SIZE):
+            continue
+        if size <= 4:
+            data = value[:size]
+        else:
+            start = tiff + struct.unpack(byte_order + "I", value)[0]
+            if start + size > source.size:
+                continue
+            data = source.read_at(start, size)
+        values[tag] = _decode(byte_order, kind, number, data)
+    return values
+
+
+def _decode(byte_order: str, kind: int, number: int, data: bytes) -> Any:
+    # data can be a view of a mapped file, the values returned never refer to it
+    if kind == ASCII:
+        # Same as PIL, the value ends at the first NUL
+        return bytes(data).split(b"\x00", 1)[0].decode("latin-1")
+    if kind in (SHORT, LONG, IFD) and len(data) == number * TYPE_SIZES[kind]:
+        values = struct.unpack(byte_order + ("H" if kind == SHORT else "I") * number, data)
+        return values[0] if number == 1 else values
+    return bytes(data)
@@ -0,0 +1,141 @@
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_BATCH_TIMEOUT = 60.0
+# Seconds between two looks for the start of a batch still waiting for a worker
+START_POLL_INTERVAL = 0.05
+
+# Where the workers tell the pool which batch they start
+_started_queue = None
+
+
+def _init_worker(started_queue) -> None:
+    global _started_queue
+    _started_queue = started_queue
+
+
+def _run_batch(function: Callable[[List[Any]], List[Any]], task_id: int, batch: List[Any]) -> List[Any]:
+    _started_queue.put(task_id)
+    return function(batch)
+
+
+class ExtractionPool:
+    """
+    Runs a function over batches of items in worker processes. Items are paths, or plain
+    tuples whose first value (the path) names them in the logs.
+
+    A batch that crashes its worker, does not finish in timeout seconds or raises is split
+    in halves and run again, down to the single item to blame. The pool is recreated
+    (the stuck workers killed) after every crash or hang, the other batches keep going.
+
+    The timeout of a batch runs from its start in a worker. The batches cancelled or broken
+    by the restart of another one are run again: a single item is only blamed for a crash
+    once it crashed twice.
+    """
+
+    def __init__(self, function: Callable[[List[Any]], List[Any]], workers: int,
+                 batch_size: int = DEFAULT_BATCH_SIZE, timeout: float = DEFAULT_BATCH_TIMEOUT):
+        self.function = function
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.restarts = 0
+        self.failed = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue = None
+        self._started: Dict[int, float] = {}
+        self._task_ids = itertools.count()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_pending(self) -> int:
+        # Enough batches in flight to keep every worker busy, without queuing the whole source
+        return 2 * self.workers
+
+    def submit(self, batch: List[Any]) -> Tuple[List[Any], Future, int, int]:
+        with self._lock:
+            if self._executor is None:
+                # fork is not safe with the scanner and reader threads running
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                # A new queue with every pool, a worker killed while writing can leave the old one corrupted
+                self._queue = context.SimpleQueue()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                     initializer=_init_worker, initargs=(self._queue,))
+            task_id = next(self._task_ids)
+            return batch, self._executor.submit(_run_batch, self.function, task_id, batch), self._generation, task_id
+
+    def result(self, task: Tuple[List[Any], Future, int, int], retried: bool = False) -> List[Any]:
+        # Results of the batch in order, None for the items that could not be processed
+        batch, future, generation, task_id = task
+        try:
+            return self._wait(future, task_id)
+        except CancelledError:
+            # Cancelled by the restart of another batch before it started
+            return self.result(self.submit(batch), retried)
+        except Exception as err:
+            if isinstance(err, (BrokenProcessPool, TimeoutError)):
+                self._restart(generation)
+            if len(batch) == 1:
+                if isinstance(err, BrokenProcessPool) and not retried:
+                    # The crash can be another batch's, the item is run again before being blamed
+                    return self.result(self.submit(batch), True)
+                name = batch[0][0] if isinstance(batch[0], tuple) else batch[0]
+                logging.warning("[-] Unable to read %s: %s", name, str(err) or type(err).__name__)
+                with self._lock:
+                    self.failed += 1
+                return [None]
+            middle = len(batch) // 2
+            return self.result(self.submit(batch[:middle])) + self.result(self.submit(batch[middle:]))
+        finally:
+            with self._lock:
+                self._started.pop(task_id, None)
+
+    def _wait(self, future: Future, task_id: int) -> List[Any]:
+        # The timeout runs from the start of the batch in a worker, not from the call: a batch queued behind
+        # others is not blamed for their time
+        while True:
+            started = self._started_at(task_id)
+            deadline = None if started is None else started + self.timeout
+            try:
+                return future.result(START_POLL_INTERVAL if deadline is None else max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                if deadline is not None:
+                    raise
+
+    def _started_at(self, task_id: int) -> Optional[float]:
+        with self._lock:
+            # Recorded when seen, at most a poll interval late. The messages are smaller than a pipe buffer, a
+            # worker killed while writing one leaves no partial message behind
+            while self._queue is not None and not self._queue.empty():
+                self._started[self._queue.get()] = time.monotonic()
+            return self._started.get(task_id)
+
+    def _restart(self, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation or self._executor is None:
+                # Already restarted by another batch of the same pool
+                return
+            # A hung worker never returns, terminating it is the only way to get it back
+            for process in list((self._executor._processes or {}).values()):
+                process.terminate()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._generation += 1
+            self.restarts += 1
+            logging.warning("[-] Restarting the extraction workers")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+                self._queue = None
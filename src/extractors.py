@@ -0,0 +1,132 @@
+import mmap
+import os
+import struct
+import threading
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from src.exif import DEFAULT_TAGS, is_jpeg, is_png, is_tiff, is_webp, jpeg_exif, png_exif, tiff_exif, webp_exif
+from src.media import heif_exif, is_heif, is_iso_bmff, is_ogg, mp4_exif, ogg_exif
+from src.source import Source
+
+# Enough for the IFDs of almost every file, the rest (a thumbnail, a video) is never read
+PREFIX_SIZE = 16 * 1024
+HEADER_SIZE = 16
+
+
+class Extractor(NamedTuple):
+    name: str
+    # Values of the wanted EXIF tag ids found in the file
+    read: Callable[[Source, Set[int]], Dict[int, Any]]
+    # True when the first HEADER_SIZE bytes of a file are in this format
+    sniff: Callable[[bytes], bool]
+
+
+class ExtractorRegistry:
+    """
+    Maps the extensions and magic bytes of the formats to the extractor reading their metadata.
+
+    The extractor of the extension is used when the file header matches it, the header
+    decides otherwise (a PNG named .jpg). Extensions without metadata are never opened;
+    the extensions without an extractor are learnt the first time no extractor matches.
+    """
+
+    def __init__(self, prefix_size: int = PREFIX_SIZE):
+        self.prefix_size = prefix_size
+        self.extractors: List[Extractor] = []
+        self.extensions: Dict[str, Extractor] = {}
+        self.no_metadata: Set[str] = set()
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def register(self, extractor: Extractor, extensions: Iterable[str] = ()) -> None:
+        # The last registered extractor wins, so a faster one can replace a default one
+        self.extractors.insert(0, extractor)
+        for extension in extensions:
+            self.extensions[extension.lower()] = extractor
+            self.no_metadata.discard(extension.lower())
+
+    def register_no_metadata(self, extensions: Iterable[str]) -> None:
+        for extension in extensions:
+            self.extensions.pop(extension.lower(), None)
+            self.no_metadata.add(extension.lower())
+
+    def has_metadata(self, path: str) -> bool:
+        return os.path.splitext(path)[1].lower() not in self.no_metadata
+
+    def extract(self, path: str, tags: Iterable[int] = DEFAULT_TAGS, mapped: bool = False) -> Dict[int, Any]:
+        # A mapped file is parsed in place, without copying its header. Only for local files:
+        # reading a mapped file truncated by someone else kills the process (SIGBUS)
+        extension = os.path.splitext(path)[1].lower()
+        if extension in self.no_metadata:
+            with self._lock:
+                self.skipped += 1
+            return {}
+        with open(path, "rb") as file:
+            if mapped:
+                return self._extract_mapped(file, extension, tags)
+            return self._extract(Source(file.read(self.prefix_size), file), extension, tags)
+
+    def extract_bytes(self, data: bytes, extension: str = "", tags: Iterable[int] = DEFAULT_TAGS) -> Dict[int, Any]:
+        return self._extract(Source(bytes(data)), extension.lower(), tags)
+
+    def _extract_mapped(self, file, extension: str, tags: Iterable[int]) -> Dict[int, Any]:
+        try:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return {}
+        # Closing the mapping fails (BufferError) while a view of it is alive: the views held by the frames of a
+        # parser error are released first, the error is raised once the mapping is closed, as in buffered reads
+        error = None
+        with mapping, memoryview(mapping) as view:
+            try:
+                return self._extract(Source(view), extension, tags)
+            except Exception as err:
+                traceback.clear_frames(err.__traceback__)
+                error = err
+        raise error
+
+    def _extract(self, source: Source, extension: str, tags: Iterable[int]) -> Dict[int, Any]:
+        header = bytes(source.read_at(0, HEADER_SIZE))
+        extractor = self._find(header, extension)
+        if extractor is None:
+            if extension and extension not in self.extensions:
+                with self._lock:
+                    self.no_metadata.add(extension)
+            return {}
+        try:
+            return extractor.read(source, set(tags))
+        except (struct.error, ValueError, IndexError, OverflowError, OSError):
+            # Truncated or corrupted metadata (offsets past the end, sizes too large to seek to), the file is
+            # organized by its modification date
+            return {}
+
+    def _find(self, header: bytes, extension: str) -> Optional[Extractor]:
+        extractor = self.extensions.get(extension)
+        if extractor is not None and extractor.sniff(header):
+            return extractor
+        for extractor in self.extractors:
+            if extractor.sniff(header):
+                return extractor
+        return None
+
+
+def default_registry(prefix_size: int = PREFIX_SIZE) -> ExtractorRegistry:
+    result = ExtractorRegistry(prefix_size)
+    result.register(Extractor("ogg", ogg_exif, is_ogg), (".opus", ".ogg", ".oga"))
+    result.register(Extractor("mp4", mp4_exif, is_iso_bmff), (".mp4", ".mov", ".m4v", ".3gp", ".qt"))
+    result.register(Extractor("heif", heif_exif, is_heif), (".heic", ".heif", ".avif"))
+    result.register(Extractor("webp", webp_exif, is_webp), (".webp",))
+    result.register(Extractor("png", png_exif, is_png), (".png",))
+    result.register(
+        Extractor("tiff", tiff_exif, is_tiff),
+        (".tif", ".tiff", ".cr2", ".nef", ".nrw", ".arw", ".dng", ".orf", ".rw2", ".pef", ".srw"),
+    )
+    result.register(Extractor("jpeg", jpeg_exif, is_jpeg), (".jpg", ".jpeg", ".jpe"))
+    # GIF has no EXIF block
+    result.register_no_metadata((".gif",))
+    return result
+
+
+registry = default_registry()
@@ -0,0 +1,63 @@
+import re
+from datetime import datetime
+from typing import Iterable, List, Optional, Pattern
+
+# Names given by cameras, phones and messaging apps. The year, month and day groups are
+# required, the hour, minute and second ones are optional
+DEFAULT_PATTERNS = (
+    # IMG_20230114_153012.jpg, PXL_20240301_123456789.jpg, VID_20230114_153012.mp4
+    r"^(?:IMG|VID|PXL|MVIMG|PANO|BURST|MOV|Screenshot)_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})"
+    r"_(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})",
+    # IMG-20220101-WA0003.jpg, VID-20220101-WA0003.mp4, PTT-20220101-WA0003.opus (WhatsApp)
+    r"^(?:IMG|VID|AUD|PTT|STK)-(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})-WA\d+",
+    # 20230114_153012.jpg (Samsung)
+    r"^(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})_(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})",
+    # 2023-01-14 15.30.12.jpg (camera uploads), Screenshot_2023-01-14-15-30-12.png
+    r"^(?:Screenshot_)?(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})[ _-]"
+    r"(?P<hour>\d{2})[.-](?P<minute>\d{2})[.-](?P<second>\d{2})",
+)
+REQUIRED_GROUPS = ("year", "month", "day")
+MIN_YEAR = 1990
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    compiled = re.compile(pattern)
+    missing = [group for group in REQUIRED_GROUPS if group not in compiled.groupindex]
+    if missing:
+        raise ValueError("The pattern %s has no %s group" % (pattern, ", ".join(missing)))
+    return compiled
+
+
+class FilenameDates:
+    """
+    Reads the capture time embedded in a file name, without opening the file.
+
+    The user patterns are tried before the default ones. A name whose digits are not a
+    plausible date (a counter, a month 13, a year before 1990 or in the future) does not match.
+    """
+
+    def __init__(self, patterns: Iterable[str] = (), defaults: bool = True):
+        self.patterns: List[Pattern] = [compile_pattern(pattern) for pattern in patterns]
+        if defaults:
+            self.patterns += [compile_pattern(pattern) for pattern in DEFAULT_PATTERNS]
+
+    def match(self, name: str) -> Optional[datetime]:
+        for pattern in self.patterns:
+            found = pattern.search(name)
+            if found is None:
+                continue
+            date = self._to_date(found)
+            if date is not None:
+                return date
+        return None
+
+    @staticmethod
+    def _to_date(found: re.Match) -> Optional[datetime]:
+        groups = found.groupdict()
+        try:
+            date = datetime(*(int(groups.get(name) or 0) for name in ("year", "month", "day", "hour", "minute", "second")))
+        except ValueError:
+            return None
+        if date.year < MIN_YEAR or date > datetime.now():
+            return None
+        return date
@@ -0,0 +1,141 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import NamedTuple, Optional
+
+from src.record import FileRecord
+
+
+class IndexEntry(NamedTuple):
+    date: str
+    model: Optional[str]
+    target: Optional[str]
+
+
+class MetadataIndex:
+    """
+    On-disk (SQLite) index of the metadata extracted from each source file.
+
+    An entry is only reused while the size, mtime and inode of the file are unchanged,
+    and the whole index is dropped when VERSION changes (new extraction logic).
+    """
+
+    VERSION = "3"
+    COMMIT_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " date TEXT NOT NULL,"
+            " model TEXT,"
+            " target TEXT,"
+            " run INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if self._get_setting("version") != self.VERSION:
+            logging.debug("[+] Index version changed, dropping all the entries")
+            self._connection.execute("DELETE FROM files")
+            self._set_setting("version", self.VERSION)
+        self.run = int(self._get_setting("run") or 0) + 1
+        self._set_setting("run", str(self.run))
+        self._connection.commit()
+
+    def _get_setting(self, key: str) -> Optional[str]:
+        row = self._connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, key: str, value: str) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def lookup(self, record: FileRecord) -> Optional[IndexEntry]:
+        # Hits and misses are only counted on the first lookup of a path in each run
+        path = record.path
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode, date, model, target, run FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or (row[0], row[1], row[2]) != (record.size, record.mtime_ns, record.inode):
+                self.misses += 1
+                return None
+            if row[6] != self.run:
+                self.hits += 1
+                self._write("UPDATE files SET run = ? WHERE path = ?", (self.run, path))
+            return IndexEntry(row[3], row[4], row[5])
+
+    def store(self, record: FileRecord) -> None:
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, date, model, target, run)"
+                " VALUES (?, ?, ?, ?, ?, ?, NULL, ?)",
+                (record.path, record.size, record.mtime_ns, record.inode, record.date, record.model, self.run),
+            )
+
+    def mark_organized(self, path: str, target: str) -> None:
+        with self._lock:
+            self._write("UPDATE files SET target = ? WHERE path = ?", (target, path))
+
+    def is_organized(self, path: str, target: str) -> bool:
+        with self._lock:
+            row = self._connection.execute("SELECT target FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == target and os.path.isfile(target)
+
+    def _write(self, query: str, parameters: tuple) -> None:
+        self._connection.execute(query, parameters)
+        self._pending_writes += 1
+        if self._pending_writes >= self.COMMIT_EVERY:
+            self._connection.commit()
+            self._pending_writes = 0
+
+    def compact(self) -> int:
+        # Removes the entries of files that no longer exist or have changed since they were indexed
+        stale = []
+        with self._lock:
+            rows = self._connection.execute("SELECT path, size, mtime_ns, inode FROM files").fetchall()
+            for path, size, mtime_ns, inode in rows:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stale.append((path,))
+                    continue
+                if (size, mtime_ns, inode) != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                    stale.append((path,))
+            self._connection.executemany("DELETE FROM files WHERE path = ?", stale)
+            self._connection.commit()
+            self._connection.execute("VACUUM")
+        return len(stale)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def reporting_summary(self) -> None:
+        logging.info(
+            " Index hits : %s / %s (%.1f%%)", self.hits, self.hits + self.misses, self.hit_rate * 100
+        )
+
+    def commit(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._pending_writes = 0
+
+    def close(self) -> None:
+        self.commit()
+        self._connection.close()
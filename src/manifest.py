@@ -0,0 +1,64 @@
+import logging
+import os
+import stat as st
+import sys
+from typing import BinaryIO, Iterator
+
+from src.record import FileRecord
+
+CHUNK_SIZE = 64 * 1024
+PATH_MAX = 4096
+
+
+def read_paths(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    # Streams the paths of a newline or NUL delimited list (find -print0). A NUL list holds a NUL
+    # within its first PATH_MAX bytes, so the delimiter is decided once that many bytes are buffered
+    delimiter = None
+    remainder = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        remainder += chunk
+        if delimiter is None:
+            if b"\0" in remainder:
+                delimiter = b"\0"
+            elif len(remainder) >= PATH_MAX:
+                delimiter = b"\n"
+            else:
+                continue
+        lines = remainder.split(delimiter)
+        remainder = lines.pop()
+        for line in lines:
+            path = _decode(line, delimiter)
+            if path:
+                yield path
+    if delimiter is None:
+        delimiter = b"\n"
+    for line in remainder.split(delimiter):
+        path = _decode(line, delimiter)
+        if path:
+            yield path
+
+
+def _decode(line: bytes, delimiter: bytes) -> str:
+    if delimiter != b"\0":
+        line = line.rstrip(b"\r")
+    return os.fsdecode(line)
+
+
+def scan_file_list(file_list: str) -> Iterator[FileRecord]:
+    # '-' reads the list from the standard input
+    stream = sys.stdin.buffer if file_list == "-" else open(file_list, "rb")
+    try:
+        for path in read_paths(stream):
+            try:
+                stat = os.stat(path)
+            except OSError as err:
+                logging.warning("[-] Unable to read %s: %s", path, err)
+                continue
+            if st.S_ISREG(stat.st_mode):
+                yield FileRecord.from_stat(path, stat)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
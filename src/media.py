@@ -0,0 +1,269 @@
+import itertools
+import struct
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.exif import DATE_TIME_FORMAT, DATE_TIME_ORIGINAL, read_tiff
+from src.source import Source
+
+# ISO base media file format (ISO/IEC 14496-12): MP4, MOV, 3GP and HEIF/HEIC
+HEIF_BRANDS = (b"heic", b"heix", b"heim", b"heis", b"hevc", b"mif1", b"msf1", b"avif")
+MP4_EPOCH_OFFSET = 2082844800  # Seconds between 1904-01-01 and 1970-01-01
+# Boxes read at one level when looking for metadata, fragmented videos have thousands at the top level
+MAX_BOXES = 1000
+# Largest iloc box read, a few hundred items take a few KB
+MAX_ILOC_SIZE = 1024 ** 2
+
+# Ogg (RFC 3533) with Opus (RFC 7845) or Vorbis comments
+OGG_PAGE = struct.Struct("<4sBBqIIIB")
+COMMENT_HEADERS = (b"OpusTags", b"\x03vorbis")
+DATE_COMMENTS = ("CREATION_TIME", "DATE")
+OGG_DATE_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d")
+OGG_HEADER = b"OggS"
+OGG_PREFIX_SIZE = 64 * 1024
+
+
+def is_heif(header: bytes) -> bool:
+    return header[4:8] == b"ftyp" and header[8:12] in HEIF_BRANDS
+
+
+def is_iso_bmff(header: bytes) -> bool:
+    # Old QuickTime files do not start with a ftyp box
+    return header[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip") and not is_heif(header)
+
+
+def is_ogg(header: bytes) -> bool:
+    return header.startswith(OGG_HEADER)
+
+
+def heif_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    return read_tiff(source, find_heif_exif(source), tags)
+
+
+def mp4_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    # Videos have no EXIF, their creation time is reported as DateTimeOriginal
+    return _creation_time(read_mvhd_time(source), tags)
+
+
+def ogg_exif(source: Source, tags: Set[int]) -> Dict[int, Any]:
+    return _creation_time(read_ogg_time(source), tags)
+
+
+def _creation_time(date: Optional[datetime], tags: Set[int]) -> Dict[int, Any]:
+    return {DATE_TIME_ORIGINAL: date.strftime(DATE_TIME_FORMAT)} if date and DATE_TIME_ORIGINAL in tags else {}
+
+
+def boxes(source: Source, start: int, end: Optional[int],
+          limit: Optional[int] = MAX_BOXES) -> Iterator[Tuple[bytes, int, int]]:
+    # (type, payload offset, payload end) of the boxes between start and end (None for the end of the file), up to
+    # limit boxes (None for all of them)
+    offset = start
+    for _ in (itertools.count() if limit is None else range(limit)):
+        if end is not None and offset + 8 > end:
+            return
+        header = source.read_at(offset, 16)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header[:8])
+        payload = offset + 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack(">Q", header[8:])[0]
+            payload += 8
+        elif size == 0:
+            # The box goes up to the end of the file
+            yield kind, payload, end
+            return
+        if size < payload - offset:
+            return
+        yield kind, payload, offset + size
+        offset += size
+
+
+def find_box(source: Source, path: List[bytes], start: int = 0, end: Optional[int] = None,
+             skip: int = 0) -> Optional[Tuple[int, int]]:
+    # Payload of the box at path, skip bytes of the first level are the version and flags of a full box
+    for kind, payload, payload_end in boxes(source, start + skip, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return payload, payload_end
+            # meta is a full box, its children come after the version and flags
+            return find_box(source, path[1:], payload, payload_end, 4 if kind == b"meta" else 0)
+    return None
+
+
+def read_mvhd_time(source: Source) -> Optional[datetime]:
+    # Creation time of the movie header. Only the box headers are read, the moov box can be after a huge mdat
+    mvhd = find_box(source, [b"moov", b"mvhd"])
+    if mvhd is None:
+        return None
+    data = source.read_at(mvhd[0], 12)
+    if len(data) < 8:
+        return None
+    if data[0] == 1:
+        if len(data) < 12:
+            return None
+        seconds = struct.unpack(">Q", data[4:12])[0]
+    else:
+        seconds = struct.unpack(">I", data[4:8])[0]
+    if seconds <= MP4_EPOCH_OFFSET:
+        # Not set (0) by a lot of encoders
+        return None
+    try:
+        return datetime.fromtimestamp(seconds - MP4_EPOCH_OFFSET)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def find_heif_exif(source: Source) -> Optional[int]:
+    # Offset of the TIFF header of the Exif item of a HEIF image
+    meta = find_box(source, [b"meta"])
+    if meta is None:
+        return None
+    iinf = find_box(source, [b"iinf"], meta[0], meta[1], 4)
+    iloc = find_box(source, [b"iloc"], meta[0], meta[1], 4)
+    if iinf is None or iloc is None:
+        return None
+    item = _find_exif_item(source, *iinf)
+    location = _item_location(source, iloc[0], iloc[1], item) if item is not None else None
+    if location is None:
+        return None
+    # The item starts with the offset of the TIFF header after this field
+    header = source.read_at(location, 4)
+    if len(header) < 4:
+        return None
+    return location + 4 + struct.unpack(">I", header)[0]
+
+
+def _find_exif_item(source: Source, start: int, end: int) -> Optional[int]:
+    # The entry count is 16 bits long in version 0, 32 bits after
+    first = start + (6 if source.read_at(start, 1) == b"\x00" else 8)
+    for kind, payload, _ in boxes(source, first, end):
+        if kind != b"infe":
+            continue
+        data = source.read_at(payload, 14)
+        if len(data) < 14:
+            return None
+        if data[0] == 2:
+            item, item_type = struct.unpack(">H", data[4:6])[0], data[8:12]
+        elif data[0] == 3:
+            item, item_type = struct.unpack(">I", data[4:8])[0], data[10:14]
+        else:
+            continue
+        if item_type == b"Exif":
+            return item
+    return None
+
+
+def _item_location(source: Source, start: int, end: int, item: int) -> Optional[int]:
+    data = source.read_at(start, min(MAX_ILOC_SIZE, (source.size if end is None else end) - start))
+    if len(data) < 6:
+        return None
+    version = data[0]
+    sizes = data[4:6]
+    offset_size, length_size = sizes[0] >> 4, sizes[0] & 0x0F
+    base_offset_size, index_size = sizes[1] >> 4, (sizes[1] & 0x0F) if version in (1, 2) else 0
+    position = 6
+
+    def read(size: int) -> int:
+        nonlocal position
+        if position + size > len(data):
+            raise ValueError("Truncated iloc box")
+        value = int.from_bytes(data[position:position + size], "big")
+        position += size
+        return value
+
+    count = read(2 if version < 2 else 4)
+    for _ in range(count):
+        item_id = read(2 if version < 2 else 4)
+        construction_method = read(2) & 0x0F if version in (1, 2) else 0
+        read(2)  # data_reference_index
+        base_offset = read(base_offset_size)
+        extents = read(2)
+        first_extent = None
+        for _ in range(extents):
+            read(index_size)
+            extent_offset = read(offset_size)
+            read(length_size)
+            if first_extent is None:
+                first_extent = extent_offset
+        if item_id == item:
+            # Items stored in the idat box (construction method 1) are not supported
+            return base_offset + (first_extent or 0) if construction_method == 0 else None
+    return None
+
+
+def read_ogg_comments(source: Source, limit: int = OGG_PREFIX_SIZE) -> Dict[str, str]:
+    # Comments of the second packet of the first logical stream (OpusTags or Vorbis comment header)
+    packets = _ogg_packets(source, limit, 2)
+    if len(packets) < 2:
+        return {}
+    packet = packets[1]
+    for header in COMMENT_HEADERS:
+        if packet.startswith(header):
+            return _parse_comments(packet, len(header))
+    return {}
+
+
+def read_ogg_time(source: Source) -> Optional[datetime]:
+    comments = read_ogg_comments(source)
+    for key in DATE_COMMENTS:
+        value = comments.get(key, "").strip()
+        for date_format in OGG_DATE_FORMATS:
+            try:
+                return datetime.strptime(value[:19], date_format)
+            except ValueError:
+                continue
+    return None
+
+
+def _ogg_packets(source: Source, limit: int, wanted: int) -> List[bytes]:
+    packets: List[bytes] = []
+    current = b""
+    offset = 0
+    serial = None
+    while offset < limit and len(packets) < wanted:
+        header = source.read_at(offset, OGG_PAGE.size)
+        if len(header) < OGG_PAGE.size:
+            break
+        capture, _, _, _, page_serial, _, _, segments = OGG_PAGE.unpack(header)
+        if capture != b"OggS":
+            break
+        table = source.read_at(offset + OGG_PAGE.size, segments)
+        position = offset + OGG_PAGE.size + segments
+        offset = position + sum(table)
+        if serial is None:
+            serial = page_serial
+        elif page_serial != serial:
+            continue
+        for lacing in table:
+            current += source.read_at(position, lacing)
+            position += lacing
+            if lacing < 255:
+                packets.append(current)
+                current = b""
+    if current and len(packets) < wanted:
+        # Comment headers with a cover art do not fit in the limit, the comments before it are still there
+        packets.append(current)
+    return packets
+
+
+def _parse_comments(packet: bytes, offset: int) -> Dict[str, str]:
+    comments = {}
+    try:
+        vendor = struct.unpack_from("<I", packet, offset)[0]
+        offset += 4 + vendor
+        count = struct.unpack_from("<I", packet, offset)[0]
+        offset += 4
+        for _ in range(count):
+            length = struct.unpack_from("<I", packet, offset)[0]
+            offset += 4
+            if offset + length > len(packet):
+                break
+            key, _, value = packet[offset:offset + length].decode("utf-8", "replace").partition("=")
+            comments.setdefault(key.upper(), value)
+            offset += length
+    except struct.error:
+        pass
+    return comments
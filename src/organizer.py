@@ -1,110 +1,232 @@
-import glob
 import os
-from typing import Tuple, List, Union, Any, Set
+from typing import Tuple, List, Union, Any, Optional, Dict, Iterable, Sequence, Iterator
 
-from src.constants import DEFAULT_EXTENSION
-from src.process import FileProcessor, FileProcessorWin32
+from src.constants import DEFAULT_EXTENSION, DEFAULT_SCAN_WORKERS, DEFAULT_EXCLUDES
+from src.estimate import Estimate, PreflightEstimator
+from src.index import MetadataIndex
+from src.process import FileProcessor, FileProcessorWin32, ProcessingOptions
 import logging
 
-from src.utils import WaitingEffect, do_you_want_to_continue
+from src.manifest import scan_file_list
+from src.record import FileRecord
+from src.scanner import Scanner, remove_nested
+from src.summary import ScanSummary, ExtensionStats
+from src.validation import QUARANTINE, Validator
+from src.utils import WaitingEffect, do_you_want_to_continue, format_size, format_duration
+from src.watcher import get_watcher, watch, DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_TIME
 
 
 class FileOrganizer:
-    def __init__(self, source: str, destination: str, extensions: Tuple[Union[str, Any], ...]):
-        self.file_process = self.get_file_processor()
-        self.source = source
+    def __init__(self, source: Union[str, Sequence[str], None], destination: str, extensions: Tuple[Union[str, Any], ...],
+                 *, processing: ProcessingOptions = ProcessingOptions(), scan_workers: int = DEFAULT_SCAN_WORKERS,
+                 index: Optional[str] = None, excludes: Optional[Iterable[str]] = None, includes: Iterable[str] = (),
+                 max_depth: Optional[int] = None, skip_hidden: bool = False, files_from: Optional[str] = None,
+                 watch: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL, force_poll: bool = False,
+                 settle_time: float = DEFAULT_SETTLE_TIME, estimate: bool = False, validate: bool = False,
+                 deep_verify: bool = False, quarantine: Optional[str] = None):
+        self.index = MetadataIndex(index) if index else None
+        quarantine = quarantine or os.path.join(destination, QUARANTINE)
+        validator = None
+        if validate or deep_verify:
+            validator = Validator(quarantine, (os.cpu_count() or 1) if deep_verify else 0, processing.file_timeout)
+        self.file_process = self.get_file_processor(processing, self.index, validator)
+        self.sources = [source] if isinstance(source, str) else list(source or [])
         self.destination = destination
         self.extensions = extensions if extensions else DEFAULT_EXTENSION
+        self.files_from = files_from
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.force_poll = force_poll
+        self.settle_time = settle_time
+        self.estimate = estimate
+        # The destination is never scanned, even when it is nested inside the source
+        self.scanner = Scanner(
+            workers=scan_workers,
+            excludes=excludes if excludes else DEFAULT_EXCLUDES,
+            includes=includes,
+            max_depth=max_depth,
+            skip_hidden=skip_hidden,
+            skip_paths=(destination, quarantine),
+        )
+
+    @property
+    def source(self) -> Optional[str]:
+        return self.sources[0] if self.sources else None
 
     @staticmethod
-    def get_file_processor():
-        return FileProcessor()
+    def get_file_processor(processing: ProcessingOptions, index: Optional[MetadataIndex] = None,
+                           validator: Optional[Validator] = None):
+        return FileProcessor(processing, index, validator)
 
     def start(self):
-        if self.source and self.destination:
+        if self.watch and self.source and self.destination:
+            self.validate_data_input()
+            self.start_watching()
+        elif (self.source or self.files_from) and self.destination:
             self.validate_data_input()
             logging.info("[+] Start Processing")
-            files = self.get_files(self.source, self.extensions)
-            all_files = files[0]
-            list_of_files_to_be_processed = files[1]
-            missing = files[2]
-            if list_of_files_to_be_processed:
-                self.reporting_summary(all_files, list_of_files_to_be_processed, missing)
-                do_you_want_to_continue()
-                self.file_process.process(list_of_files_to_be_processed, self.destination)
+            if self.files_from:
+                self.start_files_from()
+            elif self.estimate:
+                self.start_estimated()
             else:
-                logging.info("[-] No files found that matches the types")
+                self.start_listed()
+            if self.index is not None:
+                self.index.close()
+
+    def start_listed(self):
+        list_of_files_to_be_processed, summary = self.get_files(self.sources, self.extensions)
+        if list_of_files_to_be_processed:
+            self.reporting_summary(summary)
+            do_you_want_to_continue()
+            self.file_process.process(list_of_files_to_be_processed, self.destination)
+        else:
+            logging.info("[-] No files found that matches the types")
+
+    def start_files_from(self):
+        # A file list usually comes from a pipeline (or the standard input), nobody is there to answer: the list
+        # streams straight into the processing and the summary comes at the end
+        logging.info(" |- Reading file list...")
+        summary = ScanSummary(self.extensions)
+        self.file_process.process(self.stream_listed_files(self.files_from, summary), self.destination)
+        self.reporting_summary(summary)
+        if not summary.matched_files:
+            logging.info("[-] No files found that matches the types")
+
+    def start_estimated(self):
+        # The prompt comes after a sampled estimate, then the scan streams straight into the processing
+        logging.info(" |- Sampling directories...")
+        estimator = PreflightEstimator(self.scanner, self.extensions)
+        self.reporting_estimate(estimator.estimate(remove_nested(self.sources)))
+        do_you_want_to_continue()
+        summary = ScanSummary(self.extensions)
+        self.file_process.process(self.stream_files(self.sources, summary), self.destination)
+        self.reporting_summary(summary)
+
+    def start_watching(self):
+        self.file_process.create_destination(self.destination)
+        watchers = [
+            get_watcher(source, self.scanner, self.settle_time, self.poll_interval, self.force_poll)
+            for source in remove_nested(self.sources)
+        ]
+        watch(watchers, self.on_new_file)
+        if self.index is not None:
+            self.index.close()
+
+    def on_new_file(self, path: str) -> None:
+        if os.path.splitext(path)[1].lower() in self.extensions:
+            self.file_process.process_file(FileRecord.from_path(path), self.destination)
 
     def validate_data_input(self):
         # Validates that the source and destination folder ends up with a os.path.separator
         # if not we will add a separator
 
-        if not self.source.endswith(os.path.sep):
-            self.source = self.source + os.path.sep
+        self.sources = [source if source.endswith(os.path.sep) else source + os.path.sep for source in self.sources]
 
         if not self.destination.endswith(os.path.sep):
             self.destination = self.destination + os.path.sep
 
-    def get_files(self, source: str, extensions: Tuple[str]) -> List[List[str]]:
-        all_files, processed_files = self._filter_files(source, extensions)
-        missing_files = [x for x in all_files if x not in processed_files]
-        return [all_files, processed_files, missing_files]
+    def get_files(self, source: Union[str, List[str]],
+                  extensions: Tuple[str]) -> Tuple[List[FileRecord], ScanSummary]:
+        return self._filter_files([source] if isinstance(source, str) else source, extensions)
 
-    def _filter_files(self, source: str, extensions: Tuple[str]) -> Tuple[List[str], List[str]]:
-        all_files = []
+    def _filter_files(self, sources: List[str], extensions: Tuple[str]) -> Tuple[List[FileRecord], ScanSummary]:
         processed_files = []
+        summary = ScanSummary(extensions)
         we = WaitingEffect(" |- Searching files...")
-        for filename in glob.iglob(source + "**" + os.path.sep + "*.*", recursive=True):
+        for record in self.stream_files(sources, summary):
             we.run()
-            all_files.append(filename.lower())
-            base, ext = os.path.splitext(filename)
-            if ext.lower() in extensions:
-                processed_files.append(filename.lower())
+            processed_files.append(record)
         we.run(end=True)
-        return all_files, processed_files
+        return processed_files, summary
+
+    def stream_files(self, sources: List[str], summary: ScanSummary) -> Iterator[FileRecord]:
+        for record in self.scanner.scan_many(sources):
+            if summary.add(record):
+                yield record
+        summary.pruned_directories = self.scanner.pruned_directories
 
     @staticmethod
-    def get_unique_extensions(files: List[str]) -> Set[str]:
-        unique_extensions = set()
-        for file in files:
-            extension = os.path.splitext(file)[1]
-            if extension not in unique_extensions:
-                unique_extensions.add(extension)
-        return unique_extensions
-
-    def reporting_summary(self, all_files, list_of_processed, missing):
+    def stream_listed_files(file_list: str, summary: ScanSummary) -> Iterator[FileRecord]:
+        for record in scan_file_list(file_list):
+            if summary.add(record):
+                yield record
+
+    @staticmethod
+    def _log_histogram(histogram: Dict[str, ExtensionStats]) -> None:
+        for extension, stats in sorted(histogram.items(), key=lambda item: item[1].size, reverse=True):
+            logging.info("   %-8s %10s files %12s", extension or "(none)", stats.files, format_size(stats.size))
+
+    def reporting_summary(self, summary: ScanSummary):
         logging.info(" ")
         logging.info("------------------------")
         logging.info("  Files Report  ")
         logging.info("------------------------")
         logging.info(" Extensions to be processed : %s ", self.extensions)
-        logging.info(" Files found : %s / %s ", len(list_of_processed), len(all_files))
+        logging.info(
+            " Files found : %s / %s (%s)",
+            summary.matched_files, summary.total_files, format_size(summary.matched_size),
+        )
+        self._log_histogram(summary.matched)
+        logging.info(" ")
+        logging.info(
+            " Missing files   : %s / %s (%s)",
+            summary.unmatched_files, summary.total_files, format_size(summary.unmatched_size),
+        )
+        self._log_histogram(summary.unmatched)
+        logging.info(" ")
+        logging.info(" Pruned directories : %s", summary.pruned_directories)
         logging.info(" ")
-        logging.info(" Missing files   : %s / %s", len(missing), len(all_files))
+
+    @staticmethod
+    def reporting_estimate(estimate: Estimate):
+        logging.info(" ")
+        logging.info("------------------------")
+        logging.info("  Estimate Report  ")
+        logging.info("------------------------")
+        logging.info(" Sampled directories : %s (%s probes)", estimate.directories_sampled, estimate.probes)
+        logging.info(
+            " Files found   : ~%d (%d - %d, 95%%)", estimate.files.value, estimate.files.low, estimate.files.high
+        )
+        logging.info(" Size          : ~%s (%s - %s)", *(format_size(value) for value in estimate.size))
         logging.info(
-            " Missed files have the following extensions: %s",
-            self.get_unique_extensions(missing),
+            " Files to process : ~%d (%d - %d), %.1f%% of the files",
+            *estimate.matched_files, estimate.matching_ratio * 100,
         )
+        logging.info(" Size to process  : ~%s (%s - %s)", *(format_size(value) for value in estimate.matched_size))
+        logging.info(" Expected runtime : ~%s (%s - %s)", *(format_duration(value) for value in estimate.seconds))
         logging.info(" ")
 
 
 class FileOrganizerWin32(FileOrganizer):
 
     @staticmethod
-    def get_file_processor():
-        return FileProcessorWin32()
+    def get_file_processor(processing: ProcessingOptions, index: Optional[MetadataIndex] = None,
+                           validator: Optional[Validator] = None):
+        # MTP objects can not be stat'ed, mapped nor opened from another process: the index, the read workers,
+        # the mapped reads, the validation and the deduplication are not used. The files are always copied from
+        # the device
+        supported = ProcessingOptions(with_model=processing.with_model, filename_patterns=processing.filename_patterns,
+                                      file_timeout=processing.file_timeout, retry_list=processing.retry_list)
+        ignored = [name for name in processing._fields if getattr(processing, name) != getattr(supported, name)]
+        ignored += [name for name, value in (("index", index), ("validate", validator)) if value is not None]
+        if ignored:
+            logging.warning("[-] Not used with MTP devices: %s", ", ".join(ignored))
+        return FileProcessorWin32(supported)
 
-    def _filter_files(self, source: str, extensions: Tuple[str]) -> Tuple[List[str], List[str]]:
+    def start(self):
+        # A device is neither sampled nor watched, the Scanner only walks paths
+        if self.estimate or self.watch:
+            raise ValueError("--estimate and --watch need a source path, MTP devices are only organized in full")
+        super().start()
+
+    def stream_files(self, sources: List[str], summary: ScanSummary) -> Iterator[FileRecord]:
         from src.mtp_windows import get_sub_files
 
-        processed_files = []
-        we = WaitingEffect(" |- Searching files...")
         # Searching recursively
-        all_files = get_sub_files(source)
-        for filename in all_files:
-            we.run()
-            extension = os.path.splitext(filename)[1].lower()
-            if extension in extensions:
-                processed_files.append(filename)
-        we.run(end=True)
-        return all_files, processed_files
+        for source in sources:
+            for filename in get_sub_files(source):
+                # The size of MTP objects is not known at this stage
+                record = FileRecord(filename)
+                if summary.add(record):
+                    yield record
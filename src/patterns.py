@@ -0,0 +1,75 @@
+import re
+from typing import Iterable, List, Pattern, Tuple
+
+
+def _translate(pattern: str) -> str:
+    # Translates a gitignore glob into a regular expression matching '/' separated paths
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                content = pattern[i + 1:end]
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                regex += "[" + content.replace("\\", "\\\\") + "]"
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+class PathMatcher:
+    """
+    Matches paths relative to the scanned root against gitignore style patterns.
+
+    A pattern containing a '/' is anchored to the root, otherwise it matches the name at any
+    depth. A trailing '/' only matches directories and a leading '!' re-includes what a
+    previous pattern excluded. The last matching pattern wins.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.rules: List[Tuple[Pattern, bool, bool]] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+            directory_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if "/" in pattern:
+                regex = _translate(pattern.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + _translate(pattern)
+            self.rules.append((re.compile(regex + r"\Z", re.DOTALL), negated, directory_only))
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def is_excluded(self, relative_path: str, is_dir: bool) -> bool:
+        excluded = False
+        for regex, negated, directory_only in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                excluded = not negated
+        return excluded
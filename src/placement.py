@@ -0,0 +1,257 @@
+import collections
+import errno
+import itertools
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from src.copier import UNSUPPORTED, CopyEngine, Unsupported
+
+COPY = "copy"
+MOVE = "move"
+HARDLINK = "hardlink"
+SYMLINK = "symlink"
+REFLINK = "reflink"
+MODES = (COPY, MOVE, HARDLINK, SYMLINK, REFLINK)
+# Modes that can not fail for want of support, the last resort of a chain
+TERMINAL_MODES = (COPY, MOVE)
+VERBS = {COPY: "copied", MOVE: "moved", HARDLINK: "linked", SYMLINK: "linked", REFLINK: "cloned"}
+# Errors after which a mode is not tried again between the same two devices
+MODE_UNSUPPORTED = UNSUPPORTED | {errno.EPERM}
+# Sources of the moves across devices deleted at once, after their copies are synced
+DELETE_BATCH = 256
+COMPARE_BUFFER = 1024 ** 2
+# A file at its target is the same as the source with the same size and modification time, within this window:
+# FAT and exFAT store it to 2 seconds
+MTIME_WINDOW_NS = 2 * 10 ** 9
+# Returned for the files already at their target
+EXISTING = "existing"
+
+
+def parse_modes(value: str) -> Tuple[str, ...]:
+    modes = tuple(mode.strip().lower() for mode in value.split(",") if mode.strip())
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown or not modes:
+        raise ValueError("Unknown mode %s, the modes are %s" % (", ".join(unknown) or value, ", ".join(MODES)))
+    return modes
+
+
+def same_content(first: str, second: str) -> bool:
+    with open(first, "rb") as a, open(second, "rb") as b:
+        if os.fstat(a.fileno()).st_size != os.fstat(b.fileno()).st_size:
+            return False
+        while True:
+            chunk = a.read(COMPARE_BUFFER)
+            if chunk != b.read(COMPARE_BUFFER):
+                return False
+            if not chunk:
+                return True
+
+
+def sync_directory(directory: str) -> None:
+    # Makes the new entries of a directory durable, there is no such thing on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FilePlacer:
+    """
+    Puts the files at their destination: copied, moved, hard linked, symlinked or reflinked.
+
+    The modes are a preference chain, a file falls back to the next mode when one is not
+    possible (a hard link across devices, a reflink on ext4). A mode refused by the filesystems
+    of two devices is not tried again between them. Copies and moves are the last resort.
+
+    A move on the same device is a rename. Across devices, the file is copied and synced, the
+    copy compared with the source, then the source deleted. Deletions are batched: the
+    directories of a batch of copies are synced once before their sources are deleted.
+
+    place_unique never overwrites: a file already at its target (a rerun) is skipped after a
+    stat, or a comparison of the contents when the times differ. A different file there gets
+    the file a suffixed name (IMG_0001_1.jpg).
+    """
+
+    def __init__(self, modes: Sequence[str] = (COPY,), relative_symlinks: bool = False,
+                 copier: Optional[CopyEngine] = None, compare_content: bool = False):
+        self.modes = tuple(modes)
+        unknown = [mode for mode in self.modes if mode not in MODES]
+        if unknown or not self.modes:
+            raise ValueError("Unknown mode %s" % ", ".join(unknown))
+        self.relative_symlinks = relative_symlinks
+        # Files at their target are compared by content instead of modification time
+        self.compare_content = compare_content
+        self.copier = copier or CopyEngine()
+        self.placed: Dict[str, int] = collections.Counter()
+        self.renamed = 0
+        self.deleted = 0
+        self.existing = 0
+        self.suffixed = 0
+        # Targets being placed, not on the disk yet
+        self._reserved: Set[str] = set()
+        self._devices: Dict[str, int] = {}
+        self._unsupported: Set[Tuple[str, int, int]] = set()
+        self._pending: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def mode(self) -> str:
+        return self.modes[0]
+
+    def place_unique(self, source: str, target: str, device: int = 0) -> Tuple[str, str]:
+        # Where the file is and the mode it was placed with, EXISTING when it was already there
+        planned = target
+        while True:
+            target, existing = self.resolve(source, planned)
+            if existing:
+                # The file of a move is deleted once it is known to be there
+                if MOVE in self.modes and not os.path.islink(target) and same_content(source, target):
+                    self._delete_later(source, target)
+                return target, EXISTING
+            try:
+                return target, self.place(source, target, device)
+            except FileExistsError:
+                # Written meanwhile by another program, the file is resolved again
+                continue
+            finally:
+                with self._lock:
+                    self._reserved.discard(target)
+
+    def resolve(self, source: str, target: str) -> Tuple[str, bool]:
+        # The target, or the first free suffixed name when another file is there, and whether it holds the file
+        # already. A free target is reserved until the file is placed
+        root, extension = os.path.splitext(target)
+        source_stat = None
+        for suffix in itertools.count():
+            candidate = "%s_%s%s" % (root, suffix, extension) if suffix else target
+            with self._lock:
+                if candidate in self._reserved:
+                    continue
+                self._reserved.add(candidate)
+            try:
+                os.lstat(candidate)
+            except FileNotFoundError:
+                if suffix:
+                    with self._lock:
+                        self.suffixed += 1
+                return candidate, False
+            with self._lock:
+                self._reserved.discard(candidate)
+            if source_stat is None:
+                source_stat = os.stat(source)
+            if self._is_same(source, source_stat, candidate):
+                with self._lock:
+                    self.existing += 1
+                return candidate, True
+
+    def _is_same(self, source: str, source_stat: os.stat_result, target: str) -> bool:
+        try:
+            stat = os.stat(target)
+        except OSError:
+            # A broken symlink
+            return False
+        if (stat.st_dev, stat.st_ino) == (source_stat.st_dev, source_stat.st_ino):
+            # A link of an earlier run
+            return True
+        if stat.st_size != source_stat.st_size:
+            return False
+        if self.compare_content or abs(stat.st_mtime_ns - source_stat.st_mtime_ns) >= MTIME_WINDOW_NS:
+            # Copies of older runs (or tools) did not keep the modification time, the content tells
+            return same_content(source, target)
+        return True
+
+    def place(self, source: str, target: str, device: int = 0) -> str:
+        # Mode the file was placed with. An unknown device (0) may still be the same one
+        target_device = self._device(os.path.dirname(target))
+        error: Optional[Exception] = None
+        for mode in self.modes:
+            pair = (mode, device, target_device)
+            if pair in self._unsupported:
+                continue
+            try:
+                self._place(mode, source, target, bool(device) and device != target_device)
+            except FileExistsError:
+                # Never replaced, the next modes would fail or overwrite it
+                raise
+            except (OSError, Unsupported) as err:
+                if mode in TERMINAL_MODES:
+                    raise
+                logging.debug("[-] Unable to %s %s: %s", mode, source, err)
+                error = err
+                if isinstance(err, Unsupported) or err.errno in MODE_UNSUPPORTED:
+                    with self._lock:
+                        self._unsupported.add(pair)
+                continue
+            with self._lock:
+                self.placed[mode] += 1
+            return mode
+        raise error if isinstance(error, OSError) else OSError("Unable to %s %s" % (" or ".join(self.modes), source))
+
+    def _place(self, mode: str, source: str, target: str, other_device: bool) -> None:
+        if mode == COPY:
+            self.copier.copy(source, target)
+        elif mode == MOVE:
+            self._move(source, target, other_device)
+        elif mode == HARDLINK:
+            if other_device:
+                raise Unsupported(HARDLINK)
+            os.link(source, target)
+        elif mode == SYMLINK:
+            source = os.path.abspath(source)
+            if self.relative_symlinks:
+                source = os.path.relpath(source, os.path.dirname(os.path.abspath(target)))
+            os.symlink(source, target)
+        else:
+            self.copier.clone(source, target)
+
+    def _move(self, source: str, target: str, other_device: bool) -> None:
+        if not other_device:
+            try:
+                os.rename(source, target)
+                with self._lock:
+                    self.renamed += 1
+                return
+            except OSError as err:
+                # Two mounts of the same filesystem
+                if err.errno != errno.EXDEV:
+                    raise
+        self.copier.copy(source, target, sync=True)
+        if not same_content(source, target):
+            os.unlink(target)
+            raise OSError("The copy of %s is not the same as the file, it is kept" % source)
+        self._delete_later(source, target)
+
+    def _device(self, directory: str) -> int:
+        device = self._devices.get(directory)
+        if device is None:
+            device = self._devices[directory] = os.stat(directory).st_dev
+        return device
+
+    def _delete_later(self, source: str, target: str) -> None:
+        with self._lock:
+            self._pending.append((source, target))
+            full = len(self._pending) >= DELETE_BATCH
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        # Deletes the sources of the moves copied so far
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        for directory in {os.path.dirname(target) for _, target in pending}:
+            sync_directory(directory)
+        for source, _ in pending:
+            try:
+                os.unlink(source)
+            except OSError as err:
+                logging.warning("[-] Unable to delete %s: %s", source, err)
+                continue
+            with self._lock:
+                self.deleted += 1
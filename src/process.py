@@ -1,28 +1,117 @@
-import io
+import collections
+import functools
 import os
+import queue
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple, Set, Optional
-from shutil import copyfile
-from pathlib import Path
-from PIL import Image, ExifTags, UnidentifiedImageError, ImageFile
-from PIL.Image import Exif
+from typing import Any, List, NamedTuple, Tuple, Set, Optional, Iterable, Dict, Sized, Sequence
+from PIL import ExifTags
 import logging
 from tqdm import tqdm
 
+from src.copier import STRATEGIES
+from src.deadline import DEFAULT_FILE_TIMEOUT, MIN_THROUGHPUT, DeadlinePool
+from src.dedup import LINK, PARTIAL_SIZE, Deduplicator
+from src.exif import capture_time
+from src.extraction import ExtractionPool
+from src.extractors import registry
+from src.filenames import FilenameDates
+from src.index import MetadataIndex
+from src.placement import COPY, HARDLINK, MOVE, MODES, SYMLINK, VERBS, FilePlacer
+from src.record import FileRecord
+from src.utils import format_size
+from src.validation import Validator
+
+COPY_WORKERS = 10
+RETRY_LIST = "retry.txt"
+TAG_IDS = {name: tag for tag, name in ExifTags.TAGS.items()}
+
+# Where the date of a file comes from, in the order they are tried
+FILENAME = "file name"
+INDEX = "index"
+CAPTURE_TIME = "capture time"
+MODIFICATION_TIME = "modification time"
+DATE_SOURCES = (FILENAME, INDEX, CAPTURE_TIME, MODIFICATION_TIME)
+
+
+class ProcessingOptions(NamedTuple):
+    # How the files are read and placed, built from the command line
+    read_workers: int = 0
+    with_model: bool = True
+    filename_patterns: Sequence[str] = ()
+    mapped_reads: bool = False
+    file_timeout: Optional[float] = DEFAULT_FILE_TIMEOUT
+    retry_list: Optional[str] = None
+    modes: Sequence[str] = (COPY,)
+    relative_symlinks: bool = False
+    duplicates: Optional[str] = None
+    compare_content: bool = False
+
+
+def read_metadata(batch: List[str], mapped: bool = False) -> List[Tuple[Optional[datetime], Optional[str]]]:
+    # Runs in the extraction processes: paths in, (capture time, model) out
+    results = []
+    for path in batch:
+        exif_raw = FileProcessor.get_exif(path, mapped)
+        results.append((capture_time(exif_raw), FileProcessor.get_data(exif_raw, "Model")))
+    return results
+
 
 class FileProcessor:
 
-    def __init__(self):
+    def __init__(self, options: ProcessingOptions = ProcessingOptions(), index: Optional[MetadataIndex] = None,
+                 validator: Optional[Validator] = None):
+        self.index = index
+        # Seconds a read or a copy can take (plus the time of its size at MIN_THROUGHPUT for a copy), None to wait
+        # forever. The files past it are abandoned and listed in the retry list (<destination>/retry.txt by default)
+        self.file_timeout = options.file_timeout
+        self.retry_list = options.retry_list
+        self.retry: Dict[str, str] = {}
+        # Files already at their target are not placed again, another file there gets them a suffixed name
+        self.placer = FilePlacer(options.modes, options.relative_symlinks, compare_content=options.compare_content)
+        # Files placed under another name than their own, by path
+        self.targets: Dict[str, str] = {}
+        # Files with the same content are organized once, their duplicates skipped or linked to it
+        self.deduplicator = Deduplicator(options.duplicates,
+                                         file_timeout=options.file_timeout) if options.duplicates else None
+        self.linker = FilePlacer((HARDLINK, SYMLINK, COPY), options.relative_symlinks,
+                                 compare_content=options.compare_content)
+        # Corrupted files are screened out before their metadata is read
+        self.validator = validator
+        # Without the model, a file whose name holds its capture time is never opened
+        self.with_model = options.with_model
+        self.filename_dates = FilenameDates(options.filename_patterns)
+        self.mapped_reads = options.mapped_reads
+        # Metadata is extracted by a pool of processes when there are read workers, in the reader threads otherwise
+        self.pool = ExtractionPool(functools.partial(read_metadata, mapped=options.mapped_reads),
+                                   options.read_workers) if options.read_workers > 0 else None
+        # Files whose metadata was extracted (index hits are not), one per file at most
+        self.metadata_reads = 0
+        self.date_sources = collections.Counter()
+        self._reads_lock = threading.Lock()
         self.progress_bar_reading = None
         self.progress_bar_directories = None
         self.progress_bar_files = None
 
-    def process(self, images: List[str], destination: str):
+    def process(self, images: Iterable[FileRecord], destination: str):
+        # images can be a stream (a scan still running), it is only iterated once
         self.create_destination(destination)
         logging.info("[+] Reading files ")
-        self.progress_bar_reading = tqdm(total=len(images), unit="files")
-        sorted_dates = self.get_unique_sorted_dates(images)
+        self.progress_bar_reading = tqdm(total=len(images) if isinstance(images, Sized) else None, unit="files")
+        images, sorted_dates = self.read_by_device(images, destination)
+        self.progress_bar_reading.close()
+        files = len(images)
+        if self.retry:
+            images = [image for image in images if image.path not in self.retry]
+        duplicates: Dict[FileRecord, FileRecord] = {}
+        if self.deduplicator is not None:
+            logging.info("[+] Looking for duplicates ")
+            progress_bar = tqdm(unit="file")
+            duplicates = self.deduplicator.find(images, progress_bar.update)
+            progress_bar.close()
+            images = [image for image in images if image not in duplicates]
 
         logging.info("[+] Creating directories ")
         self.progress_bar_directories = tqdm(total=len(sorted_dates), unit="directory")
@@ -30,7 +119,32 @@ class FileProcessor:
 
         logging.info("[+] Copying files ")
         self.progress_bar_files = tqdm(total=len(images), unit="file")
+        start = time.monotonic()
         self.process_in_parallel(images, destination)
+        self.flush()
+        if duplicates and self.deduplicator.policy == LINK:
+            self.link_duplicates(duplicates)
+        self.reporting_copies(time.monotonic() - start)
+        if self.deduplicator is not None:
+            self.reporting_duplicates()
+        logging.info(" Metadata reads : %s / %s files", self.metadata_reads, files)
+        for source in DATE_SOURCES:
+            if self.date_sources[source]:
+                logging.info(" |- Dated by %s : %s", source, self.date_sources[source])
+        if self.pool is not None:
+            self.pool.close()
+            if self.pool.failed or self.pool.restarts:
+                logging.info(" Unreadable files : %s (%s worker restarts)", self.pool.failed, self.pool.restarts)
+        if self.validator is not None:
+            self.validator.close()
+            if self.validator.quarantined:
+                logging.info(" Quarantined files : %s (see %s)", self.validator.quarantined, self.validator.report)
+        if self.retry:
+            self.write_retry_list(self.retry_list or destination + RETRY_LIST)
+
+        if self.index is not None:
+            self.index.commit()
+            self.index.reporting_summary()
 
     @staticmethod
     def create_destination(directory_name):
@@ -52,65 +166,322 @@ class FileProcessor:
             self.progress_bar_directories.update()
         self.progress_bar_directories.close()
 
-    def get_unique_sorted_dates(self, images: List[str]) -> Set[Tuple[str, str]]:
+    def read_by_device(self, images: Iterable[FileRecord],
+                       destination: str) -> Tuple[List[FileRecord], Set[Tuple[str, str]]]:
+        # Files are dispatched as they come to one reader thread per device, so the disks
+        # do not seek against each other
+        collected = []
+        queues: Dict[int, queue.Queue] = {}
+        readers = []
+        executor = ThreadPoolExecutor(thread_name_prefix="reader")
+        try:
+            for image in images:
+                collected.append(image)
+                files = queues.get(image.device)
+                if files is None:
+                    files = queues[image.device] = queue.Queue()
+                    readers.append(
+                        executor.submit(self.get_unique_sorted_dates, iter(files.get, None), destination)
+                    )
+                files.put(image)
+        finally:
+            for files in queues.values():
+                files.put(None)
+            executor.shutdown(wait=True)
+        unique_dates = set()
+        for reader in readers:
+            unique_dates.update(reader.result())
+        return collected, unique_dates
+
+    def get_unique_sorted_dates(self, images: Iterable[FileRecord], destination: str) -> Set[Tuple[str, str]]:
+        if self.validator is not None:
+            images = self.validator.screen(images, lambda image: self.progress_bar_reading.update(),
+                                           self._stalled_read)
+        if self.pool is not None:
+            return self._read_in_pool(images, destination)
+        unique_dates = set()
+        # One reading thread, replaced when a read stalls
+        readers = DeadlinePool(lambda image: self.plan(image, destination), 1, "reader")
+        try:
+            for image, planned, error in readers.run(images, lambda image: self.file_timeout):
+                if error is None:
+                    unique_dates.add(planned)
+                else:
+                    self._retry_later(image, "read", error)
+                self.progress_bar_reading.update()
+        finally:
+            readers.close()
+        return unique_dates
+
+    def _read_in_pool(self, images: Iterable[FileRecord], destination: str) -> Set[Tuple[str, str]]:
+        # Names and index hits are planned right away, the misses are sent in batches to the extraction processes
         unique_dates = set()
+        pending = collections.deque()
+
+        def collect(task, batch: List[FileRecord]) -> None:
+            for image, metadata in zip(batch, self.pool.result(task)):
+                if metadata is None:
+                    logging.warning("[-] Metadata of %s not readable", image.path)
+                    self._set_metadata(image, None, None, datetime.fromtimestamp(image.mtime))
+                else:
+                    self._count_read()
+                    self._set_metadata(image, *metadata, datetime.fromtimestamp(image.mtime))
+                    if self.index is not None:
+                        self.index.store(image)
+                unique_dates.add(self.plan(image, destination))
+                self.progress_bar_reading.update()
+
+        batch = []
         for image in images:
-            unique_dates.add(self.modification_date(image))
-            self.progress_bar_reading.update()
-        self.progress_bar_reading.close()
+            named = self._date_from_name(image)
+            if not named and image.mtime_ns is None:
+                image.load_stat()
+            if named or (self.index is not None and self._lookup(image)):
+                unique_dates.add(self.plan(image, destination))
+                self.progress_bar_reading.update()
+                continue
+            batch.append(image)
+            if len(batch) >= self.pool.batch_size:
+                pending.append((self.pool.submit([i.path for i in batch]), batch))
+                batch = []
+                while len(pending) > self.pool.max_pending:
+                    collect(*pending.popleft())
+        if batch:
+            pending.append((self.pool.submit([i.path for i in batch]), batch))
+        while pending:
+            collect(*pending.popleft())
         return unique_dates
 
-    def process_in_parallel(self, images: List[str], destination: str):
-        args = [(image, destination) for image in images]
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            executor.map(self.move_images, args)
+    def process_in_parallel(self, images: List[FileRecord], destination: str):
+        # One pool of copy threads per source device
+        groups: Dict[int, List[FileRecord]] = {}
+        for image in images:
+            groups.setdefault(image.device, []).append(image)
+        with ThreadPoolExecutor(thread_name_prefix="device") as executor:
+            failed = sum(executor.map(lambda group: self._copy_group(group, destination), groups.values()))
         self.progress_bar_files.close()
-        logging.info("[+] All files were moved successfully! ")
+        if failed:
+            logging.warning("[-] %s files were not copied", failed)
+        else:
+            logging.info("[+] All files were %s successfully! ", VERBS[self.placer.mode])
+
+    def _copy_group(self, images: List[FileRecord], destination: str) -> int:
+        copiers = DeadlinePool(self.move_images, COPY_WORKERS, "copy")
+        failed = 0
+        try:
+            for (image, _), _, error in copiers.run([(image, destination) for image in images], self._copy_timeout):
+                if error is not None:
+                    self._retry_later(image, "copy", error)
+                    self.progress_bar_files.update()
+                    failed += 1
+        finally:
+            copiers.close()
+        return failed
+
+    def _stalled_read(self, image: FileRecord, error: BaseException) -> None:
+        self._retry_later(image, "read", error)
+        self.progress_bar_reading.update()
+
+    def _copy_timeout(self, args: Tuple[FileRecord, str]) -> Optional[float]:
+        if self.file_timeout is None:
+            return None
+        return self.file_timeout + (args[0].size or 0) / MIN_THROUGHPUT
+
+    def _retry_later(self, image: FileRecord, operation: str, error: BaseException) -> None:
+        logging.warning("[-] Unable to %s %s: %s", operation, image.path, str(error) or type(error).__name__)
+        with self._reads_lock:
+            self.retry[image.path] = operation
+
+    def write_retry_list(self, path: str) -> None:
+        # A list for --files-from, one path per line
+        with open(path, "w", encoding="utf-8") as retry_list:
+            for file in self.retry:
+                retry_list.write(file + "\n")
+        logging.info(" Files to retry : %s (see %s, organize them again with --files-from)", len(self.retry), path)
 
-    def move_images(self, args: List[Tuple[str, str]]):
+    def link_duplicates(self, duplicates: Dict[FileRecord, FileRecord]) -> None:
+        # Once their originals are organized: a hard link at the destination of each duplicate
+        links = []
+        for duplicate, original in duplicates.items():
+            if original.path in self.retry:
+                self._retry_later(duplicate, "copy", OSError("%s, of the same content, was not copied" % original.path))
+                continue
+            source = self.targets.get(original.path, original.destination + original.name)
+            if source != duplicate.destination + duplicate.name:
+                links.append((duplicate, source))
+        # Copied when they can not be linked, with the deadline of a copy
+        linkers = DeadlinePool(lambda args: self.linker.place_unique(args[1], args[0].destination + args[0].name),
+                               COPY_WORKERS, "link")
+        try:
+            for (duplicate, _), _, error in linkers.run(links, self._copy_timeout):
+                if error is not None:
+                    self._retry_later(duplicate, "link", error)
+        finally:
+            linkers.close()
+
+    def flush(self) -> None:
+        # Syncs the directories of the files moved and deletes their sources, the sources are kept when it stalls
+        flushers = DeadlinePool(lambda placer: placer.flush(), 1, "flush")
+        try:
+            for _, _, error in flushers.run([self.placer], lambda placer: self.file_timeout):
+                if error is not None:
+                    logging.warning("[-] Unable to delete the sources of the moved files, they are kept: %s",
+                                    str(error) or type(error).__name__)
+        finally:
+            flushers.close()
+
+    def move_images(self, args: Tuple[FileRecord, str]):
         image, destination = args
+        self._organize(image, destination)
+        self.progress_bar_files.update()
+
+    def process_file(self, image: FileRecord, destination: str) -> None:
+        # Organizes a single file, creating its directories on demand (used by the watch mode)
+        if self.validator is not None:
+            self.validator.check(image)
+        directory = self._organize(image, destination, create_directories=True)
+        self.flush()
+        logging.info(" |- %s -> %s", image.path, directory)
+
+    def plan(self, image: FileRecord, destination: str) -> Tuple[str, str]:
+        # The directory of the file is kept on the record, the copy phase does not read it again
         date, model = self.modification_date(image)
-        destination += date + os.path.sep
+        image.destination = destination + date + os.path.sep
         if model:
-            destination += model + os.path.sep
+            image.destination += model + os.path.sep
+        return date, model
 
-        self._copy_file(image, destination)
-        self.progress_bar_files.update()
+    def _organize(self, image: FileRecord, destination: str, create_directories: bool = False) -> str:
+        if image.destination is None:
+            self.plan(image, destination)
+        destination = image.destination
+        if create_directories:
+            os.makedirs(destination, exist_ok=True)
+
+        target = destination + image.name
+        if self.index is not None and self.index.is_organized(image.path, self.targets.get(image.path, target)):
+            logging.debug("[-] Already organized %s", image.path)
+        else:
+            placed = self._copy_file(image, destination) or target
+            if placed != target:
+                with self._reads_lock:
+                    self.targets[image.path] = placed
+            if self.index is not None:
+                self.index.mark_organized(image.path, placed)
+        return destination
+
+    def _copy_file(self, image: FileRecord, destination: str) -> Optional[str]:
+        # Placed with the modes of the placer (copied by default), where the file is
+        return self.placer.place_unique(image.path, destination + image.name, image.device)[0]
+
+    def reporting_copies(self, seconds: float) -> None:
+        if self.placer.modes != (COPY,):
+            for mode in MODES:
+                if self.placer.placed[mode]:
+                    logging.info(" |- %s : %s files", VERBS[mode].capitalize(), self.placer.placed[mode])
+        if self.placer.renamed:
+            logging.info(" Renamed : %s files", self.placer.renamed)
+        if self.placer.existing:
+            logging.info(" Already at their destination : %s files", self.placer.existing)
+        if self.placer.suffixed:
+            logging.info(" Suffixed, another file had their name : %s files", self.placer.suffixed)
+        copier = self.placer.copier
+        copied = sum(copier.bytes.values())
+        if not copied:
+            return
+        logging.info(" Copied : %s in %.1fs (%s/s)", format_size(copied), seconds,
+                     format_size(copied / max(seconds, 1e-3)))
+        for strategy in STRATEGIES:
+            if copier.files[strategy]:
+                logging.info(" |- %s : %s files, %s", strategy, copier.files[strategy],
+                             format_size(copier.bytes[strategy]))
+        if MOVE in self.placer.modes:
+            logging.info(" Sources deleted after their copy : %s", self.placer.deleted)
+
+    def reporting_duplicates(self) -> None:
+        deduplicator = self.deduplicator
+        logging.info(" Duplicates : %s files, %s saved", deduplicator.duplicates, format_size(deduplicator.saved))
+        for mode in (HARDLINK, SYMLINK, COPY):
+            if self.linker.placed[mode]:
+                logging.info(" |- %s : %s files", mode, self.linker.placed[mode])
+        logging.info(" |- Hashed : %s files on their first and last %s, %s in full (%s read)",
+                     deduplicator.hashed["partial"], format_size(PARTIAL_SIZE), deduplicator.hashed["full"],
+                     format_size(deduplicator.read))
 
-    def _copy_file(self, image, destination):
-        copyfile(image, destination + Path(image).name)
+    def modification_date(self, file: FileRecord) -> Tuple[str, str]:
+        if file.date is not None:
+            return self._planned(file)
+        if self._date_from_name(file):
+            return self._planned(file)
+        if self.index is not None:
+            if file.mtime_ns is None:
+                file.load_stat()
+            if self._lookup(file):
+                return self._planned(file)
 
-    def modification_date(self, file: str) -> Tuple[str, str]:
+        self._count_read()
         exif_raw, date = self._modify_date(file)
-        model = self.get_data(exif_raw, "Model")
-        date = str(date.year) + '-' + str(date.month).zfill(2) + '-' + str(date.day).zfill(2)
-        return date, model
+        self._set_metadata(file, capture_time(exif_raw), self.get_data(exif_raw, "Model"), date)
+        if self.index is not None:
+            self.index.store(file)
+        return self._planned(file)
 
-    def _modify_date(self, file):
-        t = os.path.getmtime(file)
+    def _planned(self, file: FileRecord) -> Tuple[str, Optional[str]]:
+        # The record (and the index) keep the model read even when it is not wanted
+        return file.date, file.model if self.with_model else None
+
+    def _set_metadata(self, file: FileRecord, captured: Optional[datetime], model: Optional[str],
+                      modified: datetime) -> None:
+        # Files are routed by capture time, the modification date changes with every copy
+        named = self.filename_dates.match(file.name) if captured is None else None
+        file.model = model
+        file.date = self.format_date(captured or named or modified)
+        self._count_source(CAPTURE_TIME if captured else FILENAME if named else MODIFICATION_TIME)
+
+    def _date_from_name(self, file: FileRecord) -> bool:
+        # Checked before any read, only when the model is not wanted: the name does not hold it
+        if self.with_model:
+            return False
+        date = self.filename_dates.match(file.name)
+        if date is not None:
+            file.date, file.model = self.format_date(date), None
+            self._count_source(FILENAME)
+        return date is not None
+
+    def _lookup(self, file: FileRecord) -> bool:
+        entry = self.index.lookup(file)
+        if entry:
+            file.date, file.model = entry.date, entry.model
+            self._count_source(INDEX)
+        return entry is not None
+
+    def _count_source(self, source: str) -> None:
+        with self._reads_lock:
+            self.date_sources[source] += 1
+
+    def _count_read(self) -> None:
+        with self._reads_lock:
+            self.metadata_reads += 1
+
+    @staticmethod
+    def format_date(date: datetime) -> str:
+        return str(date.year) + '-' + str(date.month).zfill(2) + '-' + str(date.day).zfill(2)
+
+    def _modify_date(self, file: FileRecord):
+        t = file.mtime if file.mtime_ns is not None else os.path.getmtime(file.path)
         date = datetime.fromtimestamp(t)
-        exif_raw = self.get_exif(file)
+        exif_raw = self.get_exif(file.path, self.mapped_reads)
         return exif_raw, date
 
     @staticmethod
-    def get_exif(image: str) -> Optional[Exif]:
-        exif_raw = None
-        try:
-            img = Image.open(image)
-            exif_raw = img.getexif()
-        except UnidentifiedImageError:
-            pass
-        return exif_raw
+    def get_exif(image: str, mapped: bool = False) -> Dict[int, Any]:
+        # Only the file header is read by the extractor of its format, formats without metadata are not opened
+        return registry.extract(image, mapped=mapped)
 
     @staticmethod
-    def get_data(exif_raw: Optional[Exif], field: str) -> str:
-        model = None
-        if exif_raw:
-            for tag, value in exif_raw.items():
-                decoded_tag = ExifTags.TAGS.get(tag, tag)
-                if field == decoded_tag:
-                    model = (value.replace(" ", "")).lower()
-        return model
+    def get_data(exif_raw: Optional[Dict[int, Any]], field: str) -> Optional[str]:
+        value = exif_raw.get(TAG_IDS[field]) if exif_raw else None
+        return value.replace(" ", "").lower() or None if isinstance(value, str) else None
 
 
 class FileProcessorWin32(FileProcessor):
@@ -118,13 +489,19 @@ class FileProcessorWin32(FileProcessor):
     This class holds the specific logic needed for win32
     """
 
-    def _copy_file(self, image, destination):
+    def _copy_file(self, image: FileRecord, destination: str):
         import src.mtp_windows
 
-        cont = src.mtp_windows.get_content_from_device_path(image)
-        target_file = open(destination + cont.getName(), "wb")
-        cont.downloadStream(target_file)
-        target_file.close()
+        cont = src.mtp_windows.get_content_from_device_path(image.path)
+        target = destination + cont.getName()
+        target_file = open(target, "wb")
+        try:
+            with target_file:
+                cont.downloadStream(target_file)
+        except BaseException:
+            # A partial download would be taken for the file by a rerun
+            os.remove(target)
+            raise
 
     def _modify_date(self, file):
         exif_raw = None
@@ -132,13 +509,10 @@ class FileProcessorWin32(FileProcessor):
         try:
             import src.mtp_windows
 
-            cont = src.mtp_windows.get_content_from_device_path(file)
-            buffer = cont.read_data()
-            byte_imge_io = io.BytesIO(buffer)
-            byte_imge_io.seek(0)
-            byte_image = byte_imge_io.read()
-            img = Image.open(io.BytesIO(byte_image))
-            exif_raw = img.getexif()
+            cont = src.mtp_windows.get_content_from_device_path(file.path)
+            # The content is downloaded from the device, only when its format can have metadata
+            if registry.has_metadata(file.path):
+                exif_raw = registry.extract_bytes(cont.read_data(), file.extension)
             date = cont.getDate()
         except Exception as e:
             logging.error(e)
@@ -0,0 +1,55 @@
+import os
+import sys
+from typing import Optional
+
+
+class FileRecord:
+    """
+    A file going through the pipeline. It is created once (by the scanner) with the stat
+    information, and the later stages fill in the date, model and destination, so nothing
+    is derived twice.
+    """
+
+    __slots__ = ("path", "size", "mtime_ns", "inode", "device", "extension", "date", "model", "destination")
+
+    def __init__(self, path: str, size: int = 0, mtime_ns: Optional[int] = None, inode: int = 0, device: int = 0):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.device = device
+        # Interned, there are only a handful of different extensions in millions of files
+        self.extension = sys.intern(os.path.splitext(path)[1].lower())
+        self.date: Optional[str] = None
+        self.model: Optional[str] = None
+        self.destination: Optional[str] = None
+
+    @classmethod
+    def from_stat(cls, path: str, stat: os.stat_result) -> "FileRecord":
+        return cls(path, stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+
+    @classmethod
+    def from_path(cls, path: str) -> "FileRecord":
+        return cls.from_stat(path, os.stat(path))
+
+    def load_stat(self) -> None:
+        # For the records created from a bare path
+        stat = os.stat(self.path)
+        self.size, self.mtime_ns, self.inode, self.device = stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev
+
+    @property
+    def mtime(self) -> Optional[float]:
+        return self.mtime_ns / 1e9 if self.mtime_ns is not None else None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FileRecord) and self.path == other.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __repr__(self) -> str:
+        return "FileRecord(%r, size=%r)" % (self.path, self.size)
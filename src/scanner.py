@@ -0,0 +1,181 @@
+import copy
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.constants import DEFAULT_SCAN_WORKERS
+from src.patterns import PathMatcher
+from src.record import FileRecord
+
+QUEUE_SIZE = 10000
+
+
+def group_by_device(paths: Iterable[str]) -> Dict[int, List[str]]:
+    groups: Dict[int, List[str]] = {}
+    for path in paths:
+        try:
+            device = os.stat(path).st_dev
+        except OSError as err:
+            logging.warning("[-] Unable to read %s: %s", path, err)
+            continue
+        groups.setdefault(device, []).append(path)
+    return groups
+
+
+def remove_nested(paths: List[str]) -> List[str]:
+    # Drops duplicated paths and the ones inside another path, so no file is listed twice
+    prefixes = [os.path.normcase(os.path.abspath(path)).rstrip(os.path.sep) + os.path.sep for path in paths]
+    roots = []
+    seen = set()
+    for path, prefix in zip(paths, prefixes):
+        if prefix in seen:
+            continue
+        if any(prefix != other and prefix.startswith(other) for other in prefixes):
+            logging.info(" |- %s is already inside another source", path)
+            continue
+        seen.add(prefix)
+        roots.append(path)
+    return roots
+
+
+class Scanner:
+    """
+    Walks a directory tree with os.scandir, listing the sub directories in parallel.
+    Files are streamed as soon as the directory holding them has been listed.
+
+    Excluded, hidden, too deep and explicitly skipped directories are pruned before
+    being listed, the number of pruned directories of the last scan is kept in
+    pruned_directories.
+    """
+
+    def __init__(self, workers: int = DEFAULT_SCAN_WORKERS, excludes: Iterable[str] = (),
+                 includes: Iterable[str] = (), max_depth: Optional[int] = None, skip_hidden: bool = False,
+                 skip_paths: Iterable[str] = ()):
+        self.workers = max(1, workers)
+        # Includes are applied after the excludes so they can re-include what was excluded
+        self.matcher = PathMatcher(list(excludes) + ["!" + pattern for pattern in includes])
+        self.max_depth = max_depth
+        self.skip_hidden = skip_hidden
+        self.skip_paths = {self._normalize(path) for path in skip_paths if path}
+        self.pruned_directories = 0
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def scan(self, root: str) -> Iterator[FileRecord]:
+        self.pruned_directories = 0
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scanner")
+        try:
+            pending = {executor.submit(self.list_directory, root, "", 0)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, directories, pruned = future.result()
+                    self.pruned_directories += pruned
+                    for directory, relative_path, depth in directories:
+                        pending.add(executor.submit(self.list_directory, directory, relative_path, depth))
+                    yield from files
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def scan_many(self, roots: Iterable[str]) -> Iterator[FileRecord]:
+        # Roots on the same device are scanned one after the other and every device in parallel,
+        # each one with its own pool of workers so the disks do not seek against each other
+        groups = group_by_device(remove_nested(list(roots)))
+        if len(groups) <= 1:
+            pruned = 0
+            for device_roots in groups.values():
+                for root in device_roots:
+                    yield from self.scan(root)
+                    pruned += self.pruned_directories
+            self.pruned_directories = pruned
+            return
+
+        entries: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        stop = threading.Event()
+        scanners = [copy.copy(self) for _ in groups]
+        threads = [
+            threading.Thread(target=self._scan_device, args=(scanner, device_roots, entries, stop),
+                             name="scanner-%s" % device, daemon=True)
+            for scanner, (device, device_roots) in zip(scanners, groups.items())
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            running = len(threads)
+            while running:
+                entry = entries.get()
+                if entry is None:
+                    running -= 1
+                elif isinstance(entry, BaseException):
+                    raise entry
+                else:
+                    yield entry
+        finally:
+            stop.set()
+            self.pruned_directories = sum(scanner.pruned_directories for scanner in scanners)
+
+    @staticmethod
+    def _scan_device(scanner: "Scanner", roots: List[str], entries: queue.Queue, stop: threading.Event) -> None:
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    entries.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        pruned = 0
+        try:
+            for root in roots:
+                for entry in scanner.scan(root):
+                    if not put(entry):
+                        return
+                pruned += scanner.pruned_directories
+            scanner.pruned_directories = pruned
+        except Exception as err:
+            put(err)
+        finally:
+            put(None)
+
+    def is_pruned(self, name: str, path: str, relative_path: str, depth: int) -> bool:
+        if self.max_depth is not None and depth > self.max_depth:
+            return True
+        if self.skip_hidden and name.startswith("."):
+            return True
+        if self.matcher and self.matcher.is_excluded(relative_path, True):
+            return True
+        return bool(self.skip_paths) and self._normalize(path) in self.skip_paths
+
+    def is_excluded_file(self, relative_path: str) -> bool:
+        return bool(self.matcher) and self.matcher.is_excluded(relative_path, False)
+
+    def list_directory(self, path: str, relative_path: str,
+                       depth: int) -> Tuple[List[FileRecord], List[Tuple[str, str, int]], int]:
+        files = []
+        directories = []
+        pruned = 0
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    entry_relative_path = relative_path + entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.is_pruned(entry.name, entry.path, entry_relative_path, depth + 1):
+                                pruned += 1
+                            else:
+                                directories.append((entry.path, entry_relative_path + "/", depth + 1))
+                        elif entry.is_file():
+                            if self.is_excluded_file(entry_relative_path):
+                                continue
+                            files.append(FileRecord.from_stat(entry.path, entry.stat()))
+                    except OSError as err:
+                        logging.warning("[-] Unable to read %s: %s", entry.path, err)
+        except OSError as err:
+            logging.warning("[-] Unable to list %s: %s", path, err)
+        return files, directories, pruned
@@ -0,0 +1,37 @@
+import os
+from typing import Optional, Union
+
+
+class Source:
+    """
+    Random access to a file through a prefix read once. Reads past the prefix (a RAW file
+    with its IFD0 strings far away, a video with its moov box at the end) seek in the file.
+
+    The data can also be a memoryview of the whole file mapped in memory, the reads are then
+    views of the mapping instead of copies.
+    """
+
+    def __init__(self, data: Union[bytes, memoryview], file=None):
+        self.data = data
+        self.file = file
+        self._size: Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        if self.file is None:
+            return len(self.data)
+        if self._size is None:
+            self._size = os.fstat(self.file.fileno()).st_size
+        return self._size
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        # The offsets and sizes come from the file: the reads are bounded by its size, short or empty past its end
+        if offset < 0 or size <= 0:
+            return b""
+        end = offset + size
+        if end <= len(self.data) or self.file is None:
+            return self.data[offset:end]
+        if offset >= self.size:
+            return b""
+        self.file.seek(offset)
+        return self.file.read(min(size, self.size - offset))
@@ -0,0 +1,61 @@
+from typing import Dict, Tuple
+
+from src.record import FileRecord
+
+
+class ExtensionStats:
+    __slots__ = ("files", "size")
+
+    def __init__(self):
+        self.files = 0
+        self.size = 0
+
+
+class ScanSummary:
+    """
+    Per extension file counts and byte totals, built in the same pass that lists the files
+    """
+
+    def __init__(self, extensions: Tuple[str, ...]):
+        self.extensions = extensions
+        self.matched: Dict[str, ExtensionStats] = {}
+        self.unmatched: Dict[str, ExtensionStats] = {}
+        self.pruned_directories = 0
+
+    def add(self, record: FileRecord) -> bool:
+        is_matched = record.extension in self.extensions
+        histogram = self.matched if is_matched else self.unmatched
+        stats = histogram.get(record.extension)
+        if stats is None:
+            stats = histogram[record.extension] = ExtensionStats()
+        stats.files += 1
+        stats.size += record.size
+        return is_matched
+
+    @staticmethod
+    def _files(histogram: Dict[str, ExtensionStats]) -> int:
+        return sum(stats.files for stats in histogram.values())
+
+    @staticmethod
+    def _size(histogram: Dict[str, ExtensionStats]) -> int:
+        return sum(stats.size for stats in histogram.values())
+
+    @property
+    def matched_files(self) -> int:
+        return self._files(self.matched)
+
+    @property
+    def unmatched_files(self) -> int:
+        return self._files(self.unmatched)
+
+    @property
+    def total_files(self) -> int:
+        return self.matched_files + self.unmatched_files
+
+    @property
+    def matched_size(self) -> int:
+        return self._size(self.matched)
+
+    @property
+    def unmatched_size(self) -> int:
+        return self._size(self.unmatched)
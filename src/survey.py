@@ -0,0 +1,124 @@
+import bisect
+import heapq
+import os
+import time
+from typing import Any, Dict, Iterable, List
+
+from src.record import FileRecord
+from src.scanner import Scanner
+from src.summary import ScanSummary
+from src.utils import format_size
+
+SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3, 4 * 1024 ** 3)
+FAN_OUT_BUCKETS = (10, 100, 1000, 10000, 100000)
+DEFAULT_FILES_PER_SECOND = 200.0
+DEFAULT_THROUGHPUT = 100.0 * 1024 ** 2
+
+
+def _bucket_labels(buckets: Iterable[int], formatter) -> List[str]:
+    labels = []
+    lower = None
+    for upper in buckets:
+        labels.append("< " + formatter(upper) if lower is None else formatter(lower) + " - " + formatter(upper))
+        lower = upper
+    labels.append(">= " + formatter(lower))
+    return labels
+
+
+class Survey:
+    """
+    Profile of a source tree built from the stat information of the scanner only,
+    no file is opened
+    """
+
+    def __init__(self, extensions: tuple, top: int = 10):
+        self.summary = ScanSummary(extensions)
+        self.top = top
+        self.size_files = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_bytes = [0] * (len(SIZE_BUCKETS) + 1)
+        self.years: Dict[int, int] = {}
+        self.oldest = None
+        self.newest = None
+        self.directories: Dict[str, List[int]] = {}
+
+    def add(self, record: FileRecord) -> None:
+        self.summary.add(record)
+        bucket = bisect.bisect_right(SIZE_BUCKETS, record.size)
+        self.size_files[bucket] += 1
+        self.size_bytes[bucket] += record.size
+
+        mtime = record.mtime
+        year = time.localtime(mtime).tm_year
+        self.years[year] = self.years.get(year, 0) + 1
+        if self.oldest is None or mtime < self.oldest:
+            self.oldest = mtime
+        if self.newest is None or mtime > self.newest:
+            self.newest = mtime
+
+        parent = os.path.dirname(record.path)
+        directory = self.directories.get(parent)
+        if directory is None:
+            directory = self.directories[parent] = [0, 0]
+        directory[0] += 1
+        directory[1] += record.size
+
+    def to_dict(self, elapsed: float, files_per_second: float = DEFAULT_FILES_PER_SECOND,
+                throughput: float = DEFAULT_THROUGHPUT) -> Dict[str, Any]:
+        fan_out = [0] * (len(FAN_OUT_BUCKETS) + 1)
+        for files, _ in self.directories.values():
+            fan_out[bisect.bisect_right(FAN_OUT_BUCKETS, files)] += 1
+        largest = heapq.nlargest(self.top, self.directories.items(), key=lambda item: item[1][1])
+        summary = self.summary
+
+        return {
+            "files": summary.total_files,
+            "bytes": summary.matched_size + summary.unmatched_size,
+            "matched_files": summary.matched_files,
+            "matched_bytes": summary.matched_size,
+            "pruned_directories": summary.pruned_directories,
+            "scan_seconds": round(elapsed, 3),
+            "scan_files_per_second": round(summary.total_files / elapsed) if elapsed else None,
+            "size_histogram": [
+                {"range": label, "files": files, "bytes": size}
+                for label, files, size in zip(
+                    _bucket_labels(SIZE_BUCKETS, format_size), self.size_files, self.size_bytes
+                )
+            ],
+            "extensions": {
+                extension or "(none)": {"files": stats.files, "bytes": stats.size, "matched": histogram is summary.matched}
+                for histogram in (summary.matched, summary.unmatched)
+                for extension, stats in sorted(histogram.items(), key=lambda item: item[1].size, reverse=True)
+            },
+            "mtime": {
+                "oldest": _isoformat(self.oldest),
+                "newest": _isoformat(self.newest),
+                "years": {str(year): files for year, files in sorted(self.years.items())},
+            },
+            "directories": {
+                "with_files": len(self.directories),
+                "max_files": max((files for files, _ in self.directories.values()), default=0),
+                "files_per_directory": dict(zip(_bucket_labels(FAN_OUT_BUCKETS, str), fan_out)),
+                "largest": [
+                    {"path": path, "files": files, "bytes": size} for path, (files, size) in largest
+                ],
+            },
+            "estimate": {
+                "files_per_second": files_per_second,
+                "bytes_per_second": throughput,
+                "seconds": round(summary.matched_files / files_per_second + summary.matched_size / throughput),
+            },
+        }
+
+
+def _isoformat(timestamp) -> Any:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp)) if timestamp is not None else None
+
+
+def survey(scanner: Scanner, source: str, extensions: tuple, top: int = 10,
+           files_per_second: float = DEFAULT_FILES_PER_SECOND, throughput: float = DEFAULT_THROUGHPUT) -> Dict[str, Any]:
+    result = Survey(extensions, top)
+    start = time.monotonic()
+    for record in scanner.scan(source):
+        result.add(record)
+    result.summary.pruned_directories = scanner.pruned_directories
+    return result.to_dict(time.monotonic() - start, files_per_second, throughput)
@@ -24,3 +24,21 @@ class WaitingEffect:
             if self.position > 3:
                 self.position = 0
         sys.stdout.flush()
+
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if abs(size) < 1024 or unit == 'TB':
+            break
+        size /= 1024
+    return '{:.0f} {}'.format(size, unit) if unit == 'B' else '{:.1f} {}'.format(size, unit)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{}h {:02d}m'.format(hours, minutes)
+    if minutes:
+        return '{}m {:02d}s'.format(minutes, seconds)
+    return '{}s'.format(seconds)
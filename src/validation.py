@@ -0,0 +1,213 @@
+import collections
+import logging
+import os
+import struct
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from src.deadline import DeadlinePool
+from src.exif import JPEG_EOI, JPEG_SOS, is_jpeg
+from src.extraction import ExtractionPool
+from src.extractors import PREFIX_SIZE
+from src.media import boxes, is_heif, is_iso_bmff
+from src.record import FileRecord
+from src.source import Source
+
+QUARANTINE = "quarantine"
+REPORT_NAME = "report.txt"
+# Bytes read at the end of a JPEG looking for its EOI marker, followed by the zero padding or the trailer
+# (Samsung image data, a thumbnail) some cameras add
+TAIL_SIZE = 4096
+# Samsung trailers, of any size, end with their signature
+SAMSUNG_TRAILER = b"SEFT"
+# Markers without a length: TEM and RST0-RST7
+STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+# Motion photos append a video after the EOI of the picture and say so in their XMP
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+MOTION_PHOTO_TAGS = (b"MotionPhoto", b"MicroVideo")
+
+
+def check_structure(path: str) -> Optional[str]:
+    # Why the file is corrupted, None when its structure looks sound. Only headers are read, nothing is decoded
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return "empty file"
+        source = Source(file.read(PREFIX_SIZE), file)
+        header = source.read_at(0, 16)
+        try:
+            if is_jpeg(header):
+                return check_jpeg(source, size)
+            if is_heif(header) or is_iso_bmff(header):
+                return check_iso_bmff(source, size, is_heif(header))
+        except struct.error:
+            return "truncated header"
+    return None
+
+
+def check_jpeg(source: Source, size: int) -> Optional[str]:
+    # The segments before the scan must fit in the file and the file must end with an EOI marker
+    offset = 2
+    motion_photo = False
+    while True:
+        marker = source.read_at(offset, 4)
+        if len(marker) < 4:
+            return "truncated before the image data"
+        if marker[0] != 0xFF:
+            return "invalid marker at offset %s" % offset
+        if marker[1] == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker[1] in STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker[1] == JPEG_EOI:
+            return "no image data"
+        length = struct.unpack(">H", marker[2:])[0]
+        if length < 2 or offset + 2 + length > size:
+            return "invalid segment length at offset %s" % offset
+        if marker[1] == 0xE1 and not motion_photo and source.read_at(offset + 4, len(XMP_HEADER)) == XMP_HEADER:
+            segment = source.read_at(offset + 4, length - 2)
+            motion_photo = any(tag in segment for tag in MOTION_PHOTO_TAGS)
+        if marker[1] == JPEG_SOS:
+            break
+        offset += 2 + length
+    if motion_photo:
+        return None
+    tail = source.read_at(max(offset, size - TAIL_SIZE), TAIL_SIZE)
+    if tail.endswith(SAMSUNG_TRAILER) or tail.rfind(b"\xff\xd9") >= 0:
+        return None
+    return "truncated image data (no EOI marker)"
+
+
+def check_iso_bmff(source: Source, size: int, heif: bool) -> Optional[str]:
+    # The top level boxes must tile the file, a video needs its moov box and a HEIF image its meta box. They are all
+    # walked (a fragmented video has a moof and a mdat box per fragment), only their headers are read
+    offset = 0
+    kinds = set()
+    for kind, _, end in boxes(source, 0, None, limit=None):
+        end = size if end is None else end
+        if end > size:
+            return "%s box past the end of the file" % kind.decode("latin-1")
+        kinds.add(kind)
+        offset = end
+    if offset != size:
+        return "invalid box at offset %s" % offset
+    required = b"meta" if heif else b"moov"
+    if required not in kinds:
+        return "no %s box" % required.decode()
+    return None
+
+
+def verify_images(batch: List[str]) -> List[str]:
+    # Runs in the verification processes: paths in, why each image is corrupted out ("" when it is not)
+    from PIL import Image, UnidentifiedImageError
+
+    results = []
+    for path in batch:
+        try:
+            # verify() checks the structure without decoding (the CRCs of a PNG), load() decodes the pixels
+            with Image.open(path) as image:
+                image.verify()
+            with Image.open(path) as image:
+                image.load()
+            results.append("")
+        except UnidentifiedImageError:
+            # Videos and sounds, the structural checks are all there is for them
+            results.append("")
+        except Exception as err:
+            results.append(str(err) or type(err).__name__)
+    return results
+
+
+class Validator:
+    """
+    Screens the files before they are organized. The structural checks are cheap and always
+    run, the deep verification decodes the images in a pool of processes.
+
+    A corrupted file is routed to the quarantine directory instead of its date directory and
+    listed, with the reason, in the report of the quarantine (one tab separated line per file).
+    The structural checks run with the deadline of a file read: a file on a stalled share is
+    abandoned, not quarantined.
+    """
+
+    def __init__(self, directory: str, deep_workers: int = 0, file_timeout: Optional[float] = None):
+        self.directory = directory
+        self.file_timeout = file_timeout
+        self.pool = ExtractionPool(verify_images, deep_workers) if deep_workers > 0 else None
+        self.quarantined = 0
+        self._lock = threading.Lock()
+
+    @property
+    def report(self) -> str:
+        return os.path.join(self.directory, REPORT_NAME)
+
+    def check(self, image: FileRecord) -> bool:
+        # Screens a single file (used by the watch mode)
+        return any(True for _ in self.screen([image]))
+
+    def screen(self, images: Iterable[FileRecord], rejected: Optional[Callable[[FileRecord], None]] = None,
+               stalled: Optional[Callable[[FileRecord, BaseException], None]] = None) -> Iterator[FileRecord]:
+        # Yields the sound files, in order when there is no deep verification. The files whose check
+        # did not end before the deadline go to stalled
+        pending = collections.deque()
+
+        def collect(task, batch: List[FileRecord]) -> Iterator[FileRecord]:
+            for image, reason in zip(batch, self.pool.result(task)):
+                if reason == "":
+                    yield image
+                    continue
+                self.quarantine(image, reason or "crashed the verification")
+                if rejected is not None:
+                    rejected(image)
+
+        batch = []
+        checks = DeadlinePool(self._check_structure, 1, "validator")
+        try:
+            for image, reason, error in checks.run(images, lambda image: self.file_timeout):
+                if error is not None:
+                    if stalled is not None:
+                        stalled(image, error)
+                    else:
+                        logging.warning("[-] Unable to check %s: %s", image.path, error)
+                elif reason is not None:
+                    self.quarantine(image, reason)
+                    if rejected is not None:
+                        rejected(image)
+                elif self.pool is None:
+                    yield image
+                else:
+                    batch.append(image)
+                    if len(batch) >= self.pool.batch_size:
+                        pending.append((self.pool.submit([i.path for i in batch]), batch))
+                        batch = []
+                        while len(pending) > self.pool.max_pending:
+                            yield from collect(*pending.popleft())
+        finally:
+            checks.close()
+        if batch:
+            pending.append((self.pool.submit([i.path for i in batch]), batch))
+        while pending:
+            yield from collect(*pending.popleft())
+
+    @staticmethod
+    def _check_structure(image: FileRecord) -> Optional[str]:
+        try:
+            return check_structure(image.path)
+        except OSError as err:
+            return "unreadable: %s" % err
+
+    def quarantine(self, image: FileRecord, reason: str) -> None:
+        # The file is copied to the quarantine by the copy phase, like any other file
+        logging.warning("[-] Quarantined %s: %s", image.path, reason)
+        image.destination = self.directory.rstrip(os.path.sep) + os.path.sep
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.report, "a", encoding="utf-8") as report:
+                report.write("%s\t%s\n" % (image.path, reason))
+            self.quarantined += 1
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
@@ -0,0 +1,305 @@
+import abc
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from src.scanner import Scanner
+
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_SETTLE_TIME = 2.0
+
+NETWORK_FILESYSTEMS = (
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', '9p', 'ceph', 'glusterfs', 'fuse.sshfs', 'fuse.rclone',
+)
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")
+# Files whose events were lost in a queue overflow are found by their mtime, some file systems only keep it to 2s
+MTIME_MARGIN = 2.0
+
+
+class PendingFiles:
+    """
+    Files that arrived but may still be written. A file is ready once its size and mtime
+    have not changed for settle seconds.
+    """
+
+    def __init__(self, settle: float = DEFAULT_SETTLE_TIME):
+        self.settle = settle
+        self.files: Dict[str, Tuple[int, int, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def touch(self, path: str, now: Optional[float] = None) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.files.pop(path, None)
+            return
+        self.files[path] = (stat.st_size, stat.st_mtime_ns, time.monotonic() if now is None else now)
+
+    def ready(self, now: Optional[float] = None) -> List[str]:
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path, (size, mtime_ns, since) in list(self.files.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.files[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.files[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - since >= self.settle:
+                del self.files[path]
+                ready.append(path)
+        return ready
+
+
+class Watcher(abc.ABC):
+    """
+    Base class of the watchers, calls on_file for every file that lands in the source tree
+    once it is completely written
+    """
+
+    def __init__(self, root: str, scanner: Scanner, settle: float = DEFAULT_SETTLE_TIME):
+        self.root = root
+        self.scanner = scanner
+        self.pending = PendingFiles(settle)
+
+    @abc.abstractmethod
+    def step(self, timeout: float) -> List[str]:
+        pass
+
+    def run(self, on_file: Callable[[str], None], timeout: float = 1.0) -> None:
+        watch([self], on_file, timeout)
+
+    def close(self) -> None:
+        pass
+
+
+class PollingWatcher(Watcher):
+    """
+    Fallback for network mounts where inotify events are not delivered. Only the directories
+    whose mtime changed since the previous poll are listed again.
+    """
+
+    def __init__(self, root: str, scanner: Scanner, settle: float = DEFAULT_SETTLE_TIME,
+                 interval: float = DEFAULT_POLL_INTERVAL):
+        super().__init__(root, scanner, settle)
+        self.interval = interval
+        self.directories: Dict[str, Tuple[str, int, int]] = {}
+        self.known: Dict[str, Set[str]] = {}
+        self._last_poll = 0.0
+        self._add_directory(root, "", 0, initial=True)
+
+    def _add_directory(self, path: str, relative_path: str, depth: int, initial: bool = False) -> None:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        self.directories[path] = (relative_path, depth, mtime_ns)
+        self._list(path, relative_path, depth, initial)
+
+    def _list(self, path: str, relative_path: str, depth: int, initial: bool) -> None:
+        files, directories, _ = self.scanner.list_directory(path, relative_path, depth)
+        names = set()
+        previous = self.known.get(path, set())
+        for entry in files:
+            names.add(entry.path)
+            if not initial and entry.path not in previous:
+                self.pending.touch(entry.path)
+        self.known[path] = names
+        for directory, directory_relative_path, directory_depth in directories:
+            if directory not in self.directories:
+                self._add_directory(directory, directory_relative_path, directory_depth, initial)
+
+    def step(self, timeout: float) -> List[str]:
+        remaining = self._last_poll + self.interval - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(remaining, timeout))
+        else:
+            self._last_poll = time.monotonic()
+            self._poll_directories()
+        return self.pending.ready()
+
+    def _poll_directories(self) -> None:
+        for path, (relative_path, depth, mtime_ns) in list(self.directories.items()):
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                del self.directories[path]
+                self.known.pop(path, None)
+                continue
+            if current != mtime_ns:
+                self.directories[path] = (relative_path, depth, current)
+                self._list(path, relative_path, depth, initial=False)
+
+
+class InotifyWatcher(Watcher):
+    """
+    Linux watcher subscribing to inotify events on every (not pruned) directory of the tree
+    """
+
+    def __init__(self, root: str, scanner: Scanner, settle: float = DEFAULT_SETTLE_TIME):
+        super().__init__(root, scanner, settle)
+        self.libc = _load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, Tuple[str, str, int]] = {}
+        # Wall clock time of the last read of the queue, the events up to it have been handled
+        self._last_read = time.time()
+        try:
+            self._add_directory(root, "", 0, initial=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_directory(self, path: str, relative_path: str, depth: int, initial: bool = False) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for %s" % path)
+        self.watches[wd] = (path, relative_path, depth)
+        files, directories, _ = self.scanner.list_directory(path, relative_path, depth)
+        if not initial:
+            # Files created before the watch was in place do not generate events
+            for entry in files:
+                self.pending.touch(entry.path)
+        for directory, directory_relative_path, directory_depth in directories:
+            self._add_directory(directory, directory_relative_path, directory_depth, initial)
+
+    def step(self, timeout: float) -> List[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout if len(self.pending) == 0 else min(timeout, 0.5))
+        if readable:
+            self._read_events()
+        return self.pending.ready()
+
+    def _read_events(self) -> None:
+        read_at = time.time()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            self._handle_event(wd, mask, name)
+        self._last_read = read_at
+
+    def _handle_event(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            # The lost events all came after the previous read emptied the queue
+            logging.warning("[-] inotify queue overflow, listing the whole tree again")
+            since_ns = int((self._last_read - MTIME_MARGIN) * 1e9)
+            for path, relative_path, depth in list(self.watches.values()):
+                files, _, _ = self.scanner.list_directory(path, relative_path, depth)
+                for entry in files:
+                    if entry.mtime_ns is None or entry.mtime_ns >= since_ns:
+                        self.pending.touch(entry.path)
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        if wd not in self.watches:
+            return
+        parent, relative_path, depth = self.watches[wd]
+        path = os.path.join(parent, name)
+        if mask & IN_ISDIR:
+            # Only the directories a scan would descend into are watched
+            if mask & (IN_CREATE | IN_MOVED_TO) and not self.scanner.is_pruned(
+                name, path, relative_path + name, depth + 1
+            ):
+                try:
+                    self._add_directory(path, relative_path + name + "/", depth + 1)
+                except OSError as err:
+                    logging.warning("[-] Unable to watch %s: %s", path, err)
+        elif self.scanner.is_excluded_file(relative_path + name):
+            return
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.pending.touch(path)
+        elif mask & IN_MODIFY and path in self.pending.files:
+            self.pending.touch(path)
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def watch(watchers: List[Watcher], on_file: Callable[[str], None], timeout: float = 1.0) -> None:
+    for watcher in watchers:
+        logging.info("[+] Watching %s (%s)", watcher.root, type(watcher).__name__)
+    logging.info("[+] Press Ctrl+C to stop")
+    try:
+        while True:
+            for watcher in watchers:
+                for path in watcher.step(timeout / len(watchers)):
+                    try:
+                        on_file(path)
+                    except Exception as err:
+                        logging.error("[-] Unable to organize %s: %s", path, err)
+    except KeyboardInterrupt:
+        logging.info("[+] Watch stopped")
+    finally:
+        for watcher in watchers:
+            watcher.close()
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available")
+    return libc
+
+
+def get_filesystem_type(path: str) -> Optional[str]:
+    # Type of the file system of the longest mount point containing path, from /proc/mounts
+    path = os.path.realpath(path)
+    best = None
+    try:
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+                    if best is None or len(mount_point) > len(best[0]):
+                        best = (mount_point, fields[2])
+    except OSError:
+        return None
+    return best[1] if best else None
+
+
+def get_watcher(root: str, scanner: Scanner, settle: float = DEFAULT_SETTLE_TIME,
+                interval: float = DEFAULT_POLL_INTERVAL, force_poll: bool = False) -> Watcher:
+    if not force_poll and sys.platform.startswith("linux"):
+        filesystem = get_filesystem_type(root)
+        if filesystem in NETWORK_FILESYSTEMS:
+            logging.info(" |- %s is a %s mount, inotify can not see remote changes", root, filesystem)
+        else:
+            try:
+                return InotifyWatcher(root, scanner, settle)
+            except OSError as err:
+                logging.warning("[-] Unable to use inotify (%s), polling instead", err)
+    return PollingWatcher(root, scanner, settle, interval)
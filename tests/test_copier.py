@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.copier import COPY_FILE_RANGE, READINTO, REFLINK, SENDFILE, CopyEngine, Unsupported, available_strategies
+
+
+class CopyEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'source.jpg')
+        self.content = os.urandom(3 * 1024 ** 2 + 123)
+        with open(self.source, 'wb') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_every_strategy(self):
+        for strategy in available_strategies():
+            target = os.path.join(self.tmp.name, strategy + '.jpg')
+            engine = CopyEngine((strategy, READINTO))
+
+            used = engine.copy(self.source, target)
+
+            self.assertIn(used, (strategy, READINTO))
+            self.assertEqual(self._read(target), self.content)
+            self.assertEqual(engine.bytes[used], len(self.content))
+
+    def test_modification_time_is_kept(self):
+        os.utime(self.source, ns=(1609502400 * 10 ** 9, 1609502400 * 10 ** 9))
+        target = os.path.join(self.tmp.name, 'target.jpg')
+
+        CopyEngine((READINTO,)).copy(self.source, target)
+
+        self.assertEqual(os.stat(target).st_mtime_ns, 1609502400 * 10 ** 9)
+
+    def test_shrinking_source_keeps_the_strategy(self):
+        for strategy, name in ((COPY_FILE_RANGE, 'copy_file_range'), (SENDFILE, 'sendfile')):
+            if strategy not in available_strategies():
+                continue
+            engine = CopyEngine((strategy, READINTO))
+            function = getattr(os, name)
+            calls = []
+
+            def shrinking(*args):
+                # The source is cut while its first copy runs
+                if not calls:
+                    os.truncate(self.source, 1000)
+                calls.append(args)
+                return function(*args)
+
+            with patch('os.' + name, side_effect=shrinking):
+                self.assertEqual(engine.copy(self.source, os.path.join(self.tmp.name, strategy + '_a.jpg')), strategy)
+            self.assertEqual(engine.copy(self.source, os.path.join(self.tmp.name, strategy + '_b.jpg')), strategy)
+            with open(self.source, 'wb') as f:
+                f.write(self.content)
+
+    def test_unsupported_strategies_are_probed_once(self):
+        engine = CopyEngine((REFLINK, COPY_FILE_RANGE, SENDFILE, READINTO))
+        with patch('src.copier.CopyEngine._reflink', side_effect=Unsupported(REFLINK)) as mock_reflink, \
+                patch('src.copier.CopyEngine._copy_file_range', side_effect=Unsupported(COPY_FILE_RANGE)):
+            for name in ('a.jpg', 'b.jpg'):
+                self.assertIn(engine.copy(self.source, os.path.join(self.tmp.name, name)), (SENDFILE, READINTO))
+                self.assertEqual(self._read(os.path.join(self.tmp.name, name)), self.content)
+
+        self.assertEqual(mock_reflink.call_count, 1)
+        self.assertEqual(sum(engine.files.values()), 2)
+
+    def test_empty_file(self):
+        empty = os.path.join(self.tmp.name, 'empty.jpg')
+        open(empty, 'wb').close()
+        for strategy in (READINTO, COPY_FILE_RANGE):
+            target = os.path.join(self.tmp.name, strategy + '.jpg')
+            CopyEngine((strategy, READINTO)).copy(empty, target)
+            self.assertEqual(os.path.getsize(target), 0)
+
+    def test_failed_copies_leave_nothing(self):
+        target = os.path.join(self.tmp.name, 'target.jpg')
+        for error in (OSError(5, 'Input/output error'), KeyboardInterrupt()):
+            with patch('src.copier.CopyEngine._readinto', side_effect=error):
+                with self.assertRaises(type(error)):
+                    CopyEngine((READINTO,)).copy(self.source, target)
+
+            self.assertEqual(os.listdir(self.tmp.name), ['source.jpg'])
+
+    def test_existing_targets_are_never_replaced(self):
+        target = os.path.join(self.tmp.name, 'target.jpg')
+        with open(target, 'wb') as f:
+            f.write(b'other')
+
+        with self.assertRaises(FileExistsError):
+            CopyEngine((READINTO,)).copy(self.source, target)
+        with patch('os.link', side_effect=PermissionError(1, 'Operation not permitted')), \
+                self.assertRaises(FileExistsError):
+            # FAT and exFAT, the copy is renamed
+            CopyEngine((READINTO,)).copy(self.source, target)
+
+        self.assertEqual(self._read(target), b'other')
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['source.jpg', 'target.jpg'])
+
+    def test_copies_without_hard_links(self):
+        target = os.path.join(self.tmp.name, 'target.jpg')
+        with patch('os.link', side_effect=PermissionError(1, 'Operation not permitted')):
+            CopyEngine((READINTO,)).copy(self.source, target)
+
+        self.assertEqual(self._read(target), self.content)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['source.jpg', 'target.jpg'])
+
+    def test_sparse_file(self):
+        sparse = os.path.join(self.tmp.name, 'sparse.mov')
+        with open(sparse, 'wb') as f:
+            f.truncate(64 * 1024 ** 2)
+            f.seek(32 * 1024 ** 2)
+            f.write(b'data' * 1024)
+        if not hasattr(os.stat(sparse), 'st_blocks') or os.stat(sparse).st_blocks * 512 >= 64 * 1024 ** 2:
+            self.skipTest('No sparse files on this filesystem')
+        for strategy in (COPY_FILE_RANGE, SENDFILE, READINTO):
+            if strategy not in available_strategies():
+                continue
+            target = os.path.join(self.tmp.name, strategy + '.mov')
+
+            CopyEngine((strategy, READINTO)).copy(sparse, target)
+
+            self.assertEqual(self._read(target), self._read(sparse))
+            self.assertLess(os.stat(target).st_blocks * 512, 16 * 1024 ** 2)
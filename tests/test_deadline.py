@@ -0,0 +1,50 @@
+import threading
+import time
+import unittest
+from concurrent.futures import TimeoutError
+
+from src.deadline import DeadlinePool
+
+
+class DeadlinePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        # Lets the abandoned threads finish
+        self.release.set()
+
+    def work(self, item):
+        if item == 'hang':
+            self.release.wait()
+        if item == 'raise':
+            raise ValueError('corrupted')
+        return len(item)
+
+    def test_results_and_errors(self):
+        pool = DeadlinePool(self.work, 2)
+
+        results = {item: (result, error) for item, result, error in pool.run(['a', 'bb', 'raise'], lambda item: 5)}
+        pool.close()
+
+        self.assertEqual((results['a'], results['bb']), ((1, None), (2, None)))
+        self.assertIsInstance(results['raise'][1], ValueError)
+
+    def test_stalled_calls_are_abandoned(self):
+        pool = DeadlinePool(self.work, 1)
+        start = time.monotonic()
+
+        results = list(pool.run(['hang', 'a', 'hang', 'bb'], lambda item: 0.2))
+        pool.close()
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(sorted((item, result) for item, result, error in results if error is None), [('a', 1), ('bb', 2)])
+        self.assertEqual([type(error) for item, _, error in results if item == 'hang'], [TimeoutError, TimeoutError])
+        self.assertEqual(pool.abandoned, 2)
+
+    def test_without_deadline(self):
+        pool = DeadlinePool(self.work, 1)
+
+        self.assertEqual(list(pool.run(iter(['a']), lambda item: None)), [('a', 1, None)])
+        pool.close()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.dedup import PARTIAL_SIZE, Deduplicator, full_hash, partial_hash
+from src.record import FileRecord
+
+
+class DeduplicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return FileRecord.from_path(path)
+
+    def test_partial_hash(self):
+        start, middle, end = os.urandom(PARTIAL_SIZE), os.urandom(PARTIAL_SIZE), os.urandom(PARTIAL_SIZE)
+        a = self._write('a.jpg', start + middle + end)
+        b = self._write('b.jpg', start + os.urandom(PARTIAL_SIZE) + end)
+
+        self.assertEqual(partial_hash(a.path, a.size), partial_hash(b.path, b.size))
+        self.assertNotEqual(full_hash(a.path), full_hash(b.path))
+
+    def test_find(self):
+        content = os.urandom(3 * PARTIAL_SIZE)
+        images = [
+            self._write('c.jpg', content),
+            self._write('a.jpg', content),
+            # Same start and end, another middle
+            self._write('b.jpg', content[:PARTIAL_SIZE] + os.urandom(PARTIAL_SIZE) + content[-PARTIAL_SIZE:]),
+            self._write('small.jpg', b'small'),
+            self._write('small copy.jpg', b'small'),
+            self._write('other.jpg', b'other'),
+            self._write('unique.jpg', os.urandom(2 * PARTIAL_SIZE)),
+        ]
+        deduplicator = Deduplicator()
+
+        duplicates = deduplicator.find(images)
+
+        self.assertEqual({image.name: original.name for image, original in duplicates.items()},
+                         {'c.jpg': 'a.jpg', 'small.jpg': 'small copy.jpg'})
+        self.assertEqual(deduplicator.saved, 3 * PARTIAL_SIZE + 5)
+        # unique.jpg has a size of its own, the small files are complete after their partial hash
+        self.assertEqual(dict(deduplicator.hashed), {'partial': 6, 'full': 3})
+
+    def test_hard_links_are_not_read(self):
+        a = self._write('a.jpg', b'picture')
+        os.link(a.path, os.path.join(self.tmp.name, 'b.jpg'))
+        b = FileRecord.from_path(os.path.join(self.tmp.name, 'b.jpg'))
+
+        with patch('src.dedup.partial_hash') as mock_partial_hash:
+            self.assertEqual(Deduplicator().find([b, a]), {b: a})
+
+        mock_partial_hash.assert_not_called()
+
+    def test_hard_link_of_a_duplicate(self):
+        a = self._write('a.jpg', b'picture')
+        b = self._write('b.jpg', b'picture')
+        os.link(b.path, os.path.join(self.tmp.name, 'c.jpg'))
+        c = FileRecord.from_path(os.path.join(self.tmp.name, 'c.jpg'))
+
+        self.assertEqual(Deduplicator().find([c, b, a]), {b: a, c: a})
+
+    def test_unreadable_files_are_unique(self):
+        images = [self._write('a.jpg', b'picture'), self._write('b.jpg', b'picture')]
+
+        with patch('src.dedup.partial_hash', side_effect=OSError('Input/output error')):
+            self.assertEqual(Deduplicator().find(images), {})
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, Deduplicator, 'delete')
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from src.estimate import PreflightEstimator
+from src.scanner import Scanner
+
+
+class PreflightEstimatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self._touch('root.jpg', 10)
+        for directory in ('a', 'b'):
+            for name in ('1.jpg', '2.jpg', '3.txt'):
+                self._touch(os.path.join(directory, name), 100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _touch(self, name, size):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_balanced_tree_is_exact(self):
+        estimate = PreflightEstimator(Scanner(), ('.jpg',), probes=20, seed=1).estimate([self.root])
+
+        self.assertEqual(estimate.files.value, 7)
+        self.assertEqual((estimate.files.low, estimate.files.high), (7, 7))
+        self.assertEqual(estimate.size.value, 610)
+        self.assertEqual(estimate.matched_files.value, 5)
+        self.assertEqual(estimate.matched_size.value, 410)
+        self.assertAlmostEqual(estimate.matching_ratio, 5 / 7)
+        self.assertEqual(estimate.probes, 20)
+        self.assertEqual(estimate.directories_sampled, 3)
+
+    def test_unbalanced_tree_has_bounds(self):
+        for i in range(20):
+            self._touch(os.path.join('a', 'deep', 'f%d.jpg' % i), 1)
+
+        estimate = PreflightEstimator(Scanner(), ('.jpg',), probes=200, seed=1).estimate([self.root])
+
+        self.assertLess(estimate.files.low, 27)
+        self.assertGreater(estimate.files.high, 27)
+        self.assertGreater(estimate.seconds.value, 0)
+
+    def test_roots_add_up(self):
+        estimate = PreflightEstimator(Scanner(), ('.jpg',), probes=5).estimate(
+            [os.path.join(self.root, 'a'), os.path.join(self.root, 'b')]
+        )
+
+        self.assertEqual(estimate.files.value, 6)
@@ -0,0 +1,121 @@
+import glob
+import os
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+
+from PIL import Image
+
+from src.exif import DATE_TIME_ORIGINAL, EXIF_IFD, LENS_MODEL, MAKE, MODEL, SUB_SEC_TIME_ORIGINAL, capture_time
+from src.extractors import default_registry, registry
+
+
+def tiff(byte_order='<', model=b'Canon EOS 60D\x00', make=b'Canon\x00', header=None, exif=None):
+    # IFD0 with Make and Model (inline when they fit in 4 bytes), then the Exif sub-IFD
+    marker = b'II' if byte_order == '<' else b'MM'
+    header = header or marker + struct.pack(byte_order + 'H', 42)
+    ifd0 = [(MAKE, 2, make), (MODEL, 2, model)]
+    if exif:
+        ifd0.append((EXIF_IFD, 4, None))
+    data = header + struct.pack(byte_order + 'I', 8)
+    exif_offset = 8 + 2 + 12 * len(ifd0) + 4
+    sub_ifd = [(tag, 2, value) for tag, value in sorted((exif or {}).items())]
+    extra_offset = exif_offset + (2 + 12 * len(sub_ifd) + 4 if exif else 0)
+    extra = b''
+    for entries in (ifd0, sub_ifd) if exif else (ifd0,):
+        data += struct.pack(byte_order + 'H', len(entries))
+        for tag, kind, value in entries:
+            if value is None:
+                data += struct.pack(byte_order + 'HHII', tag, kind, 1, exif_offset)
+            elif len(value) <= 4:
+                data += struct.pack(byte_order + 'HHI', tag, kind, len(value)) + value.ljust(4, b'\x00')
+            else:
+                data += struct.pack(byte_order + 'HHII', tag, kind, len(value), extra_offset + len(extra))
+                extra += value
+        data += b'\x00' * 4
+    return data + extra
+
+
+def jpeg(exif):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+    app1 = b'\xff\xe1' + struct.pack('>H', len(exif) + 8) + b'Exif\x00\x00' + exif
+    return b'\xff\xd8' + app0 + app1 + b'\xff\xda\x00\x02' + b'\x00' * 100 + b'\xff\xd9'
+
+
+class ExifTest(unittest.TestCase):
+
+    def test_jpeg(self):
+        self.assertEqual(registry.extract_bytes(jpeg(tiff())), {MAKE: 'Canon', MODEL: 'Canon EOS 60D'})
+
+    def test_tiff_big_endian_and_inline_values(self):
+        self.assertEqual(registry.extract_bytes(tiff('>', model=b'X1\x00', make=b'Fuji FILM\x00'), tags=(MODEL,)), {MODEL: 'X1'})
+
+    def test_raw_headers(self):
+        # Olympus ORF uses its own magic number
+        self.assertEqual(registry.extract_bytes(tiff(header=b'IIRO'), tags=(MODEL,)), {MODEL: 'Canon EOS 60D'})
+
+    def test_png_and_webp(self):
+        exif = tiff()
+        png = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + b'\x00' * 17
+        png += struct.pack('>I', len(exif)) + b'eXIf' + exif + b'\x00' * 4
+        webp = b'RIFF' + struct.pack('<I', 0) + b'WEBP' + b'VP8X' + struct.pack('<I', 10) + b'\x00' * 10
+        webp += b'EXIF' + struct.pack('<I', len(exif)) + exif
+
+        self.assertEqual(registry.extract_bytes(png)[MODEL], 'Canon EOS 60D')
+        self.assertEqual(registry.extract_bytes(webp)[MODEL], 'Canon EOS 60D')
+
+    def test_unknown_and_corrupted_files(self):
+        self.assertEqual(registry.extract_bytes(b'\x00\x00\x00\x18ftypmp42'), {})
+        self.assertEqual(registry.extract_bytes(jpeg(tiff())[:40]), {})
+        self.assertEqual(registry.extract_bytes(b'\xff\xd8\xff\xda'), {})
+
+    def test_corrupted_value_sizes(self):
+        valid = tiff(model=b'Canon EOS 60D with a long name\x00')
+        # The Model entry (the second of IFD0) claiming 1 GiB of DOUBLE values, an ASCII value of 1000 bytes, then
+        # a value past the end of the file
+        entries = [struct.pack('<HHI', MODEL, 12, 0x40000000), struct.pack('<HHI', MODEL, 2, 1000),
+                   struct.pack('<HHII', MODEL, 2, 31, 0x7FFFFFF0)]
+        with tempfile.TemporaryDirectory() as tmp:
+            for entry in entries:
+                data = jpeg(valid[:22] + entry + valid[22 + len(entry):])
+                path = os.path.join(tmp, 'image.jpg')
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+                self.assertEqual(registry.extract_bytes(data), {MAKE: 'Canon'})
+                self.assertEqual(default_registry(prefix_size=16).extract(path), {MAKE: 'Canon'})
+
+    def test_exif_sub_ifd(self):
+        exif = {DATE_TIME_ORIGINAL: b'2019:07:14 18:30:05\x00', SUB_SEC_TIME_ORIGINAL: b'25\x00',
+                LENS_MODEL: b'EF-S18-55mm\x00'}
+
+        values = registry.extract_bytes(jpeg(tiff('>', exif=exif)))
+
+        self.assertEqual(values, {MAKE: 'Canon', MODEL: 'Canon EOS 60D', DATE_TIME_ORIGINAL: '2019:07:14 18:30:05',
+                                  SUB_SEC_TIME_ORIGINAL: '25', LENS_MODEL: 'EF-S18-55mm'})
+        self.assertEqual(capture_time(values), datetime(2019, 7, 14, 18, 30, 5, 250000))
+        self.assertEqual(registry.extract_bytes(jpeg(tiff(exif=exif)), tags=(MODEL,)), {MODEL: 'Canon EOS 60D'})
+
+    def test_capture_time_missing_or_blank(self):
+        self.assertIsNone(capture_time({}))
+        self.assertIsNone(capture_time({DATE_TIME_ORIGINAL: '0000:00:00 00:00:00'}))
+        self.assertIsNone(capture_time({DATE_TIME_ORIGINAL: '    :  :     :  :  '}))
+
+    def test_read_beyond_prefix(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'image.jpg')
+            with open(path, 'wb') as f:
+                f.write(jpeg(tiff()))
+
+            self.assertEqual(default_registry(prefix_size=16).extract(path), {MAKE: 'Canon', MODEL: 'Canon EOS 60D'})
+
+    def test_same_values_as_pil(self):
+        for path in glob.glob(os.path.join('tests', 'fixtures', 'test', '*.JPG')):
+            with Image.open(path) as image:
+                expected = image.getexif()
+                exif = expected.get_ifd(EXIF_IFD)
+            values = registry.extract(path)
+
+            self.assertEqual((values[MAKE], values[MODEL]), (expected[MAKE], expected[MODEL]))
+            self.assertEqual(values[DATE_TIME_ORIGINAL], exif[DATE_TIME_ORIGINAL])
@@ -0,0 +1,85 @@
+import os
+import time
+import unittest
+
+from src.extraction import ExtractionPool
+from src.process import read_metadata
+
+
+def lengths(batch):
+    results = []
+    for name, action in batch:
+        if action == 'crash':
+            os._exit(1)
+        if action == 'hang':
+            time.sleep(60)
+        if action == 'slow':
+            time.sleep(0.8)
+        if action == 'slower':
+            time.sleep(3)
+        if action == 'raise':
+            raise ValueError('corrupted')
+        results.append(len(name))
+    return results
+
+
+class ExtractionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ExtractionPool(lengths, workers=2, batch_size=4, timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_batches(self):
+        tasks = [self.pool.submit([('a', None), ('bb', None)]), self.pool.submit([('ccc', None)])]
+
+        self.assertEqual([self.pool.result(task) for task in tasks], [[1, 2], [3]])
+        self.assertEqual((self.pool.failed, self.pool.restarts), (0, 0))
+
+    def test_crash_is_isolated(self):
+        batch = [('a', None), ('bb', 'crash'), ('ccc', None), ('dddd', None)]
+
+        self.assertEqual(self.pool.result(self.pool.submit(batch)), [1, None, 3, 4])
+        self.assertEqual(self.pool.failed, 1)
+        self.assertGreaterEqual(self.pool.restarts, 1)
+
+    def test_hang_is_isolated(self):
+        self.pool.timeout = 1
+        batch = [('a', 'hang'), ('bb', None)]
+
+        self.assertEqual(self.pool.result(self.pool.submit(batch)), [None, 2])
+        self.assertEqual(self.pool.failed, 1)
+
+    def test_batches_broken_by_another_one_are_run_again(self):
+        # Both workers running, the crash happens during the slow batch
+        warm = [self.pool.submit([(name, 'slow')]) for name in ('a', 'b')]
+        self.assertEqual([self.pool.result(task) for task in warm], [[1], [1]])
+        slow = self.pool.submit([('a', 'slower')])
+        time.sleep(0.2)
+        crash = self.pool.submit([('bb', 'crash')])
+
+        self.assertEqual(self.pool.result(crash), [None])
+        self.assertEqual(self.pool.result(slow), [1])
+        self.assertEqual(self.pool.failed, 1)
+
+    def test_timeout_runs_from_the_start_of_the_batch(self):
+        pool = ExtractionPool(lengths, workers=1, batch_size=4, timeout=1)
+        self.addCleanup(pool.close)
+        tasks = [pool.submit([(name, 'slow')]) for name in ('a', 'bb')]
+
+        # The second batch waits for the first one, it is done 1.6s after the call
+        self.assertEqual(pool.result(tasks[1]), [2])
+        self.assertEqual(pool.result(tasks[0]), [1])
+        self.assertEqual((pool.failed, pool.restarts), (0, 0))
+
+    def test_error_is_isolated(self):
+        batch = [('a', None), ('bb', 'raise')]
+
+        self.assertEqual(self.pool.result(self.pool.submit(batch)), [1, None])
+        self.assertEqual(self.pool.restarts, 0)
+
+    def test_read_metadata(self):
+        path = os.path.abspath(__file__)
+
+        self.assertEqual(read_metadata([path]), [(None, None)])
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from src.exif import DATE_TIME_ORIGINAL, MAKE, MODEL
+from src.extractors import Extractor, default_registry
+from tests.test_exif import jpeg, tiff
+from tests.test_media import mp4, opus
+
+
+class ExtractorRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = default_registry()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_formats_without_metadata_are_not_opened(self):
+        self.assertEqual(self.registry.extract(os.path.join(self.tmp.name, 'missing.gif')), {})
+        self.assertEqual(self.registry.skipped, 1)
+        self.assertFalse(self.registry.has_metadata('animation.GIF'))
+
+    def test_unknown_extensions_are_learnt(self):
+        path = self._write('notes.txt', b'hello')
+
+        self.assertEqual(self.registry.extract(path), {})
+        self.assertIn('.txt', self.registry.no_metadata)
+        os.remove(path)
+        self.assertEqual(self.registry.extract(path), {})
+
+    def test_header_wins_over_extension(self):
+        path = self._write('really_a_jpeg.png', jpeg(tiff()))
+
+        self.assertEqual(self.registry.extract(path, tags=(MODEL,)), {MODEL: 'Canon EOS 60D'})
+        self.assertNotIn('.png', self.registry.no_metadata)
+
+    def test_register_replaces_default(self):
+        self.registry.register(Extractor('fake', lambda source, tags: {MODEL: 'fake'}, lambda header: True), ('.jpg',))
+        path = self._write('image.jpg', jpeg(tiff()))
+
+        self.assertEqual(self.registry.extract(path), {MODEL: 'fake'})
+
+    def test_mapped_reads(self):
+        exif = {DATE_TIME_ORIGINAL: b'2019:07:14 18:30:05\x00'}
+        for name, content in (('image.jpg', jpeg(tiff('>', exif=exif))), ('clip.mp4', mp4(3650000000)),
+                              ('note.opus', opus([b'DATE=2019-07-14'])), ('broken.jpg', jpeg(tiff())[:40]),
+                              ('empty.jpg', b'')):
+            path = self._write(name, content)
+
+            # Same values as the buffered reads, and no view of the mapping left (closing it would fail)
+            self.assertEqual(self.registry.extract(path, mapped=True), self.registry.extract(path))
+        self.assertEqual(self.registry.extract(path.replace('empty', 'image'), mapped=True)[MAKE], 'Canon')
+
+    def test_mapped_reads_raise_the_parser_error(self):
+        def parse(source, tags):
+            view = source.read_at(0, 4)
+            raise KeyError(len(view))
+
+        self.registry.register(Extractor('fake', parse, lambda header: True), ('.jpg',))
+        path = self._write('image.jpg', jpeg(tiff()))
+
+        for mapped in (False, True):
+            self.assertRaises(KeyError, self.registry.extract, path, mapped=mapped)
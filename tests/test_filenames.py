@@ -0,0 +1,36 @@
+import re
+import unittest
+from datetime import datetime
+
+from src.filenames import FilenameDates, compile_pattern
+
+
+class FilenameDatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = FilenameDates()
+
+    def test_default_patterns(self):
+        self.assertEqual(self.dates.match("IMG_20230114_153012.jpg"), datetime(2023, 1, 14, 15, 30, 12))
+        self.assertEqual(self.dates.match("PXL_20240301_123456789.jpg"), datetime(2024, 3, 1, 12, 34, 56))
+        self.assertEqual(self.dates.match("VID-20220101-WA0003.mp4"), datetime(2022, 1, 1))
+        self.assertEqual(self.dates.match("20230114_153012.jpg"), datetime(2023, 1, 14, 15, 30, 12))
+        self.assertEqual(self.dates.match("2023-01-14 15.30.12.jpg"), datetime(2023, 1, 14, 15, 30, 12))
+        self.assertEqual(self.dates.match("Screenshot_2023-01-14-15-30-12.png"), datetime(2023, 1, 14, 15, 30, 12))
+
+    def test_names_without_a_date(self):
+        self.assertIsNone(self.dates.match("DSC_0001.JPG"))
+        self.assertIsNone(self.dates.match("Església St Pere de Rubí 150301_2014.JPG"))
+        self.assertIsNone(self.dates.match("IMG_20231345_153012.jpg"))
+        self.assertIsNone(self.dates.match("IMG_99991231_000000.jpg"))
+
+    def test_user_patterns(self):
+        dates = FilenameDates([r"^holidays (?P<day>\d{2})\.(?P<month>\d{2})\.(?P<year>\d{4})"])
+
+        self.assertEqual(dates.match("holidays 14.01.2023 beach.jpg"), datetime(2023, 1, 14))
+        self.assertEqual(dates.match("IMG_20230114_153012.jpg"), datetime(2023, 1, 14, 15, 30, 12))
+        self.assertIsNone(FilenameDates(defaults=False).match("IMG_20230114_153012.jpg"))
+
+    def test_invalid_user_patterns(self):
+        self.assertRaises(ValueError, compile_pattern, r"(?P<year>\d{4})(?P<month>\d{2})")
+        self.assertRaises(re.error, compile_pattern, r"(?P<year>\d{4}")
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from src.index import MetadataIndex
+from src.record import FileRecord
+
+
+class MetadataIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmp.name, 'index.db')
+        self.file = os.path.join(self.tmp.name, 'IMG_0001.JPG')
+        with open(self.file, 'wb') as f:
+            f.write(b'12345')
+        self.index = MetadataIndex(self.index_path)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _record(path, date='2021-01-01', model=None):
+        record = FileRecord.from_path(path)
+        record.date, record.model = date, model
+        return record
+
+    def test_lookup_miss_then_hit(self):
+        record = self._record(self.file, model='canon60d')
+        self.assertIsNone(self.index.lookup(record))
+
+        self.index.store(record)
+        self.index.close()
+        self.index = MetadataIndex(self.index_path)
+
+        entry = self.index.lookup(record)
+        self.assertEqual(entry.date, '2021-01-01')
+        self.assertEqual(entry.model, 'canon60d')
+        self.assertEqual((self.index.hits, self.index.misses), (1, 0))
+        self.assertEqual(self.index.hit_rate, 1.0)
+
+    def test_lookup_counts_each_path_once_per_run(self):
+        record = self._record(self.file)
+        self.index.store(record)
+        self.index.close()
+        self.index = MetadataIndex(self.index_path)
+
+        self.index.lookup(record)
+        self.index.lookup(record)
+
+        self.assertEqual(self.index.hits, 1)
+
+    def test_changed_file_is_invalidated(self):
+        self.index.store(self._record(self.file))
+        with open(self.file, 'ab') as f:
+            f.write(b'6')
+
+        self.assertIsNone(self.index.lookup(FileRecord.from_path(self.file)))
+        self.assertEqual(self.index.misses, 1)
+
+    def test_version_change_drops_entries(self):
+        self.index.store(self._record(self.file))
+        self.index.close()
+        version = MetadataIndex.VERSION
+        MetadataIndex.VERSION = 'test'
+        try:
+            self.index = MetadataIndex(self.index_path)
+        finally:
+            MetadataIndex.VERSION = version
+
+        self.assertEqual(len(self.index), 0)
+
+    def test_is_organized(self):
+        target = os.path.join(self.tmp.name, 'copy.jpg')
+        self.index.store(self._record(self.file))
+        self.index.mark_organized(self.file, target)
+
+        self.assertFalse(self.index.is_organized(self.file, target))
+        with open(target, 'wb') as f:
+            f.write(b'12345')
+        self.assertTrue(self.index.is_organized(self.file, target))
+        self.assertFalse(self.index.is_organized(self.file, target + '.other'))
+
+    def test_compact(self):
+        gone = os.path.join(self.tmp.name, 'gone.jpg')
+        with open(gone, 'wb') as f:
+            f.write(b'1')
+        self.index.store(self._record(self.file))
+        self.index.store(self._record(gone))
+        os.remove(gone)
+
+        removed = self.index.compact()
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(len(self.index), 1)
@@ -0,0 +1,33 @@
+import io
+import os
+import tempfile
+import unittest
+
+from src.manifest import read_paths, scan_file_list
+
+
+class ManifestTest(unittest.TestCase):
+
+    def test_read_newline_delimited(self):
+        stream = io.BytesIO(b'a/IMG_0001.JPG\r\nb/clip.mov\n\nc/last.jpg')
+
+        self.assertEqual(list(read_paths(stream)), ['a/IMG_0001.JPG', 'b/clip.mov', 'c/last.jpg'])
+
+    def test_read_nul_delimited_across_chunks(self):
+        names = ['with\nnewline.jpg', 'Església.JPG', 'c.mp4']
+        stream = io.BytesIO(b'\0'.join(os.fsencode(name) for name in names) + b'\0')
+
+        self.assertEqual(list(read_paths(stream, chunk_size=4)), names)
+
+    def test_scan_file_list(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            photo = os.path.join(tmp, 'photo.jpg')
+            with open(photo, 'wb') as f:
+                f.write(b'123')
+            file_list = os.path.join(tmp, 'list.txt')
+            with open(file_list, 'w') as f:
+                f.write('\n'.join([photo, os.path.join(tmp, 'missing.jpg'), tmp]))
+
+            entries = list(scan_file_list(file_list))
+
+        self.assertEqual([(entry.path, entry.size) for entry in entries], [(photo, 3)])
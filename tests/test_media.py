@@ -0,0 +1,148 @@
+import os
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+
+from src.exif import DATE_TIME_ORIGINAL, MODEL
+from src.extractors import registry
+from src.media import MP4_EPOCH_OFFSET, read_mvhd_time, read_ogg_comments
+from src.source import Source
+from tests.test_exif import tiff
+
+
+def box(kind, payload, large=False):
+    if large:
+        return struct.pack('>I4sQ', 1, kind, len(payload) + 16) + payload
+    return struct.pack('>I4s', len(payload) + 8, kind) + payload
+
+
+def mp4(timestamp, version=0, mdat_size=1000):
+    if version == 1:
+        mvhd = box(b'mvhd', b'\x01\x00\x00\x00' + struct.pack('>QQ', timestamp, timestamp) + b'\x00' * 80)
+    else:
+        mvhd = box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>II', timestamp, timestamp) + b'\x00' * 80)
+    # The moov box after the media data, as written by most cameras
+    return (box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41') + box(b'mdat', b'\x00' * mdat_size, large=True)
+            + box(b'moov', mvhd + box(b'trak', b'\x00' * 16)))
+
+
+def heic(exif):
+    ftyp = box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic')
+    infe = box(b'infe', b'\x02\x00\x00\x00' + struct.pack('>HH', 1, 0) + b'hvc1\x00') + \
+        box(b'infe', b'\x02\x00\x00\x00' + struct.pack('>HH', 2, 0) + b'Exif\x00')
+    iinf = box(b'iinf', b'\x00\x00\x00\x00' + struct.pack('>H', 2) + infe)
+    item = struct.pack('>I', 6) + b'Exif\x00\x00' + exif
+
+    def iloc(exif_offset):
+        # Version 0, 4 bytes offsets and lengths, no base offset
+        entries = struct.pack('>HHHII', 1, 0, 1, 0, 0)
+        entries += struct.pack('>HHHII', 2, 0, 1, exif_offset, len(item))
+        return box(b'iloc', b'\x00\x00\x00\x00' + bytes([0x44, 0x00]) + struct.pack('>H', 2) + entries)
+
+    meta_size = len(box(b'meta', b'\x00' * 4 + box(b'hdlr', b'\x00' * 24) + iinf + iloc(0)))
+    meta = box(b'meta', b'\x00' * 4 + box(b'hdlr', b'\x00' * 24) + iinf + iloc(len(ftyp) + meta_size + 8))
+    return ftyp + meta + box(b'mdat', item)
+
+
+def ogg_page(packet_data, sequence, serial=1):
+    lacing = []
+    size = len(packet_data)
+    while size >= 255:
+        lacing.append(255)
+        size -= 255
+    lacing.append(size)
+    header = struct.pack('<4sBBqIIIB', b'OggS', 0, 0, 0, serial, sequence, 0, len(lacing))
+    return header + bytes(lacing) + packet_data
+
+
+def opus(comments):
+    head = b'OpusHead\x01\x02\x38\x01\x80\xbb\x00\x00\x00\x00\x00'
+    vendor = b'libopus 1.3'
+    tags = b'OpusTags' + struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(comments))
+    for comment in comments:
+        tags += struct.pack('<I', len(comment)) + comment
+    return ogg_page(head, 0) + ogg_page(tags, 1) + ogg_page(b'\x00' * 100, 2)
+
+
+class MediaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.date = datetime(2019, 7, 14, 18, 30, 5)
+        self.timestamp = int(self.date.timestamp()) + MP4_EPOCH_OFFSET
+
+    def test_mp4_with_moov_at_the_end(self):
+        self.assertEqual(registry.extract_bytes(mp4(self.timestamp)), {DATE_TIME_ORIGINAL: '2019:07:14 18:30:05'})
+        self.assertEqual(registry.extract_bytes(mp4(self.timestamp, version=1)), {DATE_TIME_ORIGINAL: '2019:07:14 18:30:05'})
+
+    def test_mp4_without_creation_time(self):
+        self.assertEqual(registry.extract_bytes(mp4(0)), {})
+        self.assertEqual(registry.extract_bytes(mp4(self.timestamp)[:200]), {})
+
+    def test_mp4_reads_only_the_box_headers(self):
+        reads = []
+
+        class CountingSource(Source):
+            def read_at(self, offset, size):
+                reads.append(size)
+                return super().read_at(offset, size)
+
+        self.assertEqual(read_mvhd_time(CountingSource(mp4(self.timestamp, mdat_size=10 ** 6))), self.date)
+        self.assertLess(sum(reads), 200)
+
+    def test_large_video_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'clip.mov')
+            with open(path, 'wb') as f:
+                f.write(mp4(self.timestamp, mdat_size=4 * 1024 ** 2))
+
+            self.assertEqual(registry.extract(path), {DATE_TIME_ORIGINAL: '2019:07:14 18:30:05'})
+
+    def test_heic_exif_item(self):
+        exif = tiff(exif={DATE_TIME_ORIGINAL: b'2019:07:14 18:30:05\x00'})
+
+        values = registry.extract_bytes(heic(exif))
+
+        self.assertEqual(values[MODEL], 'Canon EOS 60D')
+        self.assertEqual(values[DATE_TIME_ORIGINAL], '2019:07:14 18:30:05')
+
+    def test_corrupted_headers(self):
+        ftyp = box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic')
+        infe = box(b'infe', b'\x02\x00\x00\x00' + struct.pack('>HH', 1, 0) + b'Exif\x00')
+        iinf = box(b'iinf', b'\x00\x00\x00\x00' + struct.pack('>H', 1) + infe)
+        files = {
+            'empty iloc.heic': ftyp + box(b'meta', b'\x00' * 4 + iinf + box(b'iloc', b'')),
+            'iloc to the end.heic': ftyp + box(b'meta', b'\x00' * 4 + iinf + struct.pack('>I4s', 0, b'iloc')),
+            # 64-bit box sizes past the end of the file, and past what a seek takes
+            'large box.mov': mp4(self.timestamp)[:36] + struct.pack('>I4sQ', 1, b'free', 2 ** 62) + b'\x00' * 16,
+            'huge box.mov': mp4(self.timestamp)[:36] + struct.pack('>I4sQ', 1, b'free', 2 ** 64 - 1) + b'\x00' * 16,
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, data in files.items():
+                path = os.path.join(tmp, name)
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+                # Organized by their modification date
+                self.assertEqual(registry.extract(path), {}, name)
+                self.assertEqual(registry.extract(path, mapped=True), {}, name)
+
+    def test_reads_past_the_end_of_the_file(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'0123456789')
+            f.flush()
+            source = Source(b'0123', f)
+
+            self.assertEqual(source.read_at(8, 100), b'89')
+            self.assertEqual(source.read_at(2 ** 63, 16), b'')
+            self.assertEqual(source.read_at(-1, 16), b'')
+
+    def test_opus_comments(self):
+        data = opus([b'title=Voice note', b'DATE=2019-07-14T18:30:05Z', b'METADATA_BLOCK_PICTURE=' + b'A' * 600])
+
+        self.assertEqual(read_ogg_comments(Source(data))['TITLE'], 'Voice note')
+        self.assertEqual(registry.extract_bytes(data), {DATE_TIME_ORIGINAL: '2019:07:14 18:30:05'})
+
+    def test_opus_without_date(self):
+        self.assertEqual(registry.extract_bytes(opus([b'DATE=2019'])), {})
+        self.assertEqual(registry.extract_bytes(opus([])), {})
@@ -1,9 +1,13 @@
 import os
+import sys
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from src.constants import DEFAULT_EXTENSION
-from src.organizer import FileOrganizer
+from src.organizer import FileOrganizer, FileOrganizerWin32
+from src.process import ProcessingOptions
+from src.record import FileRecord
+from src.summary import ScanSummary
 
 
 class FileOrganizerTest(unittest.TestCase):
@@ -26,65 +30,129 @@ class FileOrganizerTest(unittest.TestCase):
         assert organizer.source == os.path.abspath("tests/fixtures/test") + os.path.sep
         assert organizer.destination == os.path.abspath("tests/fixtures/destination/") + os.path.sep
 
-    @patch('src.organizer.glob.iglob')
-    def test_get_files_local(self, mock_iglob):
-        mock_iglob.return_value = [
-            os.path.join(self.source, 'file1.txt'),
-            os.path.join(self.source, 'file2.mp3'),
-            os.path.join(self.source, 'file3.jpg')
+    def test_processing_options(self):
+        organizer = FileOrganizer(self.source, self.destination, self.extensions, validate=True,
+                                  processing=ProcessingOptions(with_model=False, file_timeout=3, duplicates='link'))
+
+        self.assertFalse(organizer.file_process.with_model)
+        self.assertEqual(organizer.file_process.file_timeout, 3)
+        self.assertEqual(organizer.file_process.deduplicator.policy, 'link')
+        self.assertEqual(organizer.file_process.validator.file_timeout, 3)
+        with self.assertRaises(TypeError):
+            # Everything past the extensions is passed by name
+            FileOrganizer(self.source, self.destination, self.extensions, ProcessingOptions())
+
+    @patch('src.organizer.Scanner.scan')
+    def test_get_files_local(self, mock_scan):
+        mock_scan.return_value = [
+            FileRecord(os.path.join(self.source, 'file1.txt'), 10, 0, 1),
+            FileRecord(os.path.join(self.source, 'file2.mp3'), 20, 0, 2),
+            FileRecord(os.path.join(self.source, 'file3.jpg'), 30, 0, 3)
         ]
 
-        files = self.organizer.get_files(self.source, self.extensions)
+        files, summary = self.organizer.get_files(self.source, self.extensions)
 
-        self.assertEqual(len(files[0]), 3)  # all files
-        self.assertEqual(len(files[1]), 1)  # processed files
-        self.assertEqual(len(files[2]), 2)  # missing files
+        self.assertEqual(len(files), 1)  # processed files
+        self.assertEqual(summary.total_files, 3)  # all files
+        self.assertEqual(summary.unmatched_files, 2)  # missing files
 
-    @patch('src.organizer.glob.iglob')
-    def test_filter_files(self, mock_iglob):
-        mock_iglob.return_value = [
-            os.path.join(self.source, 'file1.txt'),
-            os.path.join(self.source, 'file2.mp3'),
-            os.path.join(self.source, 'file3.jpg')
+    @patch('src.organizer.Scanner.scan')
+    def test_filter_files(self, mock_scan):
+        mock_scan.return_value = [
+            FileRecord(os.path.join(self.source, 'file1.txt'), 10, 0, 1),
+            FileRecord(os.path.join(self.source, 'file2.mp3'), 20, 0, 2),
+            FileRecord(os.path.join(self.source, 'File3.JPG'), 30, 0, 3)
         ]
 
-        all_files, processed_files = self.organizer._filter_files(self.source, self.extensions)
+        processed_files, summary = self.organizer._filter_files(self.source, self.extensions)
 
-        self.assertEqual(len(all_files), 3)  # all files
-        self.assertEqual(len(processed_files), 1)  # processed files
-
-    def test_get_unique_extensions(self):
-        files = [
-            'test1.txt', 'test2.mp3', 'test3.docx', 'test4.txt'
-        ]
-        unique_extensions = self.organizer.get_unique_extensions(files)
-
-        self.assertEqual(len(unique_extensions), 3)
-        self.assertIn('.txt', unique_extensions)
-        self.assertIn('.mp3', unique_extensions)
-        self.assertIn('.docx', unique_extensions)
+        self.assertEqual([record.path for record in processed_files], [os.path.join(self.source, 'File3.JPG')])  # original case is kept
+        self.assertEqual(summary.matched['.jpg'].size, 30)
+        self.assertEqual(summary.unmatched_size, 30)
 
     @patch('src.organizer.FileProcessor.process')
     @patch('src.organizer.do_you_want_to_continue')
     @patch('src.organizer.FileOrganizer.get_files')
     def test_start_with_files(self, mock_get_files, mock_do_you_want_to_continue, mock_process):
-        mock_get_files.return_value = (
-            ['file1.txt', 'file2.mp3', 'file3.docx'],
-            ['file1.txt'],
-            ['file2.mp3', 'file3.docx']
-        )
+        summary = ScanSummary(self.extensions)
+        for name in ('file1.jpg', 'file2.mp3', 'file3.docx'):
+            summary.add(FileRecord(name, 10))
+        files = [FileRecord('file1.jpg', 10)]
+        mock_get_files.return_value = (files, summary)
         mock_do_you_want_to_continue.return_value = True
 
         self.organizer.start()
 
         mock_get_files.assert_called_once()
-        mock_process.assert_called_once_with(['file1.txt'], self.destination + os.path.sep)
+        mock_process.assert_called_once_with(files, self.destination + os.path.sep)
         mock_do_you_want_to_continue.assert_called_once()
 
+    @patch('src.organizer.FileProcessor.process')
+    @patch('src.organizer.do_you_want_to_continue')
+    @patch('src.organizer.FileOrganizer.get_files')
+    @patch('src.organizer.scan_file_list')
+    def test_start_with_files_from(self, mock_scan_file_list, mock_get_files, mock_do_you_want_to_continue,
+                                   mock_process):
+        mock_scan_file_list.return_value = [
+            FileRecord('new/file1.jpg', 10, 0, 1),
+            FileRecord('new/file2.txt', 10, 0, 2),
+        ]
+        streamed = []
+        mock_process.side_effect = lambda images, destination: streamed.extend(images)
+        organizer = FileOrganizer(None, self.destination, self.extensions, files_from='-')
+
+        organizer.start()
+
+        mock_scan_file_list.assert_called_once_with('-')
+        mock_get_files.assert_not_called()
+        mock_do_you_want_to_continue.assert_not_called()
+        mock_process.assert_called_once()
+        self.assertEqual(streamed, [FileRecord('new/file1.jpg')])
+
+    @patch('src.organizer.FileProcessor.process')
+    @patch('src.organizer.scan_file_list')
+    def test_files_from_streams_into_the_processing(self, mock_scan_file_list, mock_process):
+        def file_list(path):
+            yield FileRecord('new/file1.jpg', 10, 0, 1)
+            # Still being read while the first files are processed
+            self.assertEqual(streamed, [FileRecord('new/file1.jpg')])
+            yield FileRecord('new/file2.jpg', 10, 0, 2)
+
+        streamed = []
+        mock_scan_file_list.side_effect = file_list
+        mock_process.side_effect = lambda images, destination: streamed.extend(images)
+        organizer = FileOrganizer(None, self.destination, self.extensions, files_from='-')
+
+        with patch.object(organizer, 'reporting_summary') as mock_reporting_summary:
+            organizer.start()
+
+        self.assertEqual(streamed, [FileRecord('new/file1.jpg'), FileRecord('new/file2.jpg')])
+        self.assertEqual(mock_reporting_summary.call_args[0][0].matched_files, 2)
+
+    @patch('src.organizer.FileProcessor.process')
+    @patch('src.organizer.do_you_want_to_continue')
+    @patch('src.organizer.FileOrganizer.get_files')
+    @patch('src.organizer.Scanner.scan')
+    def test_start_estimated_streams_files(self, mock_scan, mock_get_files, mock_do_you_want_to_continue,
+                                           mock_process):
+        mock_scan.return_value = [
+            FileRecord(os.path.join(self.source, 'file1.jpg'), 10, 0, 1),
+            FileRecord(os.path.join(self.source, 'file2.txt'), 10, 0, 2),
+        ]
+        streamed = []
+        mock_process.side_effect = lambda images, destination: streamed.extend(images)
+        organizer = FileOrganizer(self.source, self.destination, self.extensions, estimate=True)
+
+        organizer.start()
+
+        mock_get_files.assert_not_called()
+        mock_do_you_want_to_continue.assert_called_once()
+        self.assertEqual([record.path for record in streamed], [os.path.join(self.source, 'file1.jpg')])
+
     @patch('src.organizer.FileOrganizer.get_files')
     @patch('src.organizer.logging.info')
     def test_start_with_no_files(self, mock_logging_info, mock_get_files):
-        mock_get_files.return_value = ([], [], [])
+        mock_get_files.return_value = ([], ScanSummary(self.extensions))
 
         self.organizer.start()
 
@@ -93,23 +161,67 @@ class FileOrganizerTest(unittest.TestCase):
 
     @patch('src.organizer.logging.info')
     def test_reporting_summary(self, mock_logging_info):
-        all_files = ['file1.txt', 'file2.mp3', 'file3.jpeg']
-        processed_files = ['file1.jpeg']
-        missing_files = ['file2.mp3', 'file3.docx']
+        summary = ScanSummary(self.extensions)
+        summary.add(FileRecord('file1.jpeg', 2048))
+        summary.add(FileRecord('file2.mp3', 100))
+        summary.add(FileRecord('file3.docx', 50))
 
-        self.organizer.reporting_summary(all_files, processed_files, missing_files)
+        self.organizer.reporting_summary(summary)
 
-        self.assertEqual(mock_logging_info.call_count, 10)
+        self.assertEqual(mock_logging_info.call_count, 14)
         calls = [
             unittest.mock.call(" "),
             unittest.mock.call("------------------------"),
             unittest.mock.call("  Files Report  "),
             unittest.mock.call("------------------------"),
             unittest.mock.call(" Extensions to be processed : %s ", self.extensions),
-            unittest.mock.call(" Files found : %s / %s ", len(processed_files), len(all_files)),
-            unittest.mock.call(" Missing files   : %s / %s", len(missing_files), len(all_files)),
-            unittest.mock.call(" Missed files have the following extensions: %s", {'.mp3', '.docx'}),
+            unittest.mock.call(" Files found : %s / %s (%s)", 1, 3, "2.0 KB"),
+            unittest.mock.call("   %-8s %10s files %12s", ".jpeg", 1, "2.0 KB"),
+            unittest.mock.call(" Missing files   : %s / %s (%s)", 2, 3, "150 B"),
+            unittest.mock.call("   %-8s %10s files %12s", ".mp3", 1, "100 B"),
+            unittest.mock.call("   %-8s %10s files %12s", ".docx", 1, "50 B"),
+            unittest.mock.call(" Pruned directories : %s", 0),
             unittest.mock.call(" ")
         ]
         mock_logging_info.assert_has_calls(calls, any_order=True)
 
+
+class FileOrganizerWin32Test(unittest.TestCase):
+
+    def setUp(self):
+        self.destination = os.path.abspath('tests/fixtures/destination/')
+        # comtypes is only there on Windows
+        self.mtp = Mock(get_sub_files=Mock(return_value=['Phone/DCIM/a.jpg', 'Phone/DCIM/b.txt']))
+        modules = patch.dict(sys.modules, {'src.mtp_windows': self.mtp})
+        modules.start()
+        self.addCleanup(modules.stop)
+
+    def test_files_come_from_the_device(self):
+        organizer = FileOrganizerWin32('Phone', self.destination, DEFAULT_EXTENSION)
+
+        files, summary = organizer.get_files(['Phone'], DEFAULT_EXTENSION)
+
+        self.mtp.get_sub_files.assert_called_once_with('Phone')
+        self.assertEqual(files, [FileRecord('Phone/DCIM/a.jpg')])
+        self.assertEqual((summary.matched_files, summary.total_files), (1, 2))
+
+    def test_options_not_used_with_devices_are_reported(self):
+        processing = ProcessingOptions(read_workers=4, with_model=False, modes=('hardlink',))
+
+        with self.assertLogs(level='WARNING') as logs:
+            organizer = FileOrganizerWin32('Phone', self.destination, DEFAULT_EXTENSION, processing=processing)
+
+        self.assertEqual(logs.output, ['WARNING:root:[-] Not used with MTP devices: read_workers, modes'])
+        self.assertFalse(organizer.file_process.with_model)
+        self.assertIsNone(organizer.file_process.pool)
+
+    @patch('src.organizer.FileProcessor.process')
+    def test_estimate_and_watch_are_refused(self, mock_process):
+        for option in ('estimate', 'watch'):
+            organizer = FileOrganizerWin32('Phone', self.destination, DEFAULT_EXTENSION, **{option: True})
+
+            with self.assertRaises(ValueError):
+                organizer.start()
+
+        mock_process.assert_not_called()
+        self.mtp.get_sub_files.assert_not_called()
@@ -0,0 +1,31 @@
+import unittest
+
+from src.patterns import PathMatcher
+
+
+class PathMatcherTest(unittest.TestCase):
+
+    def test_name_patterns_match_at_any_depth(self):
+        matcher = PathMatcher(['@eaDir/', '.Trash-*/', '*.tmp'])
+
+        self.assertTrue(matcher.is_excluded('@eaDir', True))
+        self.assertTrue(matcher.is_excluded('2021/summer/@eaDir', True))
+        self.assertFalse(matcher.is_excluded('@eaDir', False))  # directory only pattern
+        self.assertTrue(matcher.is_excluded('.Trash-1000', True))
+        self.assertTrue(matcher.is_excluded('a/b/file.tmp', False))
+
+    def test_anchored_patterns(self):
+        matcher = PathMatcher(['/backup/**/node_modules', 'docs/*.txt'])
+
+        self.assertTrue(matcher.is_excluded('backup/node_modules', True))
+        self.assertTrue(matcher.is_excluded('backup/a/b/node_modules', True))
+        self.assertFalse(matcher.is_excluded('other/backup/node_modules', True))
+        self.assertTrue(matcher.is_excluded('docs/a.txt', False))
+        self.assertFalse(matcher.is_excluded('docs/sub/a.txt', False))
+
+    def test_negation_last_match_wins(self):
+        matcher = PathMatcher(['*.tmp', '!keep.tmp', '# comment', ''])
+
+        self.assertTrue(matcher.is_excluded('drop.tmp', False))
+        self.assertFalse(matcher.is_excluded('x/keep.tmp', False))
+        self.assertEqual(len(matcher.rules), 2)
@@ -0,0 +1,205 @@
+import errno
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.placement import COPY, EXISTING, HARDLINK, MOVE, REFLINK, SYMLINK, FilePlacer, parse_modes
+
+
+class FilePlacerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, 'output')
+        os.mkdir(self.output)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content=b'picture'):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _target(self, name):
+        return os.path.join(self.output, name)
+
+    def test_copy(self):
+        source = self._write('a.jpg')
+
+        FilePlacer((COPY,)).place(source, self._target('a.jpg'))
+
+        self.assertTrue(os.path.isfile(source))
+        self.assertTrue(os.path.isfile(self._target('a.jpg')))
+
+    def test_move_on_the_same_device(self):
+        source = self._write('a.jpg')
+        placer = FilePlacer((MOVE,))
+
+        self.assertEqual(placer.place(source, self._target('a.jpg'), os.stat(source).st_dev), MOVE)
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(placer.renamed, 1)
+
+    def test_move_across_devices(self):
+        sources = [self._write(name) for name in ('a.jpg', 'b.jpg', 'c.jpg')]
+        placer = FilePlacer((MOVE,))
+
+        with patch('src.placement.DELETE_BATCH', 2), \
+                patch('os.rename', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            self.assertEqual(placer.place(sources[0], self._target('a.jpg')), MOVE)
+            # Deleted once their copies are synced, in batches
+            self.assertTrue(os.path.isfile(sources[0]))
+            placer.place(sources[1], self._target('b.jpg'))
+            self.assertFalse(os.path.exists(sources[0]) or os.path.exists(sources[1]))
+            placer.place(sources[2], self._target('c.jpg'))
+            placer.flush()
+
+        self.assertFalse(os.path.exists(sources[2]))
+        self.assertEqual((placer.renamed, placer.deleted), (0, 3))
+        with open(self._target('c.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'picture')
+
+    def test_move_keeps_the_source_of_a_bad_copy(self):
+        source = self._write('a.jpg')
+        placer = FilePlacer((MOVE,))
+
+        with patch('src.placement.same_content', return_value=False):
+            self.assertRaises(OSError, placer.place, source, self._target('a.jpg'), os.stat(self.output).st_dev + 1)
+        placer.flush()
+
+        self.assertTrue(os.path.isfile(source))
+        self.assertFalse(os.path.exists(self._target('a.jpg')))
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, FilePlacer, ('teleport',))
+        self.assertRaises(ValueError, parse_modes, 'hardlink,teleport')
+        self.assertEqual(parse_modes('Hardlink, symlink'), (HARDLINK, SYMLINK))
+
+    def test_hardlink(self):
+        source = self._write('a.jpg')
+        placer = FilePlacer((HARDLINK, COPY))
+
+        self.assertEqual(placer.place(source, self._target('a.jpg'), os.stat(source).st_dev), HARDLINK)
+        self.assertTrue(os.path.samefile(source, self._target('a.jpg')))
+        # What is at the target is never replaced
+        self.assertRaises(FileExistsError, placer.place, source, self._target('a.jpg'), os.stat(source).st_dev)
+
+    def test_links_never_replace_a_file(self):
+        source = self._write('a.jpg')
+        other = self._target('a.jpg')
+
+        lstat = os.lstat
+
+        def written_meanwhile(path):
+            # Another program writes the target between the check and the link
+            if path == other and not os.path.exists(other):
+                with open(other, 'wb') as f:
+                    f.write(b'another picture')
+                raise FileNotFoundError(path)
+            return lstat(path)
+
+        placer = FilePlacer((SYMLINK, COPY))
+        with patch('os.lstat', side_effect=written_meanwhile):
+            target, mode = placer.place_unique(source, other)
+
+        self.assertEqual((target, mode), (self._target('a_1.jpg'), SYMLINK))
+        with open(other, 'rb') as f:
+            self.assertEqual(f.read(), b'another picture')
+
+    def test_symlinks(self):
+        source = self._write('a.jpg')
+
+        FilePlacer((SYMLINK,)).place(source, self._target('a.jpg'))
+        FilePlacer((SYMLINK,), relative_symlinks=True).place(source, self._target('b.jpg'))
+
+        self.assertEqual(os.readlink(self._target('a.jpg')), os.path.abspath(source))
+        self.assertEqual(os.readlink(self._target('b.jpg')), os.path.join('..', 'a.jpg'))
+        self.assertTrue(os.path.samefile(source, self._target('b.jpg')))
+
+    def test_fallback_chain(self):
+        sources = [self._write(name) for name in ('a.jpg', 'b.jpg')]
+        placer = FilePlacer((REFLINK, HARDLINK, COPY))
+        other_device = os.stat(self.output).st_dev + 1
+
+        with patch('src.copier.CopyEngine.clone', side_effect=OSError(errno.EOPNOTSUPP, 'Not supported')) as clone:
+            self.assertEqual(placer.place(sources[0], self._target('a.jpg'), other_device), COPY)
+            self.assertEqual(placer.place(sources[1], self._target('b.jpg'), other_device), COPY)
+
+        # Refused between the two devices, reflinks and hard links are not tried again
+        self.assertEqual(clone.call_count, 1)
+        self.assertEqual(dict(placer.placed), {COPY: 2})
+        self.assertFalse(os.path.samefile(sources[0], self._target('a.jpg')))
+
+    def test_place_unique_skips_the_files_already_there(self):
+        source = self._write('a.jpg')
+        placer = FilePlacer((COPY,))
+
+        self.assertEqual(placer.place_unique(source, self._target('a.jpg')), (self._target('a.jpg'), COPY))
+        with patch('src.copier.CopyEngine.copy') as mock_copy:
+            self.assertEqual(placer.place_unique(source, self._target('a.jpg')), (self._target('a.jpg'), EXISTING))
+
+        mock_copy.assert_not_called()
+        self.assertEqual(placer.existing, 1)
+
+    def test_place_unique_suffixes_other_files(self):
+        first, second = self._write('a.jpg', b'first'), self._write('b.jpg', b'second')
+        placer = FilePlacer((COPY,))
+        placer.place_unique(first, self._target('a.jpg'))
+
+        self.assertEqual(placer.place_unique(second, self._target('a.jpg')), (self._target('a_1.jpg'), COPY))
+        # A rerun finds it under its suffixed name
+        self.assertEqual(placer.place_unique(second, self._target('a.jpg')), (self._target('a_1.jpg'), EXISTING))
+        with open(self._target('a.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'first')
+        self.assertEqual(placer.suffixed, 1)
+
+    def test_compare_content(self):
+        source = self._write('a.jpg', b'first')
+        with open(self._target('a.jpg'), 'wb') as f:
+            f.write(b'other')
+        os.utime(self._target('a.jpg'), ns=(os.stat(source).st_atime_ns, os.stat(source).st_mtime_ns))
+
+        # Same size and time, the content tells them apart
+        self.assertEqual(FilePlacer((COPY,)).resolve(source, self._target('a.jpg')), (self._target('a.jpg'), True))
+        self.assertEqual(FilePlacer((COPY,), compare_content=True).resolve(source, self._target('a.jpg')),
+                         (self._target('a_1.jpg'), False))
+
+    def test_files_of_earlier_copies_without_their_time(self):
+        source = self._write('a.jpg', b'first')
+        other = self._write('b.jpg', b'other')
+        for name in ('a.jpg', 'b.jpg'):
+            with open(self._target(name), 'wb') as f:
+                f.write(b'first')
+            os.utime(self._target(name), (1609502400, 1609502400))
+        placer = FilePlacer((COPY,))
+
+        self.assertEqual(placer.resolve(source, self._target('a.jpg')), (self._target('a.jpg'), True))
+        self.assertEqual(placer.resolve(other, self._target('b.jpg')), (self._target('b_1.jpg'), False))
+
+    def test_move_of_a_file_already_there(self):
+        source = self._write('a.jpg')
+        FilePlacer((COPY,)).place(source, self._target('a.jpg'))
+        placer = FilePlacer((MOVE,))
+
+        self.assertEqual(placer.place_unique(source, self._target('a.jpg'))[1], EXISTING)
+        placer.flush()
+
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(placer.deleted, 1)
+
+    def test_rerun_after_an_interrupted_copy(self):
+        source = self._write('IMG.jpg', os.urandom(3 * 1024 ** 2))
+        with patch('src.copier.CopyEngine._copy', side_effect=KeyboardInterrupt), \
+                self.assertRaises(KeyboardInterrupt):
+            FilePlacer((COPY,)).place_unique(source, self._target('IMG.jpg'))
+        self.assertEqual(os.listdir(self.output), [])
+
+        placer = FilePlacer((COPY,))
+        self.assertEqual(placer.place_unique(source, self._target('IMG.jpg')), (self._target('IMG.jpg'), COPY))
+
+        self.assertEqual(os.listdir(self.output), ['IMG.jpg'])
+        with open(source, 'rb') as a, open(self._target('IMG.jpg'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        self.assertEqual(placer.suffixed, 0)
@@ -1,20 +1,40 @@
 import os
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch, PropertyMock, Mock
 
-from src.process import FileProcessor
+from src.index import IndexEntry, MetadataIndex
+from src.process import FileProcessor, ProcessingOptions
+from src.record import FileRecord
+from src import validation
+from src.validation import Validator
 
 
 class ProcessTest(unittest.TestCase):
     def setUp(self):
         self.processor = FileProcessor()
         self.image_list = [
-            os.path.abspath(
+            FileRecord(os.path.abspath(
                 "tests/fixtures/test/església st pere de rubí 150301_2014.jpg"
-            )
+            ))
         ]
         self.destination = os.path.abspath("tests/fixtures/output/")
 
+    @staticmethod
+    def _make_images(directory, names, content=b"not an image"):
+        # Files dated 2021-01-01, a name can come with its own content as a (name, content) pair
+        images = []
+        for name in names:
+            name, data = name if isinstance(name, tuple) else (name, content)
+            path = os.path.join(directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            os.utime(path, (1609502400, 1609502400))
+            images.append(FileRecord.from_path(path))
+        return images
+
     @patch("os.path.isdir")
     @patch("os.mkdir")
     def test_create_destination(self, mock_mkdir, mock_isdir):
@@ -34,9 +54,24 @@ class ProcessTest(unittest.TestCase):
     def test_modification_date(self, mock_get_exif, mock_get_data):
         mock_get_exif.return_value = Mock()
         mock_get_data.return_value = "Canon 60D"
+        record = FileRecord("image.jpg", mtime_ns=1609459200 * 10 ** 9)  # Jan 1, 2021
+        date, model = self.processor.modification_date(record)
+        self.assertEqual(date, "2021-01-01")
+        self.assertEqual(record.date, "2021-01-01")
+
+    @patch("src.process.FileProcessor.get_exif")
+    def test_modification_date_from_capture_time(self, mock_get_exif):
+        mock_get_exif.return_value = {0x0110: "Canon EOS 60D", 0x9003: "2019:07:14 18:30:05"}
+        record = FileRecord("image.jpg", mtime_ns=1609502400 * 10 ** 9)
+
+        self.assertEqual(self.processor.modification_date(record), ("2019-07-14", "canoneos60d"))
+
+    @patch("src.process.FileProcessor.get_exif")
+    def test_modification_date_without_stat(self, mock_get_exif):
+        mock_get_exif.return_value = None
         with patch("os.path.getmtime") as mock_getmtime:
             mock_getmtime.return_value = 1609459200  # Jan 1, 2021
-            date, model = self.processor.modification_date("image.jpg")
+            date, model = self.processor.modification_date(FileRecord("image.jpg"))
             self.assertEqual(date, "2021-01-01")
 
     @patch("src.process.FileProcessor.process_in_parallel")
@@ -49,3 +84,188 @@ class ProcessTest(unittest.TestCase):
                     mock_create_dest.assert_called_with(self.destination)
                     mock_create_dirs.assert_called_with({("2021-01-01", "model")}, self.destination)
                     mock_process_in_parallel.assert_called_with(self.image_list, self.destination)
+
+    @patch("src.process.FileProcessor._modify_date")
+    def test_modification_date_from_index(self, mock_modify_date):
+        index = Mock()
+        index.lookup.return_value = IndexEntry("2020-05-04", "canon60d", None)
+        processor = FileProcessor(index=index)
+
+        record = FileRecord("image.jpg", 10, 1, 2)
+        date, model = processor.modification_date(record)
+
+        self.assertEqual((date, model), ("2020-05-04", "canon60d"))
+        self.assertEqual(record.model, "canon60d")
+        index.lookup.assert_called_once_with(record)
+        mock_modify_date.assert_not_called()
+        index.store.assert_not_called()
+
+    @patch("src.process.FileProcessor.get_exif")
+    def test_index_keeps_the_model_of_runs_without_it(self, mock_get_exif):
+        mock_get_exif.return_value = {0x0110: "Canon EOS 60D"}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._make_images(tmp, ["a.jpg"])[0].path
+
+            for with_model, model in ((False, None), (True, "canoneos60d")):
+                index = MetadataIndex(os.path.join(tmp, "index.sqlite"))
+                processor = FileProcessor(ProcessingOptions(with_model=with_model), index)
+                self.assertEqual(processor.modification_date(FileRecord.from_path(path)), ("2021-01-01", model))
+                index.close()
+
+            # The second run found the model in the index
+            self.assertEqual(mock_get_exif.call_count, 1)
+
+    @patch("src.process.FileProcessor._copy_file")
+    @patch("src.process.FileProcessor.modification_date")
+    @patch("os.makedirs")
+    def test_process_file(self, mock_makedirs, mock_modification_date, mock_copy_file):
+        mock_modification_date.return_value = ("2021-01-01", "canon60d")
+        destination = self.destination + os.path.sep
+
+        record = FileRecord("image.jpg")
+        self.processor.process_file(record, destination)
+
+        expected = destination + "2021-01-01" + os.path.sep + "canon60d" + os.path.sep
+        mock_makedirs.assert_called_once_with(expected, exist_ok=True)
+        mock_copy_file.assert_called_once_with(record, expected)
+
+    def test_process_reads_metadata_once_per_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(os.path.join(tmp, "source"), ("a.jpg", "b.jpg", "c.png"))
+            destination = os.path.join(tmp, "output") + os.path.sep
+
+            with patch("src.process.FileProcessor._modify_date", autospec=True,
+                       side_effect=FileProcessor._modify_date) as mock_modify_date:
+                self.processor.process(images, destination)
+
+            self.assertEqual(mock_modify_date.call_count, 3)
+            self.assertEqual(self.processor.metadata_reads, 3)
+            for image in images:
+                self.assertTrue(os.path.isfile(image.destination + image.name))
+
+    def test_process_with_read_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(tmp, ("a.jpg", "b.jpg", "c.png"))
+            processor = FileProcessor(ProcessingOptions(read_workers=2))
+            processor.pool.batch_size = 2
+
+            processor.process(images, os.path.join(tmp, "output") + os.path.sep)
+
+            self.assertEqual(processor.metadata_reads, 3)
+            self.assertEqual([image.date for image in images], ["2021-01-01"] * 3)
+            self.assertTrue(os.path.isfile(os.path.join(tmp, "output", "2021-01-01", "a.jpg")))
+
+    @patch("src.process.FileProcessor.get_exif")
+    def test_modification_date_from_file_name(self, mock_get_exif):
+        mock_get_exif.return_value = {0x0110: "Canon EOS 60D"}
+        record = FileRecord("IMG_20230114_153012.jpg", mtime_ns=1609459200 * 10 ** 9)
+
+        # The model is wanted, the file is read and its name only replaces the missing capture time
+        self.assertEqual(self.processor.modification_date(record), ("2023-01-14", "canoneos60d"))
+        self.assertEqual(self.processor.metadata_reads, 1)
+
+        processor = FileProcessor(ProcessingOptions(with_model=False))
+        self.assertEqual(processor.modification_date(FileRecord("IMG_20230114_153012.jpg")), ("2023-01-14", None))
+        self.assertEqual(processor.metadata_reads, 0)
+        self.assertEqual(processor.date_sources, {"file name": 1})
+
+    def test_file_names_are_not_sent_to_read_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = [FileRecord(image.path) for image in self._make_images(tmp, ("IMG_20230114_153012.jpg", "b.jpg"))]
+            processor = FileProcessor(ProcessingOptions(read_workers=1, with_model=False))
+
+            processor.process(images, os.path.join(tmp, "output") + os.path.sep)
+
+            self.assertEqual([image.date for image in images], ["2023-01-14", "2021-01-01"])
+            self.assertEqual(processor.date_sources, {"file name": 1, "modification time": 1})
+            self.assertEqual(processor.metadata_reads, 1)
+
+    def test_process_quarantines_corrupted_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(tmp, ("a.jpg", ("b.jpg", b"\xff\xd8\xff\xe0\x00\x10JFIF")))
+            output = os.path.join(tmp, "output") + os.path.sep
+            processor = FileProcessor(validator=Validator(os.path.join(output, "quarantine")))
+
+            processor.process(images, output)
+
+            self.assertTrue(os.path.isfile(os.path.join(output, "2021-01-01", "a.jpg")))
+            self.assertTrue(os.path.isfile(os.path.join(output, "quarantine", "b.jpg")))
+            self.assertFalse(os.path.exists(os.path.join(output, "2021-01-01", "b.jpg")))
+            self.assertEqual(processor.metadata_reads, 1)
+
+    def test_stalled_files_go_to_the_retry_list(self):
+        release = threading.Event()
+        copy_file = FileProcessor._copy_file
+
+        def stalled_copy(processor, image, destination):
+            if image.name == "b.jpg":
+                release.wait()
+            copy_file(processor, image, destination)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(tmp, ("a.jpg", "b.jpg", "c.jpg"))
+            output = os.path.join(tmp, "output") + os.path.sep
+            processor = FileProcessor(ProcessingOptions(file_timeout=0.2))
+            # The stalled copy ends after the test, in a directory already removed
+            self.addCleanup(release.set)
+
+            with patch("src.process.FileProcessor._copy_file", autospec=True, side_effect=stalled_copy):
+                processor.process(images, output)
+
+            self.assertTrue(os.path.isfile(os.path.join(output, "2021-01-01", "a.jpg")))
+            self.assertTrue(os.path.isfile(os.path.join(output, "2021-01-01", "c.jpg")))
+            with open(os.path.join(output, "retry.txt")) as retry_list:
+                self.assertEqual(retry_list.read(), images[1].path + "\n")
+
+    def test_duplicates_are_linked_to_the_organized_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(tmp, ("a.jpg", "b/a.jpg", "c.jpg", ("d.jpg", b"another")), b"picture")
+            output = os.path.join(tmp, "output") + os.path.sep
+            processor = FileProcessor(ProcessingOptions(duplicates="link"))
+
+            with patch("src.process.FileProcessor._copy_file", autospec=True,
+                       side_effect=FileProcessor._copy_file) as mock_copy_file:
+                processor.process(images, output)
+
+            # b/a.jpg has the name and the content of a.jpg, there is nothing to link
+            self.assertEqual(mock_copy_file.call_count, 2)
+            self.assertTrue(os.path.samefile(os.path.join(output, "2021-01-01", "a.jpg"),
+                                             os.path.join(output, "2021-01-01", "c.jpg")))
+            self.assertEqual((processor.deduplicator.duplicates, processor.deduplicator.saved), (2, 14))
+
+    def test_rerun_skips_the_files_already_organized(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(tmp, (("a.jpg", b"a.jpg"), ("b/a.jpg", b"b/a.jpg")))
+            output = os.path.join(tmp, "output") + os.path.sep
+            self.processor.process(images, output)
+
+            processor = FileProcessor()
+            with patch("src.copier.CopyEngine.copy") as mock_copy:
+                processor.process([FileRecord.from_path(image.path) for image in images], output)
+
+            mock_copy.assert_not_called()
+            self.assertEqual(processor.placer.existing, 2)
+            self.assertEqual(sorted(os.listdir(os.path.join(output, "2021-01-01"))), ["a.jpg", "a_1.jpg"])
+
+    def test_stalled_structural_checks_go_to_the_retry_list(self):
+        release = threading.Event()
+        check_structure = validation.check_structure
+
+        def stalled_check(path):
+            if path.endswith("b.jpg"):
+                release.wait()
+            return check_structure(path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            images = self._make_images(tmp, ("a.jpg", "b.jpg"))
+            output = os.path.join(tmp, "output") + os.path.sep
+            processor = FileProcessor(validator=Validator(os.path.join(output, "quarantine"), file_timeout=0.2))
+            self.addCleanup(release.set)
+
+            with patch("src.validation.check_structure", side_effect=stalled_check):
+                processor.process(images, output)
+
+            self.assertTrue(os.path.isfile(os.path.join(output, "2021-01-01", "a.jpg")))
+            self.assertFalse(os.path.exists(os.path.join(output, "2021-01-01", "b.jpg")))
+            with open(os.path.join(output, "retry.txt")) as retry_list:
+                self.assertEqual(retry_list.read(), images[1].path + "\n")
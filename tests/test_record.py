@@ -0,0 +1,31 @@
+import os
+import tempfile
+import unittest
+
+from src.record import FileRecord
+
+
+class FileRecordTest(unittest.TestCase):
+
+    def test_from_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'IMG_0001.JPG')
+            with open(path, 'wb') as f:
+                f.write(b'12345')
+            stat = os.stat(path)
+
+            record = FileRecord.from_path(path)
+
+        self.assertEqual((record.size, record.mtime_ns, record.inode, record.device),
+                         (5, stat.st_mtime_ns, stat.st_ino, stat.st_dev))
+        self.assertEqual(record.name, 'IMG_0001.JPG')
+        self.assertEqual(record.extension, '.jpg')
+        self.assertIsNone(record.date)
+
+    def test_is_compact(self):
+        record = FileRecord('/photos/a.jpg', 10, 10 ** 9)
+
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(record.mtime, 1.0)
+        self.assertIsNone(FileRecord('/photos/a.jpg').mtime)
+        self.assertEqual(record, FileRecord('/photos/a.jpg'))
@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.scanner import Scanner, remove_nested
+
+
+class ScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        os.makedirs(os.path.join(self.root, 'a', 'b'))
+        os.makedirs(os.path.join(self.root, 'c'))
+        os.makedirs(os.path.join(self.root, 'a', '@eaDir'))
+        os.makedirs(os.path.join(self.root, '.thumbnails'))
+        self._touch('IMG_0001.JPG', b'12345')
+        self._touch(os.path.join('a', 'photo.jpg'), b'123')
+        self._touch(os.path.join('a', 'b', 'clip.MOV'), b'1')
+        self._touch(os.path.join('c', 'notes.txt'), b'')
+        self._touch(os.path.join('a', '@eaDir', 'thumb.jpg'), b'1')
+        self._touch(os.path.join('.thumbnails', 'thumb.png'), b'1')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _touch(self, name, content):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(content)
+
+    def _scan(self, scanner):
+        return sorted(os.path.relpath(entry.path, self.root) for entry in scanner.scan(self.root))
+
+    def test_scan_finds_all_files(self):
+        paths = self._scan(Scanner(workers=4))
+
+        self.assertEqual(paths, sorted([
+            'IMG_0001.JPG',
+            os.path.join('a', 'photo.jpg'),
+            os.path.join('a', 'b', 'clip.MOV'),
+            os.path.join('a', '@eaDir', 'thumb.jpg'),
+            os.path.join('c', 'notes.txt'),
+            os.path.join('.thumbnails', 'thumb.png'),
+        ]))
+
+    def test_scan_keeps_stat_information(self):
+        entries = {os.path.basename(entry.path): entry for entry in Scanner(workers=1).scan(self.root)}
+
+        stat = os.stat(os.path.join(self.root, 'IMG_0001.JPG'))
+        entry = entries['IMG_0001.JPG']
+        self.assertEqual(entry.size, 5)
+        self.assertEqual(entry.mtime_ns, stat.st_mtime_ns)
+        self.assertEqual(entry.inode, stat.st_ino)
+        self.assertEqual(entry.device, stat.st_dev)
+        self.assertEqual(entry.extension, '.jpg')
+
+    def test_scan_is_a_generator(self):
+        iterator = Scanner().scan(self.root)
+
+        first = next(iterator)
+        iterator.close()
+
+        self.assertTrue(os.path.isfile(first.path))
+
+    def test_scan_missing_directory(self):
+        entries = list(Scanner().scan(os.path.join(self.root, 'missing')))
+
+        self.assertEqual(entries, [])
+
+    def test_scan_excludes_directories(self):
+        scanner = Scanner(excludes=['@eaDir/', '.thumbnails/', '*.txt'])
+
+        paths = self._scan(scanner)
+
+        self.assertEqual(paths, sorted([
+            'IMG_0001.JPG',
+            os.path.join('a', 'photo.jpg'),
+            os.path.join('a', 'b', 'clip.MOV'),
+        ]))
+        self.assertEqual(scanner.pruned_directories, 2)
+
+    def test_scan_includes_override_excludes(self):
+        paths = self._scan(Scanner(excludes=['*.txt', '@eaDir/'], includes=['notes.txt'], skip_hidden=True))
+
+        self.assertIn(os.path.join('c', 'notes.txt'), paths)
+        self.assertNotIn(os.path.join('a', '@eaDir', 'thumb.jpg'), paths)
+        self.assertNotIn(os.path.join('.thumbnails', 'thumb.png'), paths)
+
+    def test_scan_max_depth(self):
+        scanner = Scanner(max_depth=1)
+
+        paths = self._scan(scanner)
+
+        self.assertIn(os.path.join('a', 'photo.jpg'), paths)
+        self.assertNotIn(os.path.join('a', 'b', 'clip.MOV'), paths)
+        self.assertEqual(scanner.pruned_directories, 2)
+
+    def test_scan_skips_paths(self):
+        paths = self._scan(Scanner(skip_paths=[os.path.join(self.root, 'a')]))
+
+        self.assertFalse(any(path.startswith('a' + os.path.sep) for path in paths))
+
+    def test_remove_nested(self):
+        a = os.path.join(self.root, 'a')
+        roots = remove_nested([a, self.root, os.path.join(self.root, 'c'), self.root + os.path.sep])
+
+        self.assertEqual(roots, [self.root])
+        self.assertEqual(remove_nested([a, os.path.join(self.root, 'ab')]), [a, os.path.join(self.root, 'ab')])
+
+    def test_scan_many_single_device(self):
+        scanner = Scanner(excludes=['@eaDir/'])
+
+        entries = list(scanner.scan_many([os.path.join(self.root, 'a'), os.path.join(self.root, 'c')]))
+
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(scanner.pruned_directories, 1)
+
+    @patch('src.scanner.group_by_device')
+    def test_scan_many_devices_in_parallel(self, mock_group_by_device):
+        mock_group_by_device.return_value = {
+            1: [os.path.join(self.root, 'a')],
+            2: [os.path.join(self.root, 'c'), os.path.join(self.root, '.thumbnails')],
+        }
+        scanner = Scanner(excludes=['@eaDir/'])
+
+        paths = sorted(os.path.relpath(entry.path, self.root) for entry in scanner.scan_many([self.root]))
+
+        self.assertEqual(paths, sorted([
+            os.path.join('a', 'photo.jpg'),
+            os.path.join('a', 'b', 'clip.MOV'),
+            os.path.join('c', 'notes.txt'),
+            os.path.join('.thumbnails', 'thumb.png'),
+        ]))
+        self.assertEqual(scanner.pruned_directories, 1)
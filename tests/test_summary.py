@@ -0,0 +1,24 @@
+import unittest
+
+from src.record import FileRecord
+from src.summary import ScanSummary
+
+
+class ScanSummaryTest(unittest.TestCase):
+
+    def test_add_classifies_by_extension(self):
+        summary = ScanSummary(('.jpg', '.mov'))
+
+        self.assertTrue(summary.add(FileRecord('/photos/IMG_0001.JPG', 100)))
+        self.assertTrue(summary.add(FileRecord('/photos/IMG_0002.jpg', 50)))
+        self.assertTrue(summary.add(FileRecord('/photos/clip.mov', 1000)))
+        self.assertFalse(summary.add(FileRecord('/photos/notes.txt', 5)))
+        self.assertFalse(summary.add(FileRecord('/photos/README', 1)))
+
+        self.assertEqual(summary.matched['.jpg'].files, 2)
+        self.assertEqual(summary.matched['.jpg'].size, 150)
+        self.assertEqual(set(summary.unmatched), {'.txt', ''})
+        self.assertEqual(summary.total_files, 5)
+        self.assertEqual(summary.matched_files, 3)
+        self.assertEqual(summary.matched_size, 1150)
+        self.assertEqual(summary.unmatched_size, 6)
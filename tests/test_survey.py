@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.record import FileRecord
+from src.scanner import Scanner
+from src.survey import Survey, survey
+
+
+class SurveyTest(unittest.TestCase):
+
+    def test_add_builds_histograms(self):
+        result = Survey(('.jpg',), top=1)
+        result.add(FileRecord('/photos/2020/a.jpg', 2 * 1024 ** 2, 1577880000 * 10 ** 9, 1))
+        result.add(FileRecord('/photos/2020/b.jpg', 3 * 1024 ** 2, 1577880000 * 10 ** 9, 2))
+        result.add(FileRecord('/photos/notes.txt', 10, 1609502400 * 10 ** 9, 3))
+
+        data = result.to_dict(elapsed=1.0, files_per_second=1, throughput=1024 ** 2)
+
+        self.assertEqual(data['files'], 3)
+        self.assertEqual(data['matched_files'], 2)
+        self.assertEqual(data['matched_bytes'], 5 * 1024 ** 2)
+        self.assertEqual(data['extensions']['.jpg'], {'files': 2, 'bytes': 5 * 1024 ** 2, 'matched': True})
+        self.assertFalse(data['extensions']['.txt']['matched'])
+        self.assertEqual(sum(bucket['files'] for bucket in data['size_histogram']), 3)
+        self.assertEqual(data['size_histogram'][0], {'range': '< 1.0 KB', 'files': 1, 'bytes': 10})
+        self.assertEqual(data['directories']['with_files'], 2)
+        self.assertEqual(data['directories']['largest'], [{'path': '/photos/2020', 'files': 2, 'bytes': 5 * 1024 ** 2}])
+        self.assertEqual(data['mtime']['years']['2020'], 2)
+        self.assertEqual(data['estimate']['seconds'], 7)  # 2 files at 1 file/s + 5 MB at 1 MB/s
+
+    def test_survey_is_json_serializable(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'a.jpg'), 'wb') as f:
+                f.write(b'123')
+
+            data = survey(Scanner(), tmp, ('.jpg',))
+
+        self.assertEqual(json.loads(json.dumps(data))['matched_bytes'], 3)
@@ -0,0 +1,102 @@
+import glob
+import io
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from src.record import FileRecord
+from src.validation import Validator, check_structure
+from tests.test_exif import jpeg, tiff
+from tests.test_media import box, heic, mp4
+
+
+class ValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.quarantine = os.path.join(self.tmp.name, 'quarantine')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_sound_files(self):
+        self.assertIsNone(check_structure(self._write('image.jpg', jpeg(tiff()))))
+        self.assertIsNone(check_structure(self._write('padded.jpg', jpeg(tiff()) + b'\x00' * 10)))
+        self.assertIsNone(check_structure(self._write('trailer.jpg', jpeg(tiff()) + b'Image_UTC_Data1571058862000SEFH'
+                                                      + b'\x01' * 64 + b'SEFT')))
+        self.assertIsNone(check_structure(self._write('samsung.jpg', jpeg(tiff()) + b'\x01' * 8192 + b'SEFT')))
+        self.assertIsNone(check_structure(self._write('clip.mp4', mp4(3650000000))))
+        self.assertIsNone(check_structure(self._write('image.heic', heic(tiff()))))
+        self.assertIsNone(check_structure(self._write('other.png', b'\x89PNG\r\n\x1a\n')))
+        for path in glob.glob(os.path.join('tests', 'fixtures', 'test', '*.JPG')):
+            self.assertIsNone(check_structure(path))
+
+    def test_corrupted_jpeg(self):
+        image = jpeg(tiff())
+        broken_segment = image[:20] + b'\xff\xe1\xff\xff' + image[24:]
+
+        self.assertEqual(check_structure(self._write('empty.jpg', b'')), 'empty file')
+        self.assertEqual(check_structure(self._write('cut.jpg', image[:-20])), 'truncated image data (no EOI marker)')
+        self.assertEqual(check_structure(self._write('header.jpg', image[:30])), 'invalid segment length at offset 20')
+        self.assertIn('segment', check_structure(self._write('segment.jpg', broken_segment)))
+
+    def test_motion_photo(self):
+        xmp = b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta GCamera:MotionPhoto="1"/>'
+        image = jpeg(tiff())
+        app1 = b'\xff\xe1' + len(xmp + b'xx').to_bytes(2, 'big') + xmp
+
+        self.assertIsNone(check_structure(self._write('motion.jpg', image[:2] + app1 + image[2:] + mp4(3650000000))))
+
+    def test_fragmented_mp4(self):
+        # One moof and one mdat box per fragment, far more than the boxes a metadata lookup reads
+        fragments = (box(b'moof', b'\x00' * 8) + box(b'mdat', b'\x00' * 16)) * 600
+
+        self.assertIsNone(check_structure(self._write('fragmented.mp4', mp4(3650000000) + fragments)))
+        self.assertEqual(check_structure(self._write('cut.mp4', mp4(3650000000) + fragments[:-4])),
+                         'mdat box past the end of the file')
+
+    def test_corrupted_iso_bmff(self):
+        video = mp4(3650000000)
+
+        self.assertEqual(check_structure(self._write('cut.mp4', video[:-10])), 'moov box past the end of the file')
+        self.assertEqual(check_structure(self._write('moov.mp4', box(b'ftyp', b'isom') + box(b'mdat', b'\x00'))),
+                         'no moov box')
+        self.assertEqual(check_structure(self._write('cut.heic', heic(tiff())[:-4])), 'mdat box past the end of the file')
+
+    def test_quarantine_and_report(self):
+        sound = FileRecord(self._write('a.jpg', jpeg(tiff())))
+        broken = FileRecord(self._write('b.jpg', jpeg(tiff())[:-20]))
+        rejected = []
+        validator = Validator(self.quarantine)
+
+        self.assertEqual(list(validator.screen([sound, broken], rejected.append)), [sound])
+        self.assertEqual(rejected, [broken])
+        self.assertEqual(broken.destination, self.quarantine + os.path.sep)
+        self.assertIsNone(sound.destination)
+        with open(validator.report) as report:
+            self.assertEqual(report.read(), '%s\ttruncated image data (no EOI marker)\n' % broken.path)
+
+    def test_deep_verify(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (256, 256), 'red').save(buffer, 'PNG')
+        sound = FileRecord(self._write('a.png', buffer.getvalue()))
+        # A bit flipped in the image data, the structural checks do not see it
+        data = bytearray(buffer.getvalue())
+        data[-20] ^= 0xFF
+        broken = FileRecord(self._write('b.png', bytes(data)))
+        video = FileRecord(self._write('c.mp4', mp4(3650000000)))
+        validator = Validator(self.quarantine, deep_workers=1)
+        try:
+            self.assertIsNone(check_structure(broken.path))
+            self.assertEqual(list(validator.screen([sound, broken, video])), [sound, video])
+            self.assertEqual(validator.quarantined, 1)
+        finally:
+            validator.close()
@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from src.scanner import Scanner
+from src.watcher import IN_Q_OVERFLOW, MTIME_MARGIN, PendingFiles, PollingWatcher, InotifyWatcher, Watcher
+
+
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self._write('existing.jpg', b'1')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content, mode='wb'):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode) as f:
+            f.write(content)
+        return path
+
+    def test_pending_file_waits_until_stable(self):
+        path = self._write('growing.jpg', b'1')
+        pending = PendingFiles(settle=2)
+        pending.touch(path, now=0)
+
+        self.assertEqual(pending.ready(now=1), [])
+        self._write('growing.jpg', b'2', mode='ab')
+        self.assertEqual(pending.ready(now=2.5), [])  # size changed, the timer restarts
+        self.assertEqual(pending.ready(now=4.5), [path])
+        self.assertEqual(len(pending), 0)
+
+    def test_polling_watcher_finds_new_files(self):
+        watcher = PollingWatcher(self.root, Scanner(excludes=['@eaDir/']), settle=0, interval=0)
+        new_file = self._write(os.path.join('2024', 'IMG_0001.JPG'), b'123')
+        self._write(os.path.join('@eaDir', 'thumb.jpg'), b'1')
+
+        self.assertEqual(watcher.step(timeout=0), [new_file])
+        self.assertEqual(watcher.step(timeout=0), [])
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is only available on linux')
+    def test_inotify_watcher_finds_closed_files(self):
+        watcher = InotifyWatcher(self.root, Scanner(), settle=0)
+        try:
+            new_file = self._write(os.path.join('2024', 'IMG_0001.JPG'), b'123')
+            other_file = self._write('clip.mov', b'1')
+
+            ready = []
+            for _ in range(10):
+                ready += watcher.step(timeout=0.1)
+
+            self.assertEqual(sorted(ready), sorted([new_file, other_file]))
+        finally:
+            watcher.close()
+
+    def test_watcher_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Watcher(self.root, Scanner())
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is only available on linux')
+    def test_queue_overflow_only_lists_the_newer_files(self):
+        past = time.time() - 3600
+        os.utime(os.path.join(self.root, 'existing.jpg'), (past, past))
+        watcher = InotifyWatcher(self.root, Scanner(), settle=0)
+        try:
+            new_file = self._write(os.path.join('2024', 'IMG_0001.JPG'), b'123')
+            for _ in range(5):
+                watcher.step(timeout=0.1)
+            # Handled before the overflow
+            os.utime(new_file, (time.time() - 2 * MTIME_MARGIN,) * 2)
+            lost_file = self._write(os.path.join('2024', 'IMG_0002.JPG'), b'123')
+
+            watcher._handle_event(-1, IN_Q_OVERFLOW, '')
+
+            self.assertEqual(list(watcher.pending.files), [lost_file])
+        finally:
+            watcher.close()